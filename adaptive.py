@@ -0,0 +1,202 @@
+"""
+adaptive sampling of the traced (inner-most) axis of a sweep: start from a coarse grid and add points only where the
+output changes sharply.
+"""
+
+import numpy as np
+
+from executors import get_executor, run_points
+from result_buffer import ResultBuffer
+from sweep_grid import SweepGrid
+
+
+def default_signal(output_config):
+    """
+    the values used to decide where to refine: all the numeric outputs of a point, flattened and concatenated
+    """
+    values = []
+    for param in output_config.param_list:
+        value = np.asarray(param.value)
+        if value.dtype.kind in 'biufc':
+            values.append(np.abs(value).ravel() if value.dtype.kind == 'c' else value.ravel().astype(float))
+    return np.concatenate(values) if values else np.zeros(0)
+
+
+def get_interval_losses(x, y, criterion='gradient'):
+    """
+    :param x: sorted sample points, shape (n,)
+    :param y: signal at the sample points, shape (n, k)
+    :param criterion: 'gradient' - the length of each segment of the (x, y) curve, with x and every signal
+                      component scaled to [0, 1]. 'curvature' - the deviation of the curve from a straight line around
+                      each segment (segments in flat or linear regions get a small loss)
+    :return: the loss of each of the n - 1 intervals
+    """
+    x_scale = (x[-1] - x[0]) or 1.0
+    y_range = np.ptp(y, axis=0) if len(y) else np.zeros(0)
+    y_range[y_range == 0] = 1.0
+    dx = np.diff(x) / x_scale
+    y = y / y_range
+    dy = np.abs(np.diff(y, axis=0)).max(axis=1) if y.shape[1] else np.zeros(len(dx))
+    if criterion == 'gradient':
+        return np.hypot(dx, dy)
+    if criterion == 'curvature':
+        # deviation of every inner point from the line through its neighbours
+        deviation = np.zeros(len(x))
+        if len(x) > 2:
+            t = ((x[1:-1] - x[:-2]) / (x[2:] - x[:-2]))[:, np.newaxis]
+            line = y[:-2] + t * (y[2:] - y[:-2])
+            deviation[1:-1] = np.abs(y[1:-1] - line).max(axis=1) if y.shape[1] else 0
+        return np.maximum(deviation[:-1], deviation[1:]) + dx * dy
+    raise ValueError(f"criterion must be 'gradient' or 'curvature', got {criterion!r}")
+
+
+def refine_trace(experiment, config, max_points=None, tolerance=0.01, criterion='gradient', points_per_round=None,
+                 min_step=None, signal=default_signal, executor=None, chunksize=1, cache=None):
+    """
+    adaptively samples the traced parameter of a one dimensional config.
+    the declared values of the traced parameter are the coarse grid. in every round, the intervals with the largest
+    loss (see get_interval_losses) are split in the middle, until max_points is reached or every interval's loss is
+    below tolerance.
+    :param experiment: Experiment object. its run is used for every point
+    :param config: a Config with exactly one iterated Parameter
+    :param max_points: int. budget of points for the trace (default - 4 times the coarse grid)
+    :param tolerance: float. stop when the largest interval loss is below this
+    :param criterion: 'gradient' or 'curvature'
+    :param points_per_round: int. max number of points added per round (default - a quarter of the current points)
+    :param min_step: float. intervals shorter than this are not split (default - 1e-6 of the range)
+    :param signal: callable(output Config) -> 1D array. the quantities the refinement follows
+    :param executor, chunksize, cache: see Experiment.one_dimensional_sweep
+    :return: tuple (points, output configs), sorted by point
+    """
+    variable_param = config.get_iterables()[0]
+    x = np.unique(np.asarray(variable_param.value, dtype=float))
+    if max_points is None:
+        max_points = 4 * len(x)
+    if min_step is None:
+        min_step = 1e-6 * ((x[-1] - x[0]) or 1.0)
+
+    executor, owned = get_executor(executor)
+    try:
+        def evaluate(points):
+            configs = [config.view({variable_param.name: point}) for point in points]
+            return list(run_points(experiment, configs, executor, chunksize=chunksize, cache=cache))
+
+        outputs = evaluate(x)
+        y = np.array([signal(output) for output in outputs])
+        while len(x) < max_points and len(x) > 1:
+            losses = get_interval_losses(x, y, criterion)
+            losses[np.diff(x) < 2 * min_step] = 0
+            n_new = min(max_points - len(x), points_per_round or max(1, len(x) // 4))
+            worst = np.argsort(losses)[::-1][:n_new]
+            worst = worst[losses[worst] > tolerance]
+            if len(worst) == 0:
+                break
+            new_x = (x[worst] + x[worst + 1]) / 2
+            new_outputs = evaluate(new_x)
+            new_y = np.array([signal(output) for output in new_outputs])
+
+            order = np.argsort(np.concatenate([x, new_x]), kind='stable')
+            x = np.concatenate([x, new_x])[order]
+            y = np.concatenate([y, new_y])[order]
+            all_outputs = outputs + new_outputs
+            outputs = [all_outputs[i] for i in order]
+    finally:
+        if owned:
+            executor.shutdown()
+    return x, outputs
+
+
+class AdaptiveSweepResult:
+    """
+    the result of Experiment.adaptive_sweep: for every outer-loop entry, the sampled points of the traced parameter
+    and a ResultBuffer with the outputs at those points. different traces can have different points.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.tracing_parameter = config.get_axes()[-1][0]
+        self.traces = {}  # outer indices -> (points, ResultBuffer)
+
+    @property
+    def n_points(self):
+        return sum(len(points) for points, result in self.traces.values())
+
+    def add_trace(self, indices, points, outputs):
+        result = ResultBuffer(len(points))
+        for index, output in enumerate(outputs):
+            result.set(index, output)
+        self.traces[tuple(indices)] = (points, result)
+
+    def get_step_values(self):
+        """
+        :return: the sorted union of the sampled points of all the traces - the (non-uniform) step values of the
+                 traced parameter when the result is written to labber / a storage
+        """
+        return np.unique(np.concatenate([points for points, result in self.traces.values()]))
+
+    def get_grid_config(self):
+        """
+        :return: a view of the sweep config whose traced parameter takes the values get_step_values()
+        """
+        return self.config.view({self.tracing_parameter.name: self.get_step_values()})
+
+    def get_labber_trace(self, indices, step_values=None):
+        """
+        the trace of an outer-loop entry on the union step values. points that were not sampled in this trace are NaN.
+        """
+        if step_values is None:
+            step_values = self.get_step_values()
+        points, result = self.traces[tuple(indices)]
+        positions = np.searchsorted(step_values, points)
+        trace = {}
+        for name, column in result.columns.items():
+            dtype = column.dtype if column.dtype.kind in 'fc' else np.dtype(float)
+            full = np.full((len(step_values),) + column.shape[1:], np.nan, dtype=dtype)
+            full[positions] = column
+            trace[name] = full
+        return trace
+
+    def write(self, storages, name):
+        """
+        writes the result to storage objects (e.g. LabberStorage), on the grid of get_grid_config()
+        """
+        grid_config = self.get_grid_config()
+        step_values = self.get_step_values()
+        first_result = next(iter(self.traces.values()))[1]
+        output_config = first_result.get_configs((0,))[0]
+        try:
+            for store in storages:
+                store.open(grid_config, output_config, name)
+            for indices in sorted(self.traces):
+                trace = self.get_labber_trace(indices, step_values)
+                for store in storages:
+                    store.write_trace(indices, trace)
+        finally:
+            for store in storages:
+                store.close()
+
+
+def adaptive_sweep(experiment, config, max_points=None, tolerance=0.01, criterion='gradient', points_per_round=None,
+                   min_step=None, signal=default_signal, executor=None, max_workers=None, chunksize=1, cache=None):
+    """
+    like Experiment.sweep, but the traced (last iterated) parameter is sampled adaptively by refine_trace for every
+    outer-loop entry. see refine_trace for the arguments. the outer axes can be zipped, the traced one can't.
+    :return: an AdaptiveSweepResult
+    :raise ValueError: if the traced axis is zipped
+    """
+    if len(config.get_axes()[-1]) > 1:
+        raise ValueError("the traced axis of an adaptive sweep can't be zipped")
+    outer_grid = SweepGrid.from_config(config, outer=True)
+    result = AdaptiveSweepResult(config)
+    executor, owned = get_executor(executor, max_workers)
+    try:
+        for indices, vals in outer_grid:
+            trace_config = config.view(outer_grid.get_dict(indices))
+            points, outputs = refine_trace(experiment, trace_config, max_points=max_points, tolerance=tolerance,
+                                           criterion=criterion, points_per_round=points_per_round, min_step=min_step,
+                                           signal=signal, executor=executor, chunksize=chunksize, cache=cache)
+            result.add_trace(indices, points, outputs)
+    finally:
+        if owned:
+            executor.shutdown()
+    return result
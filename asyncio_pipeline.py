@@ -0,0 +1,103 @@
+"""
+an asyncio pipeline for experiments whose points are coroutines (e.g. instruments driven by asynchronous I/O): a
+bounded number of points is in flight, so while one point is measured the next ones are already being prepared, and
+the points share the instruments through per-resource locks.
+"""
+
+import asyncio
+import traceback
+
+from executors import SweepPointError
+from pipeline import ReorderBuffer
+
+
+class ResourceLocks:
+    """
+    one asyncio.Lock per named resource (an instrument, a channel, ...), created on first use:
+        async with locks('awg', 'digitizer'):
+            ...
+    holds the locks of all the named resources. they are always acquired in sorted order, so points that need
+    overlapping sets of resources can't deadlock. asyncio locks are fair, so the points get a resource in the order
+    they asked for it. that is point order only if the stages before the lock take equally long for every point: if
+    they don't, a later point can ask first and use the resource first.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    def get_lock(self, name):
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        return lock
+
+    def __call__(self, *names):
+        return _LockGroup([self.get_lock(name) for name in sorted(set(names))])
+
+
+class _LockGroup:
+    def __init__(self, locks):
+        self._locks = locks
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for lock in self._locks:
+                await lock.acquire()
+                acquired.append(lock)
+        except BaseException:
+            for lock in reversed(acquired):
+                lock.release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        for lock in reversed(self._locks):
+            lock.release()
+
+
+async def run_points_async(run, items, sink, pipeline_depth=2):
+    """
+    awaits run(item) for every item, with at most pipeline_depth of them running at the same time. the results are
+    put back in the order of items, and sink(index, item, result) is called in that order (e.g. to assemble traces
+    and write them to labber, which needs grid order).
+    if a point fails, the points still running are cancelled.
+
+    :param run: coroutine function(item) -> result
+    :param items: iterable of work items, in the order the sink should get them
+    :param sink: callable(index, item, result). called on the event loop, so it should not block for long
+    :param pipeline_depth: int. max number of items running at the same time
+    :raise SweepPointError: if run raised for some item (the original exception is chained as __cause__)
+    """
+    reorder = ReorderBuffer()
+    slots = asyncio.Semaphore(pipeline_depth)
+
+    async def run_item(index, item):
+        try:
+            try:
+                result = await run(item)
+            except Exception as e:
+                raise SweepPointError(index, item, traceback.format_exc()) from e
+        finally:
+            slots.release()
+        for ready_index, (ready_item, ready_result) in reorder.put(index, (item, result)):
+            sink(ready_index, ready_item, ready_result)
+
+    pending = set()
+    try:
+        for index, item in enumerate(items):
+            await slots.acquire()
+            for task in [task for task in pending if task.done()]:
+                task.result()  # raises the exception of a failed point
+                pending.discard(task)
+            pending.add(asyncio.ensure_future(run_item(index, item)))
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+                pending.discard(task)
+    except BaseException:
+        # also collects the exceptions of other failed points, which are not raised
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
@@ -0,0 +1,66 @@
+"""
+benchmark: per-point deepcopy of a Config (the old sweep hot loop) vs. ConfigView overlays.
+
+run from the repository root:
+    python benchmarks/bench_config_view.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from experiment_manager import Config, Parameter
+
+
+def make_config(n_points, constant_size):
+    return Config(Parameter('x', np.linspace(0, 1, n_points), 'a.u.'),
+                  Parameter('big_constant', np.zeros(constant_size)),
+                  Parameter('y', 5, 'a.u.'))
+
+
+def deepcopy_path(config):
+    # what one_dimensional_sweep used to do for every point
+    variable_param = config.get_iterables()[0]
+    for val in variable_param.value:
+        current_config = deepcopy(config)
+        current_config.set_parameter(name=variable_param.name, value=val)
+
+
+def view_path(config):
+    variable_param = config.get_iterables()[0]
+    for val in variable_param.value:
+        current_config = config.view({variable_param.name: val})
+
+
+def measure(fn, config):
+    """
+    :return: tuple (seconds, peak traced memory in bytes) for fn(config)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(config)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(n_points=2000, constant_size=100_000):
+    config = make_config(n_points, constant_size)
+    print(f"{n_points} points, constant array of {constant_size} floats")
+    results = {}
+    for name, fn in [('deepcopy', deepcopy_path), ('view', view_path)]:
+        elapsed, peak = measure(fn, config)
+        results[name] = (elapsed, peak)
+        print(f"{name:>10}: {elapsed * 1e6 / n_points:10.2f} us/point, peak memory {peak / 1e6:10.3f} MB")
+    print(f"speedup: {results['deepcopy'][0] / results['view'][0]:.1f}x")
+    return results
+
+
+if __name__ == '__main__':
+    main()
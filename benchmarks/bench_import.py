@@ -0,0 +1,73 @@
+"""
+benchmark: cold import time of experiment_manager, in a fresh interpreter without Labber, Labber_util or
+beautifultable on the path (like a process-pool worker on a machine without them). every run then also sweeps into
+a MemmapStorage and runs an incremental sweep, so that saving natively without the optional modules stays covered.
+exits with status 1 if the median is above the target (or if the sweeps fail).
+
+run from the repository root:
+    python benchmarks/bench_import.py [--target 0.25] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# blocks the optional modules, so that an eager import of them fails the benchmark
+CHILD_CODE = r"""
+import sys, time
+class Block:
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in ('Labber', 'Labber_util', 'beautifultable'):
+            raise ImportError(f'{name} was imported eagerly')
+sys.meta_path.insert(0, Block())
+start = time.perf_counter()
+import experiment_manager
+import_time = time.perf_counter() - start
+
+import os, tempfile
+import numpy as np
+from experiment_manager import Experiment, Config, Parameter
+from storage import MemmapStorage
+class E(Experiment):
+    def run(self, config):
+        return Config(Parameter('y', 2 * config.x.value))
+config = Config(Parameter('x', np.arange(3.)), Parameter('c', 1.))
+with tempfile.TemporaryDirectory() as directory:
+    E().sweep(config, save_to_labber=False, storage=MemmapStorage(os.path.join(directory, 'sweep')))
+    E().incremental_sweep(config, os.path.join(directory, 'incremental'), save_to_labber=False)
+print(import_time)
+"""
+
+
+def measure(repeat=5):
+    """
+    :return: a list of the import times in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', CHILD_CODE], cwd=REPO_DIR, check=True, capture_output=True,
+                                text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', type=float, default=0.25, help='max median import time in seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    times = measure(args.repeat)
+    median = statistics.median(times)
+    print(f"import experiment_manager: median {median * 1e3:.1f} ms, min {min(times) * 1e3:.1f} ms "
+          f"(target {args.target * 1e3:.0f} ms)")
+    if median > args.target:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
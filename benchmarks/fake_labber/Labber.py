@@ -0,0 +1,33 @@
+"""
+an in-memory stand-in for the Labber API used by experiment_manager, for benchmarks and tests on machines without
+Labber. entries are kept as references (no copies), so the benchmarks measure the sweep and not this module.
+"""
+
+
+class LogFile:
+
+    def __init__(self, path, log_list=None, step_list=None):
+        self.path = path
+        self.log_list = log_list
+        self.step_list = step_list
+        self.entries = []
+        self.comment = ''
+
+    def addEntry(self, entry):
+        self.entries.append(entry)
+
+    def setComment(self, comment):
+        self.comment = comment
+
+    def getComment(self):
+        return self.comment
+
+    def getNumberOfEntries(self):
+        return len(self.entries)
+
+    def getFilePath(self, tag):
+        return self.path
+
+
+def createLogFile_ForData(name, log_list, step_list=None):
+    return LogFile(name, log_list, step_list)
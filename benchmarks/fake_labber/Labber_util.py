@@ -0,0 +1,11 @@
+"""
+stand-in for Labber_util, for benchmarks and tests.
+"""
+
+_counter = 0
+
+
+def get_log_name(name):
+    global _counter
+    _counter += 1
+    return f'{name}_{_counter}'
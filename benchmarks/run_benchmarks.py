@@ -0,0 +1,227 @@
+"""
+microbenchmarks of the experiment_manager core: sweep throughput vs. grid size and dimensionality, Config creation
+and lookup, trace assembly for scalar and vector outputs, grid iteration, and memory high-water marks, and the
+throughput of a pipelined asyncio sweep of simulated instruments.
+
+Labber and Labber_util are replaced by the in-memory modules in benchmarks/fake_labber, so nothing is written to
+disk and no Labber installation is needed.
+
+run from the repository root:
+    python benchmarks/run_benchmarks.py                       # all benchmarks, saved to benchmarks/results/
+    python benchmarks/run_benchmarks.py -k sweep              # only the benchmarks whose name contains 'sweep'
+    python benchmarks/run_benchmarks.py --compare old.json    # print the ratio to an earlier run
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, 'fake_labber'))
+sys.path.insert(1, os.path.dirname(BENCHMARKS_DIR))
+
+import numpy as np
+
+from experiment_manager import Config, Parameter
+from general_utils import enumerated_product
+from result_buffer import ResultBuffer
+from storage import MemoryStorage
+from sweep_grid import SweepGrid
+from synthetic import ScalarExperiment, VectorExperiment, BatchExperiment, SimulatedInstrumentExperiment, make_config
+
+BENCHMARKS = []
+
+
+def benchmark(name, n_ops, repeat=5):
+    """
+    registers fn(): a benchmark of n_ops operations (points, lookups, ...). fn may return a setup-free callable, in
+    which case only that callable is timed.
+    """
+    def register(fn):
+        BENCHMARKS.append(dict(name=name, fn=fn, n_ops=n_ops, repeat=repeat))
+        return fn
+    return register
+
+
+def sweep(experiment, config, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return experiment.sweep(config, storage=MemoryStorage(), **kwargs)
+
+
+# sweep throughput vs. grid size (2D) and dimensionality (~4096 points)
+for n in (8, 32, 128):
+    @benchmark(f'sweep_2d_{n}x{n}', n_ops=n * n, repeat=3)
+    def _(n=n):
+        return lambda: sweep(ScalarExperiment(), make_config((n, n)))
+
+for ndim in (1, 2, 3, 4):
+    side = round(4096 ** (1 / ndim))
+    @benchmark(f'sweep_{ndim}d_{side ** ndim}_points', n_ops=side ** ndim, repeat=3)
+    def _(ndim=ndim, side=side):
+        return lambda: sweep(ScalarExperiment(), make_config((side,) * ndim))
+
+
+@benchmark('sweep_2d_64x64_no_labber', n_ops=64 * 64, repeat=3)
+def _():
+    return lambda: sweep(ScalarExperiment(), make_config((64, 64)), save_to_labber=False)
+
+
+@benchmark('sweep_2d_64x64_vector_100', n_ops=64 * 64, repeat=3)
+def _():
+    return lambda: sweep(VectorExperiment(100), make_config((64, 64)))
+
+
+@benchmark('sweep_2d_64x64_run_batch', n_ops=64 * 64, repeat=3)
+def _():
+    return lambda: sweep(BatchExperiment(), make_config((64, 64)))
+
+
+# asyncio sweep of simulated instruments (2 ms setup + 2 ms acquisition per point) vs. pipeline depth
+for depth in (1, 2, 4):
+    @benchmark(f'asyncio_sweep_depth_{depth}', n_ops=10 * 20, repeat=3)
+    def _(depth=depth):
+        return lambda: sweep(SimulatedInstrumentExperiment(), make_config((10, 20)), pipeline_depth=depth)
+
+
+# Config creation and lookup
+@benchmark('config_create_20_params', n_ops=10_000)
+def _():
+    params = [Parameter(f'p{i}', float(i)) for i in range(20)]
+    return lambda: [Config(*params) for _ in range(10_000)]
+
+
+@benchmark('config_lookup', n_ops=100_000)
+def _():
+    config = make_config((10,), n_constants=20)
+
+    def lookup():
+        for _ in range(10_000):
+            config.c0; config.c5; config.c10; config.c15; config.c19
+            config.c1; config.c6; config.c11; config.c16; config.x0
+    return lookup
+
+
+@benchmark('config_view', n_ops=10_000)
+def _():
+    config = make_config((10_000,), n_constants=20)
+    values = config.x0.value
+    return lambda: [config.view({'x0': value}) for value in values]
+
+
+@benchmark('config_get_iterables', n_ops=10_000)
+def _():
+    config = make_config((10, 10, 10), n_constants=20)
+
+    def get_iterables():
+        for _ in range(10_000):
+            config.get_iterables()
+    return get_iterables
+
+
+# trace assembly
+def make_outputs(n_points, vector_size):
+    if vector_size is None:
+        return [Config(Parameter('a', float(i)), Parameter('b', float(2 * i))) for i in range(n_points)]
+    return [Config(Parameter('a', float(i)), Parameter('v', np.full(vector_size, float(i)))) for i in range(n_points)]
+
+
+for vector_size in (None, 16, 1024):
+    label = 'scalar' if vector_size is None else f'vector_{vector_size}'
+
+    @benchmark(f'trace_assembly_{label}', n_ops=1000)
+    def _(vector_size=vector_size):
+        outputs = make_outputs(1000, vector_size)
+
+        def assemble():
+            result = ResultBuffer(len(outputs))
+            for index, output in enumerate(outputs):
+                result.set(index, output)
+            return result.get_labber_trace()
+        return assemble
+
+
+# grid iteration
+@benchmark('grid_enumerated_product', n_ops=64 ** 3)
+def _():
+    axes = [np.arange(64)] * 3
+    return lambda: [None for _ in enumerated_product(*axes)]
+
+
+@benchmark('grid_sweep_grid', n_ops=64 ** 3)
+def _():
+    grid = SweepGrid([np.arange(64)] * 3)
+    return lambda: [None for _ in grid]
+
+
+@benchmark('grid_sweep_grid_shards', n_ops=64 ** 3)
+def _():
+    shards = SweepGrid([np.arange(64)] * 3).shards(7)
+    return lambda: [None for shard in shards for _ in shard]
+
+
+def run_benchmark(spec):
+    """
+    :return: dict with the min and median time per op over the repeats, and the peak traced memory of one run
+    """
+    fn = spec['fn']()
+    times = []
+    for _ in range(spec['repeat']):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(n_ops=spec['n_ops'], repeat=spec['repeat'],
+                min_us_per_op=1e6 * min(times) / spec['n_ops'],
+                median_us_per_op=1e6 * statistics.median(times) / spec['n_ops'],
+                ops_per_s=spec['n_ops'] / min(times),
+                peak_memory_bytes=peak)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', default='', help='run only the benchmarks whose name contains this')
+    parser.add_argument('--output', help='json file for the results (default benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='json file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for spec in BENCHMARKS:
+        if args.pattern not in spec['name']:
+            continue
+        results[spec['name']] = result = run_benchmark(spec)
+        print(f"{spec['name']:<32}{result['min_us_per_op']:>12.3f} us/op{result['ops_per_s']:>14.0f} ops/s"
+              f"{result['peak_memory_bytes'] / 2 ** 20:>10.2f} MB peak")
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join(BENCHMARKS_DIR, 'results'), exist_ok=True)
+        output = os.path.join(BENCHMARKS_DIR, 'results', datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(dict(python=sys.version, platform=platform.platform(), numpy=np.__version__,
+                       time=datetime.datetime.now().isoformat(), results=results), f, indent=1)
+    print(f'saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+        print(f"\n{'benchmark':<32}{'old us/op':>12}{'new us/op':>12}{'new/old':>10}")
+        for name, result in results.items():
+            if name in old:
+                ratio = result['min_us_per_op'] / old[name]['min_us_per_op']
+                print(f"{name:<32}{old[name]['min_us_per_op']:>12.3f}{result['min_us_per_op']:>12.3f}{ratio:>10.2f}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
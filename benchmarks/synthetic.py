@@ -0,0 +1,81 @@
+"""
+synthetic experiments and configs for the benchmarks. run() does almost no work, so the benchmarks measure the
+overhead of experiment_manager itself (except for SimulatedInstrumentExperiment, which waits like real instruments).
+"""
+
+import asyncio
+
+import numpy as np
+
+from experiment_manager import Experiment, AsyncIOExperiment, Config, Parameter
+
+
+class ScalarExperiment(Experiment):
+    """
+    n_outputs scalar outputs per point
+    """
+
+    def __init__(self, n_outputs=2):
+        self.n_outputs = n_outputs
+
+    def run(self, config):
+        x = config.x0.value
+        return Config(*[Parameter(f'out{i}', x * i) for i in range(self.n_outputs)])
+
+
+class VectorExperiment(Experiment):
+    """
+    one vector output of length vector_size per point (e.g. a spectrum or a density matrix row)
+    """
+
+    def __init__(self, vector_size=100):
+        self.vector_size = vector_size
+        self._base = np.linspace(0, 1, vector_size)
+
+    def run(self, config):
+        return Config(Parameter('scalar', float(config.x0.value)),
+                      Parameter('vector', self._base * config.x0.value))
+
+
+class BatchExperiment(ScalarExperiment):
+    """
+    ScalarExperiment with a vectorized run_batch
+    """
+
+    def run_batch(self, config, axis_values):
+        x = np.asarray(axis_values.get('x0', config.x0.value), dtype=float)
+        shape = np.broadcast(*[np.asarray(values) for values in axis_values.values()]).shape
+        x = np.broadcast_to(x, shape)
+        return Config(*[Parameter(f'out{i}', x * i) for i in range(self.n_outputs)])
+
+
+class SimulatedInstrumentExperiment(AsyncIOExperiment):
+    """
+    simulated instruments with artificial latency: every point sets up an AWG (setup_latency seconds) and then
+    acquires on a digitizer (measure_latency seconds). each instrument serves one point at a time, so a pipelined
+    sweep takes about max(setup_latency, measure_latency) per point instead of their sum.
+    """
+
+    def __init__(self, setup_latency=0.002, measure_latency=0.002):
+        super().__init__()
+        self.setup_latency = setup_latency
+        self.measure_latency = measure_latency
+
+    async def prepare(self, config):
+        async with self.locks('awg'):
+            await asyncio.sleep(self.setup_latency)
+        return config.x0.value
+
+    async def measure(self, config, prepared):
+        async with self.locks('digitizer'):
+            await asyncio.sleep(self.measure_latency)
+        return Config(Parameter('out0', prepared), Parameter('out1', 2 * prepared))
+
+
+def make_config(shape, n_constants=5):
+    """
+    a Config with len(shape) iterated parameters x0, x1, ... (the last one is traced) and n_constants constants
+    """
+    params = [Parameter(f'x{axis}', np.linspace(0, 1, n), 'a.u.') for axis, n in enumerate(shape)]
+    params += [Parameter(f'c{i}', float(i), 'V') for i in range(n_constants)]
+    return Config(*params)
@@ -0,0 +1,172 @@
+"""
+checkpoints for resuming a sweep after a crash or an interrupt.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from result_cache import config_hash, UnhashableConfigError
+
+
+def _to_ranges(indices):
+    # sorted ints -> [[start, stop), ...]
+    ranges = []
+    for index in sorted(indices):
+        if ranges and ranges[-1][1] == index:
+            ranges[-1][1] = index + 1
+        else:
+            ranges.append([index, index + 1])
+    return ranges
+
+
+def _from_ranges(ranges):
+    return {index for start, stop in ranges for index in range(start, stop)}
+
+
+class SweepCheckpoint:
+    """
+    records which outer-loop entries of a sweep are done, and where their data is stored (the state of every storage
+    of the sweep), in a small json file.
+
+    the file is replaced atomically (write to a temporary file + os.replace), so a crash while saving leaves the previous
+    checkpoint intact. an entry counts as completed only after every storage accepted it: the storages are flushed
+    before every save, and the entries written since the last save are dropped if a storage call fails (see
+    storage_calls), so everything marked as completed in the file is on disk.
+    to keep the overhead low, saves are spaced so that the time spent saving (including the flush) is at most
+    max_overhead of the run time.
+    """
+
+    def __init__(self, path, max_overhead=0.01, min_interval=0.0):
+        """
+        :param path: str. path of the checkpoint json file
+        :param max_overhead: float. max fraction of the run time spent on saving checkpoints
+        :param min_interval: float. min seconds between two saves
+        """
+        self.path = path
+        self.max_overhead = max_overhead
+        self.min_interval = min_interval
+
+        self.config_hash = None
+        self.n_outer = None
+        self.completed = set()  # flat indices of the completed outer-loop entries
+        self._written = set()  # entries written since the last save, completed once the storages are flushed
+        self.storages = []  # [dict(type=class name, state=storage.get_state())]
+        self.is_resumed = False
+
+        self._last_save = time.perf_counter()
+        self._save_duration = 0.0
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        loads a checkpoint file written by a previous sweep. kwargs are passed to __init__.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        checkpoint = cls(path, **kwargs)
+        checkpoint.config_hash = data['config_hash']
+        checkpoint.n_outer = data['n_outer']
+        checkpoint.completed = _from_ranges(data['completed'])
+        checkpoint.storages = data['storages']
+        checkpoint.is_resumed = True
+        return checkpoint
+
+    @property
+    def n_completed(self):
+        return len(self.completed)
+
+    @property
+    def is_finished(self):
+        return self.n_outer is not None and self.n_completed == self.n_outer
+
+    def start(self, config, n_outer):
+        """
+        called by the sweep before the loop. for a loaded checkpoint, verifies that it belongs to the same sweep.
+        :param config: the Config of the sweep
+        :param n_outer: int. the number of outer-loop entries
+        :raise ValueError: if the checkpoint was written by a different sweep
+        """
+        try:
+            current_hash = config_hash(config)
+        except UnhashableConfigError:
+            current_hash = None  # can't verify the constants, only the grid size
+
+        if self.is_resumed:
+            if self.n_outer != n_outer:
+                raise ValueError(f"checkpoint {self.path} has {self.n_outer} outer-loop entries, the sweep has {n_outer}")
+            if self.config_hash is not None and current_hash is not None and self.config_hash != current_hash:
+                raise ValueError(f"checkpoint {self.path} was written for a different config")
+        self.config_hash = current_hash
+        self.n_outer = n_outer
+
+    def get_storage_states(self, storages):
+        """
+        :return: a list with the saved state for each storage (None for a new sweep)
+        :raise ValueError: if the storages don't match the ones recorded in the checkpoint
+        """
+        if not self.is_resumed:
+            return [None] * len(storages)
+        types = [type(store).__name__ for store in storages]
+        saved_types = [saved['type'] for saved in self.storages]
+        if types != saved_types:
+            raise ValueError(f"the sweep storages {types} don't match the checkpoint storages {saved_types}")
+        return [saved['state'] for saved in self.storages]
+
+    def set_storages(self, storages):
+        self.storages = [dict(type=type(store).__name__, state=store.get_state()) for store in storages]
+
+    def is_completed(self, index):
+        return index in self.completed
+
+    def mark_completed(self, index):
+        """
+        marks an outer-loop entry as written to every storage. it is added to completed by the next save, after the
+        storages were flushed.
+        """
+        self._written.add(index)
+
+    @contextmanager
+    def storage_calls(self):
+        """
+        wraps the calls that write to the storages (write_trace, flush, close): if one raises, the entries written
+        since the last save are dropped, since they might not have reached the disk (e.g. queued in a background
+        writer that failed).
+        """
+        try:
+            yield
+        except BaseException:
+            self._written.clear()
+            raise
+
+    def is_due(self):
+        """
+        whether enough time passed since the last save to save again within the overhead budget
+        """
+        since_last = time.perf_counter() - self._last_save
+        return since_last >= self.min_interval and since_last * self.max_overhead >= self._save_duration
+
+    def save(self, storages=()):
+        """
+        flushes the storages and then atomically writes the checkpoint file, with the entries marked since the last save
+        as completed. if a flush raises, the file is not written and those entries are dropped.
+        """
+        start = time.perf_counter()
+        with self.storage_calls():
+            for store in storages:
+                store.flush()
+        self.completed |= self._written
+        self._written.clear()
+        data = dict(config_hash=self.config_hash,
+                    n_outer=self.n_outer,
+                    completed=_to_ranges(self.completed),
+                    storages=self.storages)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_save = time.perf_counter()
+        self._save_duration = self._last_save - start
@@ -0,0 +1,324 @@
+"""
+distributed sweeps: a coordinator splits the outer-loop entries of a sweep into shards and hands them to worker
+processes (on this or other hosts) over multiprocessing.connection sockets. workers send heartbeats while they run, and
+the shards of a worker that disconnects or stops sending heartbeats are dispatched again to the other workers. the
+coordinator puts the traces back in grid order, so Experiment.sweep writes them to labber / the storages as usual.
+
+on the coordinator host:
+    with Coordinator(('0.0.0.0', 6000), authkey=b'secret') as coordinator:
+        experiment.sweep(config, distributed=coordinator)
+on every worker host (the experiment class must be importable there):
+    python distributed.py <coordinator host>:6000 --authkey secret
+
+the messages are pickled, so the connections are always authenticated: by default with the authkey of the coordinator
+process, which only local worker processes inherit (see start_local_workers). a coordinator that listens on a
+non-loopback address needs an explicit authkey. run only on a trusted network.
+"""
+
+import collections
+import ipaddress
+import itertools
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client, wait
+
+from executors import SweepPointError
+from pipeline import ReorderBuffer
+from sweep_grid import SweepGrid
+
+
+def is_loopback(host):
+    """
+    whether host (a name or an address) is this host only
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class _Worker:
+    # the coordinator side of a connected worker
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.name = None
+        self.last_seen = time.monotonic()
+        self.shards = {}  # shard id -> set of the flat outer indices not received yet
+
+
+class Coordinator:
+    """
+    listens for workers (see run_worker) and runs the outer-loop entries of sweeps on them.
+    workers can connect at any time and stay connected between sweeps, until close().
+    """
+
+    def __init__(self, address=('localhost', 0), authkey=None, shard_size=1, max_shards_per_worker=2,
+                 heartbeat_timeout=10.0, worker_timeout=None):
+        """
+        :param address: (host, port) to listen on. port 0 - any free port (see self.address)
+        :param authkey: bytes, optional. shared secret of the coordinator and the workers. by default the authkey of
+                        the current process, which is inherited by local worker processes (see start_local_workers).
+                        required when address is not a loopback address
+        :param shard_size: int. number of outer-loop entries (traces) in a shard
+        :param max_shards_per_worker: int. shards dispatched to a worker and not finished yet, so that the next shard
+                                      is already queued when a worker finishes one
+        :param heartbeat_timeout: float. seconds without any message after which a worker is considered lost
+        :param worker_timeout: float, optional. raise TimeoutError if no worker is connected for this long during a
+                               sweep. None - wait forever
+        :raise ValueError: if address is not a loopback address and authkey is None
+        """
+        if authkey is None:
+            if not is_loopback(address[0]):
+                raise ValueError(f"a coordinator listening on {address[0]!r} needs an authkey (the messages are pickled)")
+            authkey = multiprocessing.current_process().authkey
+        self.shard_size = shard_size
+        self.max_shards_per_worker = max_shards_per_worker
+        self.heartbeat_timeout = heartbeat_timeout
+        self.worker_timeout = worker_timeout
+
+        self.listener = Listener(address, authkey=authkey)
+        self.workers = {}  # conn -> _Worker
+        self._new_connections = queue.Queue()
+        self._shard_ids = itertools.count()
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # the listener was closed
+            except Exception:
+                continue  # e.g. a client with a wrong authkey
+            self._new_connections.put(conn)
+
+    def _send(self, worker, message):
+        try:
+            worker.conn.send(message)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _add_workers(self, setup, timeout=0.0):
+        # takes the newly connected workers, waiting up to timeout for the first one
+        while True:
+            try:
+                conn = self._new_connections.get(timeout=timeout) if timeout else self._new_connections.get_nowait()
+            except queue.Empty:
+                return
+            timeout = 0.0
+            worker = self.workers[conn] = _Worker(conn)
+            if setup is not None and not self._send(worker, setup):
+                self._lose(worker, collections.deque())
+
+    def _lose(self, worker, pending):
+        # re-dispatch what the worker did not send back
+        for remaining in worker.shards.values():
+            if remaining:
+                pending.appendleft(sorted(remaining))
+        worker.shards.clear()
+        self.workers.pop(worker.conn, None)
+        worker.conn.close()
+
+    def iter_traces(self, experiment, config, skip=(), executor=None, max_workers=None, chunksize=1, batch=True):
+        """
+        runs the outer-loop entries of a sweep on the workers.
+        :param experiment: the Experiment object (pickled to the workers)
+        :param config: the Config of the sweep (its last iterated Parameter is traced)
+        :param skip: flat outer indices not to run (e.g. completed before a resume)
+        :param executor, max_workers, chunksize, batch: passed to one_dimensional_sweep on the workers (executor must
+                                                       be one of executors.EXECUTOR_KINDS)
+        :return: a generator of (flat outer index, outer indices, labber trace) in grid order
+        :raise SweepPointError: if run failed on a worker. its index is the flat index of the outer-loop entry
+        """
+        outer_grid = SweepGrid.from_config(config, outer=True)
+        skip = set(skip)
+        to_run = [index for index in outer_grid.flat_range if index not in skip]
+        positions = {index: position for position, index in enumerate(to_run)}
+        pending = collections.deque(to_run[i:i + self.shard_size] for i in range(0, len(to_run), self.shard_size))
+        reorder = ReorderBuffer()
+        received = set()
+
+        setup = ('setup', experiment, config, dict(executor=executor, max_workers=max_workers, chunksize=chunksize,
+                                                   batch=batch))
+        for worker in list(self.workers.values()):
+            worker.last_seen = time.monotonic()  # heartbeats may be queued unread since the last sweep
+            if not self._send(worker, setup):
+                self._lose(worker, pending)
+        no_workers_since = None
+
+        try:
+            while reorder.next_index < len(to_run):
+                self._add_workers(setup, timeout=0.0 if self.workers else 0.1)
+
+                for worker in list(self.workers.values()):
+                    while pending and len(worker.shards) < self.max_shards_per_worker:
+                        shard = pending.popleft()
+                        shard_id = next(self._shard_ids)
+                        worker.shards[shard_id] = set(shard)
+                        if not self._send(worker, ('shard', shard_id, shard)):
+                            self._lose(worker, pending)
+                            break
+
+                if not self.workers:
+                    now = time.monotonic()
+                    no_workers_since = no_workers_since or now
+                    if self.worker_timeout is not None and now - no_workers_since > self.worker_timeout:
+                        raise TimeoutError(f"no worker connected to {self.address} for {self.worker_timeout} s")
+                    continue
+                no_workers_since = None
+
+                ready = wait(list(self.workers), timeout=min(0.1, self.heartbeat_timeout))
+                now = time.monotonic()
+                for conn in ready:
+                    # the messages of this round are read only after the consumer of the traces returns
+                    self.workers[conn].last_seen = now
+                for conn in ready:
+                    worker = self.workers.get(conn)
+                    if worker is None:
+                        continue  # lost while handling an earlier message of this round
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        self._lose(worker, pending)
+                        continue
+                    worker.last_seen = time.monotonic()
+                    kind = message[0]
+                    if kind == 'hello':
+                        worker.name = message[1]
+                    elif kind == 'trace':
+                        shard_id, index, trace = message[1:]
+                        if shard_id not in worker.shards or index in received:
+                            continue  # a shard of an earlier sweep, or dispatched twice
+                        worker.shards[shard_id].discard(index)
+                        received.add(index)
+                        for _, (ready_index, ready_trace) in reorder.put(positions[index], (index, trace)):
+                            yield ready_index, outer_grid.unravel(ready_index), ready_trace
+                    elif kind == 'done':
+                        worker.shards.pop(message[1], None)
+                    elif kind == 'error':
+                        shard_id, index, worker_traceback = message[1:]
+                        if shard_id in worker.shards:
+                            raise SweepPointError(index, None, f'worker {worker.name}:\n{worker_traceback}')
+
+                now = time.monotonic()
+                for worker in list(self.workers.values()):
+                    if now - worker.last_seen > self.heartbeat_timeout:
+                        if worker.conn.poll():
+                            worker.last_seen = now  # a message arrived while the consumer was busy
+                        else:
+                            self._lose(worker, pending)
+        finally:
+            for worker in self.workers.values():
+                worker.shards.clear()
+
+    def close(self):
+        """
+        stops the workers and the listener
+        """
+        for worker in list(self.workers.values()):
+            self._send(worker, ('stop',))
+            worker.conn.close()
+        self.workers.clear()
+        self.listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def run_worker(address, authkey=None, heartbeat_interval=1.0):
+    """
+    connects to a Coordinator and runs the shards it sends until it stops or disconnects.
+    :param address: (host, port) of the coordinator
+    :param authkey: bytes, optional. see Coordinator. by default the authkey of the current process (which a worker
+                    process started by start_local_workers inherits from the coordinator process)
+    :param heartbeat_interval: float. seconds between heartbeats (must be well below the coordinator's
+                               heartbeat_timeout)
+    """
+    if authkey is None:
+        authkey = multiprocessing.current_process().authkey
+    conn = Client(address, authkey=authkey)
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with lock:
+            conn.send(message)
+
+    def heartbeat():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send(('heartbeat',))
+            except (OSError, ValueError):
+                return
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        send(('hello', f'{socket.gethostname()}:{os.getpid()}'))
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = message[0]
+            if kind == 'stop':
+                return
+            if kind == 'setup':
+                experiment, config, sweep_kwargs = message[1:]
+                outer_grid = SweepGrid.from_config(config, outer=True)
+            elif kind == 'shard':
+                shard_id, shard = message[1:]
+                for index in shard:
+                    curr_config = config.view(outer_grid.get_dict(outer_grid.unravel(index)))
+                    try:
+                        result = experiment.one_dimensional_sweep(curr_config, save_to_labber=False, **sweep_kwargs)
+                    except Exception:
+                        send(('error', shard_id, index, traceback.format_exc()))
+                        break
+                    send(('trace', shard_id, index, result['labber_trace']))
+                else:
+                    send(('done', shard_id))
+    finally:
+        stopped.set()
+        conn.close()
+
+
+def start_local_workers(address, n_workers, authkey=None, heartbeat_interval=1.0):
+    """
+    starts worker processes on this host (e.g. for testing, or to use all the cores of the coordinator host).
+    :return: a list of the started multiprocessing.Process objects (daemons)
+    """
+    processes = [multiprocessing.Process(target=run_worker, args=(address, authkey, heartbeat_interval), daemon=True)
+                 for _ in range(n_workers)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='run a distributed sweep worker')
+    parser.add_argument('address', help='host:port of the coordinator')
+    parser.add_argument('--authkey', required=True, help='shared secret of the coordinator and the workers')
+    parser.add_argument('--heartbeat-interval', type=float, default=1.0)
+    args = parser.parse_args()
+    host, port = args.address.rsplit(':', 1)
+    run_worker((host, int(port)), args.authkey.encode(), args.heartbeat_interval)
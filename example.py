@@ -1,9 +1,3 @@
-import importlib
-import experiment_manager
-importlib.reload(experiment_manager)
-
-
-
 from experiment_manager import *
 
 
@@ -25,6 +19,14 @@ class TestExperiment(Experiment):
         # output_config = Config(Parameter('product', product))
         return output_config
 
+    def run_batch(self, config: Config, axis_values: dict):
+        # the same as run, for all the points of a trace (or the whole grid) at once
+        values = np.broadcast_arrays(*[axis_values.get(param.name, param.value) for param in config.param_list])
+        vector = np.stack(values, axis=-1)  # shape: batch shape + (number of parameters,)
+
+        output_config = Config(Parameter('vector', vector))
+        return output_config
+
 
 ########################################################################################################################
 config = Config(Parameter('x', np.array([4.5, 3.4, 3, 5,6]), 'a.u.'),
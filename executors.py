@@ -0,0 +1,166 @@
+"""
+pluggable executors for running Experiment.run on many configurations.
+
+an executor is anything with a concurrent.futures-like map(fn, *iterables, chunksize=...) method that returns the
+results in input order. 'serial' runs in the calling thread, 'thread' and 'process' wrap the concurrent.futures pools.
+"""
+
+import os
+import pickle
+import sys
+import time
+import traceback
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from itertools import repeat
+
+
+class SerialExecutor(Executor):
+    """
+    runs everything in the calling thread. this is the default and behaves exactly like a plain loop.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        return map(fn, *iterables)
+
+
+EXECUTOR_KINDS = ('serial', 'thread', 'process')
+
+
+def get_executor(executor=None, max_workers=None):
+    """
+    returns an executor object and whether the caller owns it (and should shut it down when done).
+    :param executor: None/'serial', 'thread', 'process' or an existing concurrent.futures.Executor
+    :param max_workers: int, optional. number of workers for the thread/process pool (default - the pool's default)
+    :return: tuple (executor, owned)
+    """
+    if executor is None or executor == 'serial':
+        return SerialExecutor(), True
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers), True
+    if executor == 'process':
+        from concurrent.futures import ProcessPoolExecutor  # imports multiprocessing, which is slow
+        return ProcessPoolExecutor(max_workers=max_workers), True
+    if isinstance(executor, Executor) or hasattr(executor, 'map'):
+        return executor, False
+    raise ValueError(f"executor must be one of {EXECUTOR_KINDS} or an Executor object, got {executor!r}")
+
+
+def get_n_workers(executor):
+    """
+    :return: int. the number of points the executor runs at the same time (1 for SerialExecutor)
+    """
+    if isinstance(executor, SerialExecutor):
+        return 1
+    return getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+
+
+class SweepPointError(RuntimeError):
+    """
+    raised in the calling process when Experiment.run failed for one of the points of a sweep.
+    the original exception (if it could be sent back from the worker) is chained as __cause__.
+    """
+
+    def __init__(self, index, config, worker_traceback):
+        self.index = index
+        self.config = config
+        self.worker_traceback = worker_traceback
+        super().__init__(f"run failed at point {index}:\n{worker_traceback}")
+
+
+class _PointFailure:
+    """
+    a picklable record of an exception raised by run() inside a worker
+    """
+
+    def __init__(self, exception):
+        self.traceback = traceback.format_exc()
+        try:
+            pickle.dumps(exception)
+            self.exception = exception
+        except Exception:
+            self.exception = None  # not picklable - the formatted traceback is all we can send back
+
+
+def _call_run(experiment, config):
+    return experiment.run(config)
+
+
+def _run_point(experiment, config):
+    # module level so that it can be pickled to process-pool workers
+    try:
+        return experiment.run(config)
+    except Exception as e:
+        return _PointFailure(e)
+
+
+def run_points(experiment, configs, executor, chunksize=1, cache=None, profiler=None):
+    """
+    calls experiment.run on every config using executor, and yields the results in the order of configs.
+    :param experiment: Experiment object (must be picklable for a process pool)
+    :param configs: iterable of constant Config objects
+    :param executor: an executor object as returned by get_executor
+    :param chunksize: int. number of points sent to a worker at once (only meaningful for a process pool)
+    :param cache: result_cache.ResultCache, optional. points found in the cache are not run, and new results are added
+                  to it. configs that can't be hashed are always run.
+    :param profiler: profiling.SweepProfiler, optional. times every point that is run ('point') and counts the
+                     points and the cache hits
+    :raise SweepPointError: if run raised for some point on a pool. with a SerialExecutor the exception of run is
+                            raised as is, like in a plain loop
+    """
+    configs = list(configs)
+    keys = [None] * len(configs)
+    cached = {}
+    if cache is not None:
+        from result_cache import UnhashableConfigError
+        memo = {}  # the configs share most of their parameters - hash each one once
+        for index, config in enumerate(configs):
+            try:
+                keys[index] = cache.get_key(experiment, config, memo)
+            except UnhashableConfigError:
+                continue
+            result = cache.get(keys[index])
+            if result is not None:
+                cached[index] = result
+
+    if profiler is not None:
+        profiler.count('points', len(configs))
+        if cached:
+            profiler.count('cache_hits', len(cached))
+
+    to_run = [index for index in range(len(configs)) if index not in cached]
+    run = _call_run if isinstance(executor, SerialExecutor) else _run_point
+    results = executor.map(run, repeat(experiment, len(to_run)), [configs[index] for index in to_run],
+                           chunksize=chunksize)
+    results = iter(results)
+    for index in range(len(configs)):
+        if index in cached:
+            yield cached[index]
+            continue
+        if profiler is None:
+            result = next(results)
+        else:
+            start = time.perf_counter()
+            result = next(results)
+            profiler.add_time('point', time.perf_counter() - start)
+        if isinstance(result, _PointFailure):
+            error = SweepPointError(index, configs[index], result.traceback)
+            raise error from result.exception
+        if keys[index] is not None:
+            cache.put(keys[index], result)
+        yield result
+
+
+def is_process_pool(executor):
+    """
+    whether executor is a concurrent.futures.ProcessPoolExecutor (without importing multiprocessing if it is not)
+    """
+    process_module = sys.modules.get('concurrent.futures.process')
+    return process_module is not None and isinstance(executor, process_module.ProcessPoolExecutor)
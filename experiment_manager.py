@@ -1,30 +1,66 @@
 import os
 import sys
+import time
 import typing
 from typing import Iterable
-from copy import deepcopy
 import numpy as np
-from beautifultable import BeautifulTable
-from dataclasses import dataclass
-import Labber
 import itertools as iter
-from general_utils import enumerated_product
+from collections import OrderedDict
+from contextlib import nullcontext
+from general_utils import chunked
+from executors import get_executor, get_n_workers, run_points, is_process_pool
+from result_buffer import ResultBuffer
+from shared_results import run_points_shared
+from sweep_grid import SweepGrid
+from storage import LabberStorage
+from checkpoint import SweepCheckpoint
+from pipeline import run_pipeline, map_ordered
+from progress import get_progress_reporter
+from result_cache import config_hash, UnhashableConfigError
+from sweep_hooks import SweepControl, get_hooks
+import adaptive
+import incremental
+import planner
+
+# the directory of Labber_util (which is not an installed package). set the LABBER_UTIL_PATH environment variable (or
+# this module attribute) to change it. Labber, Labber_util and beautifultable are imported only when they are used, so
+# this module can be imported (e.g. by process-pool workers) on machines without them.
+LABBER_UTIL_PATH = os.environ.get('LABBER_UTIL_PATH', r"G:\My Drive\guy PHD folder\util")
+
+
+def get_labber_util():
+    """
+    :return: the Labber_util module, imported from LABBER_UTIL_PATH on first use
+    """
+    path = os.path.abspath(LABBER_UTIL_PATH)
+    if path not in sys.path:
+        sys.path.append(path)
+    import Labber_util
+    return Labber_util
 
-sys.path.append(os.path.abspath(r"G:\My Drive\guy PHD folder\util"))
-import Labber_util as lu
+
+def __getattr__(name):
+    # experiment_manager.lu and experiment_manager.Labber still work, importing the module on first access
+    if name == 'lu':
+        return get_labber_util()
+    if name == 'Labber':
+        import Labber
+        return Labber
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-@dataclass
 class Parameter:  # TODO - I realized this class can be used for output data as well. consider change the name
     """
     a physical parameter with name, value, units.
+    a slotted class (no per-object __dict__) since a sweep can create millions of these as output data.
     """
+    __slots__ = ('name', 'value', 'units', 'is_iterated', 'cost', 'axis')
+
     name: str
     value: typing.Any
-    units: str = None
-    is_iterated = None
+    units: str
 
-    def __init__(self, name: str, value, units=None, is_iterated=None):
+    def __init__(self, name: str, value, units=None, is_iterated=None, cost=None, axis=None):
         """
         creates a Parameter object
         :param name: str -  name of the parameter
@@ -32,11 +68,19 @@ class Parameter:  # TODO - I realized this class can be used for output data as
         :param units: str  - physical units of the parameter, by default 'n.u.' = no units, which is not exactly the same thing as a.u. (arbitrary units).
         :param is_iterated: bool. detemines whether the value is constant or iterated. if iterated, then value should be an Iterable.
                                     by default self.is_iterated is defined according to whether value is an Iterable, but thie can be changed if you want, for example, a constant value that is a list.
+        :param cost: float, optional. a hint of how expensive it is to change the value of the parameter (e.g. the
+                     settling time of an instrument, in any consistent unit). used by the sweep planner to choose the
+                     loop order (see planner.plan_loop_order). None - free to change.
+        :param axis: str, optional. the name of the sweep axis of an iterated parameter. iterated parameters with the
+                     same axis name are zipped: they advance together as one axis of the sweep grid (e.g. T1 and
+                     T2 = 2 * T1), so their values must have the same length. None - an axis of its own.
         """
 
         self.name = name
         self.value = value
         self.units = units
+        self.cost = cost
+        self.axis = axis
 
         if is_iterated == None:
             if isinstance(self.value, Iterable):
@@ -46,11 +90,26 @@ class Parameter:  # TODO - I realized this class can be used for output data as
         else:
             self.is_iterated = is_iterated
 
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self.name!r}, value={self.value!r}, units={self.units!r})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.name, self.value, self.units) == (other.name, other.value, other.units)
+
+    __hash__ = None  # mutable, like the dataclass this used to be
+
 
 class Config:  # TODO - I realized this class can be used for output data as well. consider changing the name
     """
     this is an envelope-class for a list of Parameter objects with some useful methods.
+
+    parameters are accessed as attributes (config.param_name) through an internal name->index map, and the
+    iterables/constants partitions are cached until the next add_parameter/set_parameter. note that changing
+    param.is_iterated directly (not through set_parameter) is not seen by the cache.
     """
+    __slots__ = ('param_list', '_index', '_iterables', '_constants')
 
     # TODO easier access to values? right now one has to do config.param_name.value
     def __init__(self, *param_list):
@@ -59,12 +118,31 @@ class Config:  # TODO - I realized this class can be used for output data as wel
         :param param_list: a list of Parameter objects
         """
         self.param_list = list(param_list)
-        for param in self.param_list:
-            setattr(self, param.name, param)
+        self._index = {param.name: i for i, param in enumerate(self.param_list)}
+        self._invalidate()
+
+    def __getattr__(self, name):
+        # called only when normal attribute lookup fails, i.e. for parameter names
+        try:
+            index = object.__getattribute__(self, '_index')[name]
+        except (AttributeError, KeyError):  # AttributeError - not initialized yet (e.g. while unpickling)
+            raise AttributeError(f"{type(self).__name__!r} object has no parameter {name!r}") from None
+        return self.param_list[index]
+
+    def __getstate__(self):
+        return self.param_list
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _invalidate(self):
+        self._iterables = None
+        self._constants = None
 
     def add_parameter(self, param: Parameter):
+        self._index[param.name] = len(self.param_list)
         self.param_list.append(param)
-        setattr(self, param.name, param)
+        self._invalidate()
 
     def set_parameter(self, **kwargs):
 
@@ -76,62 +154,119 @@ class Config:  # TODO - I realized this class can be used for output data as wel
                 getattr(self, kwargs["name"]).is_iterated = isinstance(kwargs["value"], Iterable)
 
         if "index" in kwargs.keys():
+            del self._index[self.param_list[kwargs["index"]].name]
             self.param_list[kwargs["index"]] = kwargs["value"]
+            self._index[kwargs["value"].name] = kwargs["index"]
             if "is_iterated" in kwargs.keys():
                 self.param_list[kwargs["index"]].is_iterated = kwargs["is_iterated"]
             else:
                 self.param_list[kwargs["index"]].is_iterated = isinstance(kwargs["value"], Iterable)
 
+        self._invalidate()
+
     def get_dict(self):
-        d = {}
-        for param in self.param_list:
-            d[param.name] = param
-        return d
+        return {param.name: param for param in self.param_list}
 
     #TODO
     def get_dataclass_object_with_values(self):
         pass
 
     def get_values(self):
-        values = []
-        for param in self.param_list:
-            values.append(param.value)
-        return values
+        return [param.value for param in self.param_list]
 
-    def get_iterables(self):
-        iter_list = []
+    def _partition(self):
+        self._iterables = []
+        self._constants = []
         for param in self.param_list:
             if param.is_iterated:
-                iter_list.append(param)
-        return iter_list
+                self._iterables.append(param)
+            else:
+                self._constants.append(param)
+
+    def get_iterables(self):
+        if self._iterables is None:
+            self._partition()
+        return list(self._iterables)  # a copy, so the cache can't be changed by the caller
 
     def get_constants(self):
-        const_list = []
-        for param in self.param_list:
-            if not param.is_iterated:
-                const_list.append(param)
-        return const_list
+        if self._constants is None:
+            self._partition()
+        return list(self._constants)
 
-    def get_metadata_table(self):
-        table = BeautifulTable()
-        table.columns.header = ["name", "value", "units"]
+    def get_axes(self):
+        """
+        the axes of the sweep grid of self, in the order of their first parameter (the last axis is traced).
+        every iterated Parameter is an axis of its own, except for parameters with the same axis name, which are
+        zipped into one axis.
+        :return: a list with a list of the iterated Parameters of every axis
+        :raise ValueError: if zipped parameters have values of different lengths
+        """
+        axes = []
+        named_axes = {}
+        for param in self.get_iterables():
+            if param.axis is None:
+                axes.append([param])
+            elif param.axis in named_axes:
+                named_axes[param.axis].append(param)
+            else:
+                named_axes[param.axis] = [param]
+                axes.append(named_axes[param.axis])
+        for params in named_axes.values():
+            if len({len(param.value) for param in params}) > 1:
+                raise ValueError(f"the zipped parameters of axis {params[0].axis!r} have different lengths: "
+                                 f"{ {param.name: len(param.value) for param in params} }")
+        return axes
+
+    def is_cartesian(self):
+        """
+        whether the sweep grid of self is the plain cartesian product of its iterated parameters (nothing is zipped)
+        """
+        return all(len(params) == 1 for params in self.get_axes())
+
+    def _get_metadata_rows(self):
+        zipped_with = {param.name: params[0].name for params in self.get_axes() for param in params[1:]}
+        rows = []
         for param in self.param_list:
-            if param.is_iterated:
+            if param.name in zipped_with:
+                val = f"iterated with {zipped_with[param.name]}"
+            elif param.is_iterated:
                 val = "iterated"
             else:
                 val = param.value
-            table.rows.append([param.name, val, param.units])
+            rows.append([param.name, val, param.units])
+        return rows
+
+    def get_metadata_table(self):
+        from beautifultable import BeautifulTable
+        table = BeautifulTable()
+        table.columns.header = ["name", "value", "units"]
+        for row in self._get_metadata_rows():
+            table.rows.append(row)
             table.set_style(BeautifulTable.STYLE_NONE)
             table.precision=20
         return table
 
+    def get_metadata_text(self):
+        """
+        the metadata table as text, for the comment of a labber log or a stored sweep. a plain text table if
+        beautifultable is not installed (e.g. on a worker node that saves to a MemmapStorage)
+        """
+        try:
+            return str(self.get_metadata_table())
+        except ImportError:
+            pass
+        rows = [["name", "value", "units"]]
+        rows += [[str(cell) if cell is not None else '' for cell in row] for row in self._get_metadata_rows()]
+        widths = [max(len(row[column]) for row in rows) for column in range(3)]
+        return '\n'.join(' '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
     def is_constant(self):
         pass  # TODO - implement
 
     def get_labber_step_list(self):
-        iterated_config = Config(*self.get_iterables())  # build a new config with just the iterables of self
+        # one step channel per axis: the first parameter of a zipped axis (the others are logged, see LabberStorage)
         steplist = []
-        for param in iterated_config.param_list:
+        for param in [params[0] for params in self.get_axes()]:
             if param.units:
                 steplist.append(dict(name=param.name, unit=param.units, values=param.value))
             else:
@@ -151,6 +286,133 @@ class Config:  # TODO - I realized this class can be used for output data as wel
 
         return loglist
 
+    def view(self, values: dict):
+        """
+        returns a ConfigView of self in which the parameters named in values are replaced, without copying self.
+        :param values: dict {parameter name: new value}
+        """
+        return ConfigView(self, values)
+
+
+class ConfigView(Config):
+    """
+    a copy-on-write overlay on top of a Config. the parameters of the base Config are shared (not copied), and only the
+    overridden parameters are new Parameter objects. this replaces deepcopy(config) + set_parameter(...) in sweep loops,
+    which copies large constants (numpy arrays, backend objects) for every point.
+
+    a view behaves like a Config for reading (config.x.value, param_list, get_values(), ...). set_parameter and
+    add_parameter only change the view, never the base. note that assigning to config.x.value directly on a shared
+    (non-overridden) parameter DOES change the base, so run() should treat its config as read-only.
+    """
+
+    __slots__ = ('_base', '_overrides', '_extra')
+
+    def __init__(self, base: Config, values: dict = None):
+        """
+        :param base: the Config to view. if it is itself a ConfigView, the new view is flattened onto its base.
+        :param values: dict {parameter name: new value} of the overridden parameters
+        """
+        if isinstance(base, ConfigView):
+            self._overrides = dict(base._overrides)
+            self._extra = list(base._extra)
+            base = base._base
+        else:
+            self._overrides = {}
+            self._extra = []
+        self._base = base
+        self._invalidate()
+        for name, value in (values or {}).items():
+            self._override(name, value)
+
+    def _set_override(self, name, param):
+        self._overrides[name] = param
+        self._invalidate()
+
+    def _override(self, name, value, is_iterated=None):
+        old_param = getattr(self, name)
+        self._set_override(name, Parameter(name, value, units=old_param.units, is_iterated=is_iterated,
+                                                   cost=old_param.cost, axis=old_param.axis))
+
+    def __getattr__(self, name):
+        # called only for parameter names
+        try:
+            overrides = object.__getattribute__(self, '_overrides')
+        except AttributeError:  # not initialized yet (e.g. while unpickling)
+            raise AttributeError(name) from None
+        if name in overrides:
+            return overrides[name]
+        return getattr(self._base, name)
+
+    def __getstate__(self):
+        return self._base, self._overrides, self._extra
+
+    def __setstate__(self, state):
+        self._base, self._overrides, self._extra = state
+        self._invalidate()
+
+    @property
+    def param_list(self):
+        overrides = self._overrides
+        return [overrides.get(param.name, param) for param in self._base.param_list + self._extra]
+
+    def add_parameter(self, param: Parameter):
+        self._extra.append(param)
+        self._set_override(param.name, param)
+
+    def set_parameter(self, **kwargs):
+        # same keywords as Config.set_parameter, but replaces the parameter in the view instead of mutating it
+        if "name" in kwargs.keys():
+            self._override(kwargs["name"], kwargs["value"], kwargs.get("is_iterated"))
+
+        if "index" in kwargs.keys():
+            param = kwargs["value"]
+            if "is_iterated" in kwargs.keys():
+                param.is_iterated = kwargs["is_iterated"]
+            else:
+                param.is_iterated = isinstance(kwargs["value"], Iterable)
+            self._set_override(self.param_list[kwargs["index"]].name, param)
+
+    def to_config(self):
+        """
+        returns a regular Config with the same parameters. the non-overridden parameters are still shared with the base.
+        """
+        return Config(*self.param_list)
+
+
+def point_list(names, points, units=None, axis=None):
+    """
+    the Parameters of an explicit list of sweep points, zipped into one axis, e.g.
+    Config(*point_list(['T1', 'delay'], [(10e-6, 0), (20e-6, 5e-6), ...], ['s', 's']), Parameter('backend', ...))
+    :param names: list of str. the names of the parameters
+    :param points: a list of points, each a sequence with a value for every name
+    :param units: list of str, optional. the units of every parameter
+    :param axis: str, optional. the name of the axis (default - the first name)
+    :return: a list of iterated Parameters
+    """
+    units = units or [None] * len(names)
+    columns = [[point[i] for point in points] for i in range(len(names))]
+    return [Parameter(name, values, unit, is_iterated=True, axis=axis or names[0])
+            for name, values, unit in zip(names, columns, units)]
+
+
+def get_axis_points(params):
+    """
+    :param params: the Parameters of one sweep axis (see Config.get_axes)
+    :return: a list with a dict {parameter name: value} for every point along the axis
+    """
+    names = [param.name for param in params]
+    return [dict(zip(names, values)) for values in zip(*[param.value for param in params])]
+
+
+def take_axis_points(params, indices):
+    """
+    :param params: the Parameters of one sweep axis
+    :param indices: int array. the points to keep
+    :return: dict {parameter name: the values at indices}, e.g. for Config.view
+    """
+    return {param.name: param.value[indices] if isinstance(param.value, np.ndarray)
+            else [param.value[i] for i in indices] for param in params}
+
 
 def get_labber_trace(output_config_list):
     labber_dict = {}
@@ -167,6 +429,36 @@ def get_labber_trace(output_config_list):
     return labber_dict
 
 
+def _get_storages(storage, save_to_labber, labber_log_name=None, background_writer=True):
+    """
+    :param storage: None, a storage.Storage object or a list of them
+    :return: a list of the storages of a sweep, with a LabberStorage first if save_to_labber
+    """
+    if storage is None:
+        storage = []
+    storages = list(storage) if isinstance(storage, (list, tuple)) else [storage]
+    if save_to_labber:
+        storages.insert(0, LabberStorage(labber_log_name, background_writer=background_writer))
+    return storages
+
+
+def _close_sweep(storages, profiler=None):
+    """
+    the end of a sweep, also after an error: stops the profiler (and appends its report to the labber comment if
+    profiler.add_to_labber_comment), and closes the storages
+    """
+    try:
+        if profiler is not None:
+            report = profiler.stop()
+            if profiler.add_to_labber_comment:
+                for store in storages:
+                    if isinstance(store, LabberStorage):
+                        store.append_comment(str(report))
+    finally:
+        for store in storages:
+            store.close()  # writes whatever is still queued
+
+
 class Experiment:
     """
     a procedure (a computation or physical experiment with some controlled hardware) that you might like to run many
@@ -180,118 +472,519 @@ class Experiment:
         # to be implemented in child classes
         raise NotImplemented('run method not implemented')
 
-    def one_dimensional_sweep(self, config: Config, save_to_labber=False):
+    def run_batch(self, config: Config, axis_values: dict):
+        """
+        optional vectorized version of run, for experiments that can compute many points in one numpy call.
+        sweeps use it instead of calling run per point when a child class implements it.
+        :param config: the Config of the batch. the batched parameters are iterated, the rest are constants
+        :param axis_values: dict {name of a batched parameter: numpy array of its value at every point}. all the
+                            arrays have the same shape (the batch shape), e.g. the traced axis, or the full broadcast
+                            grid of the sweep
+        :return: an output Config whose values have the batch shape as their leading axes. outputs with more axes are
+                 vectors (the extra axes are the shape of a single point's vector).
+        """
+        # optionally implemented in child classes
+        raise NotImplementedError('run_batch method not implemented')
+
+    def has_run_batch(self):
+        return type(self).run_batch is not Experiment.run_batch
+
+    def get_batch_result(self, config: Config, axis_values: dict):
+        """
+        calls run_batch and stores its output in a ResultBuffer of the batch shape
+        """
+        shape = np.shape(list(axis_values.values())[0])
+        output_config = self.run_batch(config, axis_values)
+        result = ResultBuffer(shape)
+        result.allocate(output_config, batch_ndim=len(shape))
+        result.set_values((), {param.name: param.value for param in output_config.param_list})
+        return result
+
+    def one_dimensional_sweep(self, config: Config, save_to_labber=False, executor=None, max_workers=None,
+                              chunksize=1, cache=None, batch=True, profiler=None, shared_memory=True, point_hook=None):
         """
         execute self.run in a loop on a certain variable parameter
         :param config: a Config object with exactly one iterated Parameters  (and the others are constants)TODO: input verification
+                       (or several zipped ones, see Config.get_axes)
         :param save_to_labber:bool: whether to save the data in a new labber log
-        :return: a dict with two entries: 'output_config' --> a list of Config objects with the data,
+        :param executor: how to run the points: None/'serial' (default), 'thread', 'process' or an existing
+                         concurrent.futures.Executor (which is not shut down here). for 'process' the experiment object
+                         must be picklable. on a pool, an exception of run is raised as executors.SweepPointError
+                         (with the point index, and the original exception as __cause__); serial sweeps raise the
+                         exception of run as is.
+        :param max_workers: int, optional. number of workers when executor is 'thread' or 'process'
+        :param chunksize: int. number of points sent to a worker process at once
+        :param cache: result_cache.ResultCache, optional. points that are already in the cache (same experiment class
+                      and same config content) are not run again
+        :param batch: bool. if True (default) and the experiment implements run_batch, the whole trace is computed
+                      by one run_batch call (executor and cache are then not used)
+        :param profiler: profiling.SweepProfiler, optional. records the time of the phases of the trace
+        :param shared_memory: bool. with a process pool (and no cache), the workers write array outputs straight into
+                              a shared memory-mapped block that holds the trace, instead of pickling them back (see
+                              shared_results). the arrays of the returned buffer are then memory-mapped
+        :param point_hook: callable(index, output Config) -> bool, optional. called after every point (in order);
+                           False - the rest of the trace is not run, and its points are NaN in the result. not called
+                           when the trace is computed by run_batch
+        :return: a dict with two entries: 'result_buffer' --> a ResultBuffer with the data (use
+                    result_buffer.get_configs() to get a list of output Config objects),
                     'labber_trace'--> a dict that can be inputted to labber's addEntry method
         """
 
-        variable_param = config.get_iterables()[0]
-        result = []
-        for val in variable_param.value:
-            current_param = Parameter(variable_param.name, val, units=variable_param.units)
-            current_config = deepcopy(config)
-            current_config.set_parameter(name=current_param.name, value=current_param.value)
-            result.append(self.run(current_config))
-
-        labber_trace = get_labber_trace(result)
+        trace_params = config.get_axes()[0]
+        if self.has_run_batch() and batch:
+            # the whole trace in one call
+            start = time.perf_counter()
+            result = self.get_batch_result(config, {param.name: np.asarray(param.value) for param in trace_params})
+            if profiler is not None:
+                profiler.add_time('run_batch', time.perf_counter() - start)
+                profiler.count('points', len(trace_params[0].value))
+        else:
+            # views share the constants of config instead of deep-copying them for every point
+            start = time.perf_counter()
+            point_configs = [config.view(values) for values in get_axis_points(trace_params)]
+            if profiler is not None:
+                profiler.add_time('config_view', time.perf_counter() - start)
+
+            executor, owned = get_executor(executor, max_workers)
+            try:
+                if shared_memory and cache is None and point_hook is None and is_process_pool(executor):
+                    result = run_points_shared(self, point_configs, executor, chunksize=chunksize, profiler=profiler)
+                else:
+                    result = ResultBuffer(len(point_configs))
+                    # results come back in the order of point_configs, i.e. in grid order
+                    outputs = run_points(self, point_configs, executor, chunksize=chunksize, cache=cache,
+                                         profiler=profiler)
+                    for index, output_config in enumerate(outputs):
+                        result.set(index, output_config)
+                        if point_hook is not None and not point_hook(index, output_config):
+                            outputs.close()  # points already submitted to a pool finish, but are not waited for
+                            result.fill_missing(slice(index + 1, None))
+                            break
+            finally:
+                if owned:
+                    executor.shutdown()
+
+        start = time.perf_counter()
+        labber_trace = result.get_labber_trace()
+        if profiler is not None:
+            profiler.add_time('labber_trace', time.perf_counter() - start)
         if save_to_labber:
-            log_name = lu.get_log_name('test_exp_new')  # TODO: automatic naming
-            logfile = Labber.createLogFile_ForData(log_name, result[0].get_labber_log_list(),
-                                                   Config(variable_param).get_labber_step_list())
-            logfile.addEntry(get_labber_trace(result))
-            logfile.setComment(str(config.get_metadata_table()))
-        return dict(output_config=result, labber_trace=labber_trace)
+            import Labber
+            log_name = get_labber_util().get_log_name('test_exp_new')  # TODO: automatic naming
+            logfile = Labber.createLogFile_ForData(log_name, result.log_list,
+                                                   Config(*trace_params).get_labber_step_list())
+            logfile.addEntry(labber_trace)
+            logfile.setComment(config.get_metadata_text())
+        return dict(result_buffer=result, labber_trace=labber_trace)
 
-    def sweep(self, config, save_to_labber=True, labber_log_name=None):
+    def sweep(self, config, save_to_labber=True, labber_log_name=None, executor=None, max_workers=None, chunksize=1,
+              background_writer=True, storage=None, cache=None, checkpoint=None, resume=None, batch='trace',
+              plan=None, distributed=None, profiler=None, progress=None, mask=None, hooks=None, verbose=False):
         """
         executes self.run(...) in an N-dimneional loop with N equals the number of iterated Parameters ("variables") in
-         config.
+         config. parameters with the same axis name are zipped into one loop (see Parameter and point_list).
         :param config: a Config object with some iterated Parameters ("varialbes") and some non-iterated ones ("constants)
         :param save_to_labber: bool.
         :param labber_log_name: str, optional. if not supplied use automatic naming scheme #TODO : describe here the scheme
-        :return: none currently. for now I want to use the save_to_labber feature anyway.
-        TODO: save the data in python as well. his will be more important for asynchronic experiments
+        :param executor: None/'serial' (default), 'thread', 'process' or a concurrent.futures.Executor. the pool is
+                         created once and used for all the traces of the sweep. see one_dimensional_sweep. with a pool,
+                         the points of several traces are in flight at once (enough to keep all the workers busy, also
+                         when the traces are short), unless run_batch or per-point hooks are used. the traces are
+                         still written in grid order.
+        :param max_workers: int, optional. number of workers when executor is 'thread' or 'process'
+        :param chunksize: int. number of points sent to a worker process at once
+        :param background_writer: bool. if True (default) the labber entries are written by a BackgroundLogWriter
+                                  thread, so that the sweep does not wait for the disk. all the queued entries are
+                                  written before sweep returns, also when it is stopped by an exception or ctrl+c.
+        :param storage: a storage.Storage object or a list of them (e.g. MemoryStorage(), HDF5Storage(path),
+                        MemmapStorage(directory), ZarrStorage(path)), to save the data in python as well as / instead of
+                        labber.
+        :param cache: result_cache.ResultCache, optional. skip the points that were already computed, e.g. when
+                      re-running an overlapping grid. see one_dimensional_sweep.
+        :param checkpoint: str (path) or SweepCheckpoint, optional. record the completed outer-loop entries and the
+                           location of the stored data in this checkpoint file while sweeping.
+        :param resume: str (path) or SweepCheckpoint, optional. resume an interrupted sweep from its checkpoint: the
+                       completed outer-loop entries are skipped and the data is appended to the same labber log /
+                       storages (pass storage objects of the same types, in the same order, as in the original sweep).
+                       the checkpoint keeps being updated.
+        :param batch: how to use run_batch, if the experiment implements it: 'trace' (default) - one run_batch call
+                      per trace, 'grid' - one call with the full broadcast grid of all the variables, None - don't use
+                      run_batch (call run per point)
+        :param plan: the order in which the grid is run: None (default) - the declared order of the variables (the
+                     last one is the innermost loop), 'auto' - the loop order that minimizes the total cost of changing
+                     the variables, according to their cost hints (Parameter(..., cost=...)), 'snake' - the same, and
+                     the loops walk the grid back and forth instead of jumping back to their first values, or a
+                     planner.SweepPlan. the data is always written in the declared order (labber step list, storages);
+                     a reordered sweep keeps its points in memory until their traces are complete. can't be combined
+                     with resume or batch='grid'.
+        :param distributed: a distributed.Coordinator, optional. run the outer-loop entries on the worker processes
+                            connected to it (on this or other hosts) instead of here. executor, max_workers, chunksize
+                            and batch are used by the workers (executor must be a kind string; batch='grid' is done per
+                            trace), cache is not used. can't be combined with plan.
+        :param profiler: profiling.SweepProfiler, optional. records per-phase timers, counters and per-point latency
+                         histograms (and cProfile / tracemalloc data if enabled in the profiler) of the sweep. the
+                         report is in profiler.report after the sweep, and is appended to the labber log comment if
+                         profiler.add_to_labber_comment.
+        :param progress: True - report the completed points, throughput and ETA (a line on stderr, refreshed at
+                         most twice per second), a callable(progress.ProgressState) - call it instead, or a
+                         progress.ProgressReporter (custom rate, callbacks, logger). None (default) - no reporting
+        :param mask: the points of the grid to run: a bool array of the grid shape (one axis per loop), or a
+                     callable(dict {parameter name: value}) -> bool called for every point (see SweepGrid.get_mask).
+                     the points that are masked out are not run, and are NaN (None for non-numeric outputs) in
+                     labber and the storages, which also record the mask. can't be combined with plan or
+                     distributed.
+        :param hooks: a sweep_hooks.SweepHook, a function (called as SweepHook.on_trace) or a list of them, optional.
+                      called with the partial results after every point / trace, they can stop the sweep, cut the
+                      current trace short or prune sub-grids (see sweep_hooks). the data written before is kept; if
+                      the hooks changed the sweep, the storages are marked as a partial grid, with a mask of the points
+                      that were run (see Storage.mark_partial). per-point hooks make the points run one by one (not
+                      through run_batch), and can't be combined with plan or distributed.
+        :param verbose: bool. print the step list, the log list and every trace (slow for fast experiments)
+        :return: a list of the storage objects the data was written to (including the LabberStorage if
+                 save_to_labber)
         """
 
         variable_config = Config(*config.get_iterables())  # a Config with only the variables
 
-        # the last variable is the trace parameter (inner-most loop):
-        tracing_parameter = variable_config.param_list[-1]
+        # the last axis is traced (inner-most loop):
+        trace_params = config.get_axes()[-1]
+        tracing_parameter = trace_params[0]
 
         # get labber step list:
-        step_list = variable_config.get_labber_step_list()
-
+        step_list = config.get_labber_step_list()
+
+
+        hooks = get_hooks(hooks)
+        point_hooks = [hook for hook in hooks if hook.has_on_point()]
+        trace_hooks = [hook for hook in hooks if hook.has_on_trace()]
+
+        use_batch = batch if self.has_run_batch() and not point_hooks else None
+        if plan is not None and use_batch == 'grid':
+            raise ValueError("a sweep with a plan can't use batch='grid' (the whole grid is one run_batch call)")
+        sweep_plan = planner.get_plan(plan, config)
+        if sweep_plan is not None and resume is not None:
+            raise ValueError("a sweep with a plan can't be resumed")
+        if sweep_plan is not None and distributed is not None:
+            raise ValueError("a distributed sweep can't have a plan")
+        if sweep_plan is not None and (mask is not None or not config.is_cartesian()):
+            raise ValueError("a sweep with a plan can't have zipped axes or a mask")
+        if mask is not None and distributed is not None:
+            raise ValueError("a distributed sweep can't have a mask")
+        if point_hooks and (sweep_plan is not None or distributed is not None):
+            raise ValueError("per-point hooks can't be combined with plan or distributed")
+
+        grid = SweepGrid.from_config(config)
+        grid_mask = grid.get_mask(mask) if mask is not None else None
+        control = SweepControl(grid, grid_mask) if hooks else None
+
+        phase = profiler.phase if profiler is not None else (lambda name: nullcontext())
 
         # create a constant configuration for test run
-        curr_config = deepcopy(config)
-        for variable in variable_config.param_list:
-            curr_config.set_parameter(name=variable.name, value=0)
-
-        # test run
-        test_result = self.run(curr_config)
+        test_config = config.view({variable.name: 0 for variable in variable_config.param_list})
+
+        # test run (part of the profiled wall time)
+        if profiler is not None:
+            profiler.start()
+        try:
+            with phase('test_run'):
+                if use_batch:
+                    trace_values = {param.name: np.zeros(1) for param in trace_params}
+                    test_config = test_config.view(trace_values)
+                    test_result = self.get_batch_result(test_config, trace_values).get_configs()[0]
+                else:
+                    test_result = self.run(test_config)
+        except BaseException:
+            if profiler is not None:
+                profiler.stop()
+            raise
 
         # get labber log list
         log_list = test_result.get_labber_log_list()
 
 
-        print("setp list")
-        print(step_list)
-        print("log list")
-        print(log_list)
-
-        # add back the tracing parameter as an iterated Parameter
-        curr_config.set_parameter(name=tracing_parameter.name, value=tracing_parameter.value)
+        if verbose:
+            print("setp list")
+            print(step_list)
+            print("log list")
+            print(log_list)
 
-        if save_to_labber:
+        storages = _get_storages(storage, save_to_labber, labber_log_name, background_writer)
 
-            # automatic naming:
-            if labber_log_name:
-                log_name = labber_log_name
+        # automatic naming:
+        class_name = type(self).__name__
+        log_name = f'{class_name}_sweep'
+
+        outer_grid = SweepGrid.from_config(config, outer=True)  # "outer" means all but the inner-most loop
+
+        if resume is not None:
+            checkpoint = resume if isinstance(resume, SweepCheckpoint) else SweepCheckpoint.load(resume)
+        elif checkpoint is not None and not isinstance(checkpoint, SweepCheckpoint):
+            checkpoint = SweepCheckpoint(checkpoint)
+        if checkpoint is not None:
+            checkpoint.start(config, len(outer_grid))
+            storage_states = checkpoint.get_storage_states(storages)
+        else:
+            storage_states = [None] * len(storages)
+        # a failed storage call drops the traces written since the last checkpoint save from the checkpoint
+        storage_calls = checkpoint.storage_calls if checkpoint is not None else nullcontext
+
+        # create the pool once for the whole sweep (the workers create their own in a distributed sweep):
+        worker_executor = executor if isinstance(executor, str) else None
+        executor, owned = get_executor(executor if distributed is None else None, max_workers)
+        reporter = get_progress_reporter(progress)
+        try:
+            with phase('open'):
+                for store, state in zip(storages, storage_states):
+                    store.open(config, test_result, log_name, state=state, mask=grid_mask)
+                if checkpoint is not None:
+                    checkpoint.set_storages(storages)
+                    checkpoint.save()
+
+            if distributed is not None:
+                traces = distributed.iter_traces(self, config, skip=checkpoint.completed if checkpoint else (),
+                                                 executor=worker_executor,
+                                                 max_workers=max_workers, chunksize=chunksize, batch=bool(use_batch))
+            elif sweep_plan is not None:
+                traces = planner.iter_planned_traces(self, config, sweep_plan, test_result, executor=executor,
+                                                     chunksize=chunksize, cache=cache, batch=bool(use_batch),
+                                                     profiler=profiler)
             else:
-                class_name = type(self).__name__
-                log_name = f'{class_name}_sweep'
-
-            log_name = lu.get_log_name(log_name) # adds automatic numbering to avoid overwrite
-
-            # create log file
-            logfile = Labber.createLogFile_ForData(log_name, log_list, step_list)
-
-            # add comment w. metadata
-            logfile.setComment(str(config.get_metadata_table()))
-
-        outer_variables = Config(*variable_config.param_list[:-1])  # "outer" means all but the inner-most loop
+                traces = self._iter_traces(config, outer_grid, executor, chunksize, cache, use_batch, checkpoint,
+                                           profiler, grid_mask, test_result, control, point_hooks)
+
+            trace_length = len(tracing_parameter.value)
+            if reporter is not None:
+                if grid_mask is None:
+                    n_done = checkpoint.n_completed * trace_length if checkpoint is not None else 0
+                    reporter.start(len(grid), initial=n_done)
+                else:
+                    n_done = sum(int(grid_mask[outer_grid.unravel(index)].sum())
+                                 for index in (checkpoint.completed if checkpoint is not None else ()))
+                    reporter.start(int(grid_mask.sum()), initial=n_done)
+
+            trace_start = time.perf_counter()
+            for flat_index, indices, labber_trace in traces:
+                if profiler is not None:
+                    profiler.add_time('trace', time.perf_counter() - trace_start)
+                    profiler.count('traces')
+                outer_point = outer_grid.get_dict(indices) if control is not None else None
+                pruned = control is not None and control.is_pruned(outer_point)
+                if pruned:
+                    # computed anyway by a planned / distributed sweep, or not run (None) by _iter_traces
+                    control.run_mask[indices] = False
+                    labber_trace = ResultBuffer(0).expand(control.run_mask[indices], test_result).get_labber_trace()
+
+                if verbose:
+                    with phase('print'):
+                        print("trace")
+                        print(labber_trace)
+
+                # save to labber and/or in python:
+                with phase('write'), storage_calls():
+                    for store in storages:
+                        store.write_trace(indices, labber_trace)
+
+                if checkpoint is not None:
+                    checkpoint.mark_completed(flat_index)
+                    if checkpoint.is_due():
+                        with phase('checkpoint'):
+                            checkpoint.save(storages)
+                if reporter is not None:
+                    if control is not None:
+                        reporter.update(int(control.run_mask[indices].sum()))
+                    else:
+                        reporter.update(trace_length if grid_mask is None else int(grid_mask[indices].sum()))
+
+                if control is not None:
+                    if not pruned:
+                        for hook in trace_hooks:
+                            hook.on_trace(control, indices, outer_point, labber_trace)
+                    if control.is_stopped:
+                        # the traces after this one are not run
+                        for index in range(flat_index + 1, len(outer_grid)):
+                            if checkpoint is None or not checkpoint.is_completed(index):
+                                control.run_mask[outer_grid.unravel(index)] = False
+                        break
+                trace_start = time.perf_counter()
+
+            if control is not None and control.is_partial:
+                for store in storages:
+                    store.mark_partial(control.run_mask, control.reason)
+
+            with phase('close'), storage_calls():
+                for store in storages:
+                    store.flush()  # so that the report includes the queued writes
+            if reporter is not None:
+                reporter.finish()
+        finally:
+            if owned:
+                executor.shutdown()
+            try:
+                with storage_calls():
+                    _close_sweep(storages, profiler)
+            finally:
+                if checkpoint is not None:
+                    checkpoint.save()  # only the traces that every storage accepted
+
+        return storages
+
+    def _iter_traces(self, config, outer_grid, executor, chunksize, cache, use_batch, checkpoint, profiler,
+                     grid_mask=None, output_config=None, control=None, point_hooks=()):
+        # the traces of sweep in the declared grid order: (flat outer index, outer indices, labber trace).
+        # the points masked out by grid_mask are not run (output_config defines the channels of an empty trace).
+        # the traces pruned by the hooks are not run (labber trace None), and point_hooks can cut a trace short
+        axes = config.get_axes()
+        if use_batch == 'grid':
+            # the whole grid (its unmasked points) in one run_batch call
+            grid_indices = np.indices(tuple(len(params[0].value) for params in axes))
+            axis_values = {param.name: np.asarray(param.value)[grid_indices[axis]]
+                           for axis, params in enumerate(axes) for param in params}
+            if grid_mask is not None:
+                axis_values = {name: values[grid_mask] for name, values in axis_values.items()}
+            start = time.perf_counter()
+            grid_result = self.get_batch_result(config, axis_values)
+            if profiler is not None:
+                profiler.add_time('run_batch', time.perf_counter() - start)
+                profiler.count('points', grid_indices[0].size if grid_mask is None else int(grid_mask.sum()))
+            if grid_mask is not None:
+                grid_result = grid_result.expand(grid_mask)
+
+        def get_trace(indices):
+            trace_mask = grid_mask[indices] if grid_mask is not None else None
+            if control is not None and control.is_pruned(outer_grid.get_dict(indices)):
+                labber_trace = None
+            elif use_batch == 'grid':
+                labber_trace = grid_result.get_labber_trace(indices)
+            elif trace_mask is not None and not trace_mask.any():
+                labber_trace = ResultBuffer(0).expand(trace_mask, output_config).get_labber_trace()
+            else:
+                # update parameters to current values (the tracing parameter stays iterated):
+                outer_point = outer_grid.get_dict(indices)
+                curr_config = config.view(outer_point)
+                point_indices = np.arange(len(axes[-1][0].value))
+                if trace_mask is not None and not trace_mask.all():
+                    # only the unmasked points of the trace
+                    point_indices = np.flatnonzero(trace_mask)
+                    curr_config = curr_config.view(take_axis_points(axes[-1], point_indices))
+                point_hook = None
+                if point_hooks:
+                    point_hook = self._get_point_hook(control, point_hooks, outer_point, axes[-1], point_indices,
+                                                      indices)
+
+                # do 1D sweep on the tracing parameter:
+                result = self.one_dimensional_sweep(curr_config, save_to_labber=False, executor=executor,
+                                                    chunksize=chunksize, cache=cache, batch=bool(use_batch),
+                                                    profiler=profiler, point_hook=point_hook)
+                if trace_mask is not None and not trace_mask.all():
+                    labber_trace = result["result_buffer"].expand(trace_mask).get_labber_trace()
+                else:
+                    labber_trace = result["labber_trace"]
+            return labber_trace
 
         # N-dimensional loop with itertools.product: # (actually N-1 )
-        for indices, vals in enumerated_product(*outer_variables.get_values()):
-            # update parameters to current values:
-            for i, param in enumerate(outer_variables.param_list):
-                curr_config.set_parameter(name=param.name, value=vals[i])
+        traces = ((flat_index, indices) for flat_index, (indices, vals) in enumerate(outer_grid)
+                  if checkpoint is None or not checkpoint.is_completed(flat_index))
+        n_workers = get_n_workers(executor)
+        if n_workers == 1 or use_batch or control is not None:
+            for flat_index, indices in traces:
+                yield flat_index, indices, get_trace(indices)
+            return
+
+        # the pool gets the points of several traces at once, so that short traces don't leave workers idle and
+        # there is no barrier between traces. the traces come back in grid order
+        trace_length = len(axes[-1][0].value)
+        traces_in_flight = max(2, -(-2 * n_workers // trace_length))
+        for (flat_index, indices), labber_trace in map_ordered(lambda trace: get_trace(trace[1]), traces,
+                                                                traces_in_flight):
+            yield flat_index, indices, labber_trace
+
+    @staticmethod
+    def _get_point_hook(control, point_hooks, outer_point, trace_params, point_indices, indices):
+        # the point_hook of one_dimensional_sweep for one trace: calls the on_point hooks, and records the points that
+        # are not run in control.run_mask
+        points = get_axis_points(trace_params)
+
+        def point_hook(index, output_config):
+            point = {**outer_point, **points[point_indices[index]]}
+            for hook in point_hooks:
+                hook.on_point(control, point, output_config)
+            if control.pop_skip_trace() or control.is_stopped:
+                control.run_mask[indices][point_indices[index + 1:]] = False
+                return False
+            return True
+        return point_hook
+
+    def adaptive_sweep(self, config, save_to_labber=True, labber_log_name=None, storage=None, background_writer=True,
+                       **kwargs):
+        """
+        a sweep in which the traced (last iterated) parameter is sampled adaptively: its declared values are a coarse
+        grid, and points are added only where the output changes sharply, until a budget of points per trace or a
+        tolerance is reached. the outer parameters are swept on their full grid.
+        the data is written to labber / the storages at the end, with the union of the sampled points of all the
+        traces as the (non-uniform) step values of the traced parameter. points that were not sampled in a trace are
+        NaN in that trace.
+        :param config: a Config object with some iterated Parameters and some constants
+        :param save_to_labber: bool.
+        :param labber_log_name: str, optional. by default '<class name>_adaptive_sweep' with automatic numbering
+        :param storage: a storage.Storage object or a list of them, see sweep
+        :param background_writer: bool. see sweep
+        :param kwargs: refinement options - max_points, tolerance, criterion ('gradient'/'curvature'),
+                       points_per_round, min_step, signal, executor, max_workers, chunksize, cache.
+                       see adaptive.refine_trace
+        :return: an adaptive.AdaptiveSweepResult with the sampled points and outputs of every trace
+        """
+        result = adaptive.adaptive_sweep(self, config, **kwargs)
 
-            # do 1D sweep on the tracing parameter:
-            result = self.one_dimensional_sweep(curr_config, save_to_labber=False)
+        storages = _get_storages(storage, save_to_labber, labber_log_name, background_writer)
+        class_name = type(self).__name__
+        result.write(storages, f'{class_name}_adaptive_sweep')
+        return result
 
-            # save to labber
-            print("trace")
-            print(result["labber_trace"])
-            if save_to_labber:
-                logfile.addEntry(result["labber_trace"])
+    def incremental_sweep(self, config, directory, save_to_labber=True, labber_log_name=None, storage=None,
+                          background_writer=True, force=False, **kwargs):
+        """
+        a sweep that keeps its data in a directory, and runs only what changed since the last incremental sweep into
+        the same directory: the points whose axis values are new, or that were not run before. if a constant, the
+        experiment class or the axis structure changed, all the points are run. the merged data replaces the data in
+        the directory, and is written to labber / the storages at the end (see incremental.py).
+        :param config: a Config object with some iterated Parameters and some constants
+        :param directory: str. the MemmapStorage directory of the data
+        :param save_to_labber: bool.
+        :param labber_log_name: str, optional. by default '<class name>_incremental_sweep' with automatic numbering
+        :param storage: a storage.Storage object or a list of them, see sweep
+        :param background_writer: bool. see sweep
+        :param force: bool. run all the points (e.g. after changing attributes of the experiment object)
+        :param kwargs: passed to sweep (executor, max_workers, chunksize, batch, cache, mask, hooks, progress, ...)
+        :return: an incremental.IncrementalSweepResult with the directory of the merged data and the number of points
+                 that were run and reused
+        """
+        result = incremental.incremental_sweep(self, config, directory, force=force, **kwargs)
 
-            # save in python: #TODO
+        storages = _get_storages(storage, save_to_labber, labber_log_name, background_writer)
+        class_name = type(self).__name__
+        if storages:
+            result.write(storages, f'{class_name}_incremental_sweep')
+        return result
 
 
 class AsyncExperiment(Experiment):
+    """
+    an experiment where run(config) only submits a job and returns a handle (e.g. a simulator or hardware job), and
+    wait_result(handle) blocks until the job is done and returns its output Config.
+
+    sweep runs as a pipeline (see pipeline.run_pipeline): a bounded number of traces is in flight, each trace is
+    post-processed as soon as its jobs are done, and the traces are put back in grid order only when they are
+    written to labber / the storages. child classes can change what a trace is by overriding submit_trace and
+    collect_trace.
+    """
 
     def __init__(self):
         self._async_results = []
         self.results = []
 
-    @classmethod
-    def wait_result(async_result):
-        pass
+    def wait_result(self, async_result):
+        # to be implemented in child classes
+        raise NotImplementedError('wait_result method not implemented')
 
     def _run(self, args, **kwargs):
         self._async_results.append(self.run(*args, **kwargs))
@@ -300,145 +993,484 @@ class AsyncExperiment(Experiment):
         for result in self._async_results:
             self.results.append(self.wait_result(result))
 
+    def submit_trace(self, config: Config):
+        """
+        submits the jobs of one trace, without waiting for them.
+        :param config: a Config object with exactly one iterated Parameter (or several zipped ones)
+        :return: a handle that is passed to collect_trace
+        """
+        return [self.run(config.view(values)) for values in get_axis_points(config.get_axes()[0])]
+
+    def collect_trace(self, config: Config, handle):
+        """
+        waits for the jobs of one trace and post-processes them. called from a worker thread of the sweep pipeline.
+        :return: a dict with 'result_buffer' and 'labber_trace', like one_dimensional_sweep
+        """
+        result = ResultBuffer(len(handle))
+        for index, async_result in enumerate(handle):
+            result.set(index, self.wait_result(async_result))
+        return dict(result_buffer=result, labber_trace=result.get_labber_trace())
+
+    def get_traces_per_submit(self, trace_length):
+        """
+        how many consecutive traces of a sweep are submitted together (as one item of the pipeline). 1 by default.
+        """
+        return 1
+
+    def submit_traces(self, configs):
+        """
+        submits a group of consecutive traces (see get_traces_per_submit). by default calls submit_trace for each.
+        :return: a handle that is passed to collect_traces
+        """
+        return [self.submit_trace(config) for config in configs]
+
+    def collect_traces(self, configs, handle):
+        """
+        :return: a list with the collect_trace result of each trace in configs
+        """
+        return [self.collect_trace(config, trace_handle) for config, trace_handle in zip(configs, handle)]
+
+    def sweep(self, config, save_to_labber=True, labber_log_name=None, storage=None, max_in_flight=4,
+              max_workers=None, background_writer=True, profiler=None, progress=None):
+        """
+        submits the traces of an N-dimensional sweep (N = number of iterated Parameters in config, the last one is
+        the inner-most loop; zipped parameters are one loop) and writes their results as they come back.
+        :param config: a Config object with some iterated Parameters ("variables") and some constants
+        :param save_to_labber: bool.
+        :param labber_log_name: str, optional. by default '<class name>_sweep' with automatic numbering
+        :param storage: a storage.Storage object or a list of them, see Experiment.sweep
+        :param max_in_flight: int. max number of submissions (groups of get_traces_per_submit traces) in flight
+        :param max_workers: int, optional. number of threads collecting results (default max_in_flight)
+        :param background_writer: bool. see Experiment.sweep
+        :param profiler: profiling.SweepProfiler, optional. see Experiment.sweep. 'submit' is the time of submitting a
+                         group of traces, 'wait' the time of collecting it (waiting for the jobs and post-processing)
+        :param progress: see Experiment.sweep
+        :return: a list of the storage objects the data was written to
+        """
+        outer_grid = SweepGrid.from_config(config, outer=True)  # "outer" means all but the inner-most loop
+
+        storages = _get_storages(storage, save_to_labber, labber_log_name, background_writer)
+
+        # automatic naming:
+        class_name = type(self).__name__
+        log_name = f'{class_name}_sweep'
+
+        # (outer indices, trace config) for every outer-loop entry, in grid order:
+        traces = ((indices, config.view(outer_grid.get_dict(indices))) for indices, vals in outer_grid)
+        groups = chunked(traces, self.get_traces_per_submit(len(config.get_axes()[-1][0].value)))
+
+        opened = []
+        phase = profiler.phase if profiler is not None else (lambda name: nullcontext())
+
+        def submit(group):
+            with phase('submit'):
+                return self.submit_traces([trace_config for _, trace_config in group])
+
+        def collect(group, handle):
+            with phase('wait'):
+                return self.collect_traces([trace_config for _, trace_config in group], handle)
+
+        def sink(index, group, results):
+            for (indices, trace_config), result in zip(group, results):
+                if not opened:
+                    # the first trace defines the logged channels
+                    output_config = result["result_buffer"].get_configs((0,))[0]
+                    with phase('open'):
+                        for store in storages:
+                            store.open(config, output_config, log_name)
+                    opened.append(True)
+                with phase('write'):
+                    for store in storages:
+                        store.write_trace(indices, result["labber_trace"])
+                if profiler is not None:
+                    profiler.count('traces')
+                    profiler.count('points', result["result_buffer"].shape[0])
+                if reporter is not None:
+                    reporter.update(result["result_buffer"].shape[0])
+
+        reporter = get_progress_reporter(progress)
+        if reporter is not None:
+            reporter.start(len(SweepGrid.from_config(config)))
+        if profiler is not None:
+            profiler.start()
+        try:
+            run_pipeline(groups, submit=submit, collect=collect, sink=sink, max_in_flight=max_in_flight,
+                         max_workers=max_workers)
+            with phase('close'):
+                for store in storages if opened else []:
+                    store.flush()  # so that the report includes the queued writes
+            if reporter is not None:
+                reporter.finish()
+        finally:
+            _close_sweep(storages, profiler)
+
+        return storages
+
+
+class AsyncIOExperiment(Experiment):
+    """
+    an experiment whose points are coroutines, for instruments driven by asynchronous I/O. child classes implement the
+    two stages of a point as `async def` methods: prepare(config) (instrument setup, waveform upload, ...) and
+    measure(config, prepared) (acquisition), or the whole point in `async def run(config)`.
+
+    sweep runs the points on an asyncio event loop with pipeline_depth points in flight (see
+    asyncio_pipeline.run_points_async), so while a point is measured the next ones are already being prepared. the
+    points share the instruments through self.locks: a stage holds the locks of the resources it uses, e.g.
+        async def measure(self, config, prepared):
+            async with self.locks('digitizer', 'awg'):
+                ...
+    a resource goes to the points in the order they asked for it, which is not necessarily point order (see
+    asyncio_pipeline.ResourceLocks); the data is still written in point order. with pipeline_depth=1 the points run
+    one by one.
+    the sweeps of Experiment that call run synchronously (one_dimensional_sweep, adaptive_sweep, incremental_sweep)
+    raise TypeError.
+    asyncio is imported only when this class is used, to keep the import of this module light.
+    """
+
+    def __init__(self):
+        from asyncio_pipeline import ResourceLocks
+        self.locks = ResourceLocks()
+
+    async def prepare(self, config: Config):
+        """
+        the setup stage of a point. to be implemented in child classes (nothing by default).
+        :return: anything, passed to measure
+        """
+        return None
+
+    async def measure(self, config: Config, prepared):
+        """
+        the acquisition stage of a point. to be implemented in child classes (unless they implement run).
+        :param prepared: the return value of prepare
+        :return: the output Config of the point
+        """
+        raise NotImplementedError('measure method not implemented')
+
+    async def run(self, config: Config):
+        return await self.measure(config, await self.prepare(config))
+
+    def run_sync(self, config: Config):
+        """
+        runs one point on a new event loop (outside of a sweep)
+        """
+        import asyncio
+        from asyncio_pipeline import ResourceLocks
+        self.locks = ResourceLocks()
+        return asyncio.run(self.run(config))
+
+    def _not_supported(self, name):
+        return TypeError(f"{type(self).__name__}.{name} is not supported: the run method of an AsyncIOExperiment is a "
+                         f"coroutine. use sweep (or sweep_async), or run_sync for a single point")
+
+    def one_dimensional_sweep(self, config, *args, **kwargs):
+        raise self._not_supported('one_dimensional_sweep')
+
+    def adaptive_sweep(self, config, *args, **kwargs):
+        raise self._not_supported('adaptive_sweep')
+
+    def incremental_sweep(self, config, directory, *args, **kwargs):
+        raise self._not_supported('incremental_sweep')
+
+    def sweep(self, config, save_to_labber=True, labber_log_name=None, storage=None, pipeline_depth=2,
+              background_writer=True, profiler=None, progress=None):
+        """
+        runs an N-dimensional sweep (N = number of iterated Parameters in config, the last one is the inner-most loop;
+        zipped parameters are one loop) on a new event loop, and writes every trace when its points are done.
+        from code that already runs an event loop (e.g. a notebook), await sweep_async instead.
+        :param config: a Config object with some iterated Parameters ("variables") and some constants
+        :param save_to_labber: bool.
+        :param labber_log_name: str, optional. by default '<class name>_sweep' with automatic numbering
+        :param storage: a storage.Storage object or a list of them, see Experiment.sweep
+        :param pipeline_depth: int. max number of points in flight (being prepared or measured)
+        :param background_writer: bool. see Experiment.sweep. also keeps the labber writes from blocking the event loop
+        :param profiler: profiling.SweepProfiler, optional. see Experiment.sweep ('open', 'write' and 'close' phases)
+        :param progress: see Experiment.sweep
+        :return: a list of the storage objects the data was written to
+        :raise SweepPointError: if run raised for some point
+        """
+        import asyncio
+        return asyncio.run(self.sweep_async(config, save_to_labber=save_to_labber, labber_log_name=labber_log_name,
+                                            storage=storage, pipeline_depth=pipeline_depth,
+                                            background_writer=background_writer, profiler=profiler, progress=progress))
+
+    async def sweep_async(self, config, save_to_labber=True, labber_log_name=None, storage=None, pipeline_depth=2,
+                          background_writer=True, profiler=None, progress=None):
+        """
+        the coroutine of sweep, see there
+        """
+        from asyncio_pipeline import ResourceLocks, run_points_async
+        outer_grid = SweepGrid.from_config(config, outer=True)  # "outer" means all but the inner-most loop
+        trace_length = len(config.get_axes()[-1][0].value)
+        self.locks = ResourceLocks()  # asyncio locks belong to one event loop
+
+        storages = _get_storages(storage, save_to_labber, labber_log_name, background_writer)
+
+        # automatic naming:
+        class_name = type(self).__name__
+        log_name = f'{class_name}_sweep'
+
+        def point_configs():
+            for indices, vals in outer_grid:
+                trace_config = config.view(outer_grid.get_dict(indices))
+                for values in get_axis_points(trace_config.get_axes()[0]):
+                    yield trace_config.view(values)
+
+        opened = []
+        trace = []  # the ResultBuffer of the trace being assembled
+        phase = profiler.phase if profiler is not None else (lambda name: nullcontext())
+
+        def sink(index, point_config, output_config):
+            trace_index, point_index = divmod(index, trace_length)
+            if point_index == 0:
+                trace[:] = [ResultBuffer(trace_length)]
+            result = trace[0]
+            result.set(point_index, output_config)
+            if reporter is not None:
+                reporter.update(1)
+            if point_index < trace_length - 1:
+                return
+            if not opened:
+                # the first trace defines the logged channels
+                with phase('open'):
+                    for store in storages:
+                        store.open(config, output_config, log_name)
+                opened.append(True)
+            indices = tuple(int(i) for i in np.unravel_index(trace_index, outer_grid.shape))
+            with phase('write'):
+                for store in storages:
+                    store.write_trace(indices, result.get_labber_trace())
+            if profiler is not None:
+                profiler.count('traces')
+                profiler.count('points', trace_length)
+
+        reporter = get_progress_reporter(progress)
+        if reporter is not None:
+            reporter.start(len(SweepGrid.from_config(config)))
+        if profiler is not None:
+            profiler.start()
+        try:
+            await run_points_async(self.run, point_configs(), sink, pipeline_depth=pipeline_depth)
+            with phase('close'):
+                for store in storages if opened else []:
+                    store.flush()  # so that the report includes the queued writes
+            if reporter is not None:
+                reporter.finish()
+        finally:
+            _close_sweep(storages, profiler)
+        return storages
+
+
+def stack_density_matrices(density_matrices):
+    """
+    :param density_matrices: a list of density matrices (qiskit DensityMatrix objects or numpy arrays) of equal size
+    :return: numpy array of shape (n, d, d)
+    """
+    return np.stack([np.asarray(getattr(density_mat, 'data', density_mat)) for density_mat in density_matrices])
+
+
+def get_populations(density_matrices):
+    """
+    :param density_matrices: numpy array of shape (n, d, d)
+    :return: numpy array of shape (n, d) - the probabilities of the basis states (the real diagonals)
+    """
+    return np.diagonal(density_matrices, axis1=-2, axis2=-1).real
+
+
+def get_expectation_values(density_matrices, operator):
+    """
+    :param density_matrices: numpy array of shape (n, d, d)
+    :param operator: a hermitian d x d matrix (numpy array, or anything with a to_matrix method, e.g. a qiskit
+                     Operator or Pauli)
+    :return: numpy array of shape (n,) - tr(operator @ rho) of every density matrix rho
+    """
+    operator = operator.to_matrix() if hasattr(operator, 'to_matrix') else np.asarray(operator)
+    return np.einsum('ij,nji->n', operator, density_matrices).real
+
 
 class QiskitExperimentDensityMat(AsyncExperiment):
     """
     an experiment done on qiskit simulator where each run is the execution of a single circuit, saving the resulting
     density matrix, and then calcualting some observable(s) from it.
+
+    by default every point's circuit is built with get_circ. a child class can implement get_parameterized_circ
+    instead, so that the circuit is built and transpiled once per trace (cached by backend and the other parameters)
+    and only the traced value is bound per point. in a sweep, set circuits_per_job to submit several traces per job
+    (or split a long trace into several jobs). by default every trace is one job.
+
+    the observables are computed by get_observables per density matrix, or, if a child class implements
+    get_observables_batch, once per trace from all its density matrices stacked in one array (see get_populations and
+    get_expectation_values).
     """
 
+    circuits_per_job = None  # max number of circuits in one job of a sweep. None - one job per trace
+    circuit_cache_size = 64  # max number of cached parameterized circuits
+
+    def __init__(self):
+        super().__init__()
+        self._circuit_cache = OrderedDict()  # key -> (backend, (circuit, circuit parameters))
+
     def get_circ(self, config:Config):
         #to be implemented in child class
         raise  NotImplemented('get_circ method not implemented')
 
+    def get_parameterized_circ(self, config: Config):
+        """
+        optionally implemented in child classes instead of get_circ.
+        :param config: a Config in which the traced parameter is iterated (its value is the whole axis)
+        :return: tuple (circ, circuit_parameters). circ - a circuit, ready to run on config.backend.value (i.e.
+                 transpiled), in which the traced parameter (and possibly other parameters) is a qiskit circuit
+                 Parameter. circuit_parameters - dict {config parameter name: qiskit circuit Parameter}
+        """
+        raise NotImplementedError('get_parameterized_circ method not implemented')
+
+    def has_parameterized_circ(self):
+        return type(self).get_parameterized_circ is not QiskitExperimentDensityMat.get_parameterized_circ
+
+    def get_cached_parameterized_circ(self, config: Config):
+        """
+        get_parameterized_circ(config), cached by the backend and the values of all the other parameters except the
+        traced one(s).
+        """
+        traced_names = {param.name for param in config.get_axes()[0]}
+        backend = config.backend.value
+        try:
+            key = config_hash(Config(*[param for param in config.param_list
+                                       if param.name not in traced_names and param.name != 'backend']))
+        except UnhashableConfigError:
+            return self.get_parameterized_circ(config)
+
+        cached = self._circuit_cache.get(key)
+        if cached is not None and cached[0] is backend:
+            self._circuit_cache.move_to_end(key)
+            return cached[1]
+        parameterized = self.get_parameterized_circ(config)
+        self._circuit_cache[key] = (backend, parameterized)
+        while len(self._circuit_cache) > self.circuit_cache_size:
+            self._circuit_cache.popitem(last=False)
+        return parameterized
+
+    def get_trace_circuits(self, config: Config):
+        """
+        :param config: a Config object with exactly one iterated Parameter (or several zipped ones)
+        :return: a list with the circuit of every point of the trace
+        """
+        trace_params = config.get_axes()[0]
+        if not self.has_parameterized_circ():
+            # shares the backend and other constants
+            return [self.get_circ(config.view(values)) for values in get_axis_points(trace_params)]
+
+        circ, circuit_parameters = self.get_cached_parameterized_circ(config)
+        traced_names = {param.name for param in trace_params}
+        # parameters other than the traced ones are the same for the whole trace:
+        constant_values = {circuit_param: getattr(config, name).value
+                           for name, circuit_param in circuit_parameters.items() if name not in traced_names}
+        return [circ.assign_parameters({**constant_values, **{circuit_parameters[name]: val
+                                                              for name, val in values.items()
+                                                              if name in circuit_parameters}})
+                for values in get_axis_points(trace_params)]
+
     def run(self, config: Config):
         job = config.backend.value.run(self.get_circ(config))
         return job
 
     def wait_result(self, job):
         # return a list of density matrix objects
-        result = []
-        for i in range(len(job.result().results)):
-            result.append(job.result().data(i)["density_matrix"])
-        return result
-
-    def one_dimensional_job(self, config: Config):
-        variable_param = config.get_iterables()[0]
-        circs = []
-        for val in variable_param.value:
-            current_param = Parameter(variable_param.name, val, units=variable_param.units)
-            current_config = deepcopy(config)
-            current_config.set_parameter(name=current_param.name, value=current_param.value)
-            # print(current_config.param_list)
-            circs.append(self.get_circ(current_config))
-
-        job = config.backend.value.run(circs)
-        self._async_results.append(job)
-        return job
+        result = job.result()  # blocks until the job is done
+        return [result.data(i)["density_matrix"] for i in range(len(result.results))]
 
-    def sweep(self, config):
-        self.sweep_jobs = []
-        self.sweep_configs = []
-        variable_config = Config(*config.get_iterables())  # a Config with only the variables
+    def submit_trace(self, config: Config):
+        return config.backend.value.run(self.get_trace_circuits(config))
 
-        # the last variable is the trace parameter (inner-most loop):
-        tracing_parameter = variable_config.param_list[-1]
+    def collect_trace(self, config: Config, job):
+        return self.get_observables_1D(config, job)
 
-        curr_config = deepcopy(config)
-        for variable in variable_config.param_list[:-1]:
-            curr_config.set_parameter(name=variable.name, value=0)
+    def get_traces_per_submit(self, trace_length):
+        if self.circuits_per_job is None:
+            return 1
+        return max(1, self.circuits_per_job // trace_length)
 
-        outer_variables = Config(*variable_config.param_list[:-1])  # "outer" means all but the inner-most loop
-        # N-dimensional loop with itertools.product: # (actually N-1 )
+    def submit_traces(self, configs):
+        if self.circuits_per_job is None:
+            return super().submit_traces(configs)
 
+        # all the circuits of the group, in jobs of up to circuits_per_job circuits:
+        circs = []
+        for config in configs:
+            circs.extend(self.get_trace_circuits(config))
+        backend = configs[0].backend.value
+        return [backend.run(job_circs) for job_circs in chunked(circs, self.circuits_per_job)]
+
+    def collect_traces(self, configs, handle):
+        if self.circuits_per_job is None:
+            return super().collect_traces(configs, handle)
+
+        density_matrices = []
+        for job in handle:
+            density_matrices.extend(self.wait_result(job))
+        results = []
+        start = 0
+        for config in configs:
+            trace_length = len(config.get_axes()[0][0].value)
+            results.append(self.get_observables_trace(config, density_matrices[start:start + trace_length]))
+            start += trace_length
+        return results
 
-        for indices, vals in enumerated_product(*outer_variables.get_values()):
-            # update parameters to current values:
-            for i, param in enumerate(outer_variables.param_list):
-                curr_config.set_parameter(name=param.name, value=vals[i])
-
-            print("running...")
-            # do 1D sweep on the tracing parameter:
-            print(curr_config.param_list) #TODO only print sweep parameters
-            job = self.one_dimensional_job(curr_config)
-            self.sweep_jobs.append(job)
-            self.sweep_configs.append(deepcopy(curr_config))
+    def one_dimensional_job(self, config: Config):
+        job = self.submit_trace(config)
+        self._async_results.append(job)
+        return job
 
     def get_observables(self,config:Config, density_matrix):
         # to be implemented in child class
         # should return an output Config object
         pass
 
-    def get_observables_1D(self,config, job):
-        #returns a dict with output config list, and labber trace
-
-        # input verification
-        if not len(config.get_iterables()) == 1:
-            raise ValueError("config must have exactly one iterable Parameter")
-
-        variable_param = config.get_iterables()[0]
-
-        density_matrices = self.wait_result(job)
-        output_config = []
-        config_scalar = deepcopy(config)
-        for index, density_mat in enumerate(density_matrices):
-            config_scalar.set_parameter(name=variable_param.name, value=variable_param.value[index])
-            output_config.append(self.get_observables(config_scalar, density_mat))
-
-        labber_trace = get_labber_trace(output_config)
+    def get_observables_batch(self, config: Config, density_matrices):
+        """
+        optional vectorized version of get_observables, called once per trace when a child class implements it.
+        :param config: a Config object with exactly one iterated Parameter (the traced one)
+        :param density_matrices: numpy array of shape (n, d, d) - the density matrices of the n points of the trace
+        :return: an output Config whose values have the trace length n as their leading axis (like the output of
+                 Experiment.run_batch)
+        """
+        # optionally implemented in child classes
+        raise NotImplementedError('get_observables_batch method not implemented')
 
-        return dict(output_config=output_config, labber_trace=labber_trace)
+    def has_observables_batch(self):
+        return type(self).get_observables_batch is not QiskitExperimentDensityMat.get_observables_batch
 
+    def get_observables_1D(self,config, job):
+        #returns a dict with a ResultBuffer of the output data, and labber trace
 
-    def labber_read(self,config, labber_log_name=None):
-        # create labber log file for nd loop according to config
-        # add entries from self.sweep_jobs using self.get_observables and self.wait_reaults
-        variable_config = Config(*config.get_iterables())  # a Config with only the variables
+        # input verification
+        if not len(config.get_axes()) == 1:
+            raise ValueError("config must have exactly one iterable Parameter (or several zipped ones)")
 
-        # the last variable is the trace parameter (inner-most loop):
-        tracing_parameter = variable_config.param_list[-1]
+        return self.get_observables_trace(config, self.wait_result(job))
 
-        # get labber step list:
-        step_list = variable_config.get_labber_step_list()
+    def get_observables_trace(self, config, density_matrices):
+        """
+        :param config: a Config object with exactly one iterated Parameter (or several zipped ones)
+        :param density_matrices: the density matrices of the points of the trace, in order
+        :return: a dict with a ResultBuffer of the output data, and labber trace
+        """
+        if self.has_observables_batch():
+            output_config = self.get_observables_batch(config, stack_density_matrices(density_matrices))
+            result = ResultBuffer(len(density_matrices))
+            result.allocate(output_config, batch_ndim=1)
+            result.set_values((), {param.name: param.value for param in output_config.param_list})
+            return dict(result_buffer=result, labber_trace=result.get_labber_trace())
 
-        # get observables from one iteration of first job: #TODO: check that a job exists
-        single_run_rho = self.wait_result(self.sweep_jobs[0])[0]
-        single_run_config = deepcopy(config)
-        for var in variable_config.param_list:
-            single_run_config.set_parameter(name=var.name, value=var.value[0])
+        point_values = get_axis_points(config.get_axes()[0])
 
-        single_run_observables = self.get_observables(single_run_config, single_run_rho)
+        result = ResultBuffer(len(density_matrices))
+        for index, density_mat in enumerate(density_matrices):
+            config_scalar = config.view(point_values[index])
+            result.set(index, self.get_observables(config_scalar, density_mat))
 
-        #get labber log list
-        log_list = single_run_observables.get_labber_log_list()
+        labber_trace = result.get_labber_trace()
 
-        # build labber logfile
-        # automatic naming:
-        if labber_log_name:
-            log_name = labber_log_name
-        else:
-            class_name = type(self).__name__
-            log_name = f'{class_name}_sweep'
-
-        log_name = lu.get_log_name(log_name)  # adds automatic numbering to avoid overwrite
-        # create log file
-        logfile = Labber.createLogFile_ForData(log_name, log_list, step_list)
-        # add comment w. metadata
-        logfile.setComment(str(config.get_metadata_table()))
-
-        # print("labber log")
-        # print(log_list)
-        # print("labber step")
-        # print(step_list)
-
-        for index, job in enumerate(self.sweep_jobs):
-            print(self.sweep_configs[index].param_list) #TODO only pring sweep parameters
-            result = self.get_observables_1D(self.sweep_configs[index], job)
-            labber_trace = result["labber_trace"]
-            #
-            # print("labber trace")
-            # print(labber_trace)
-            logfile.addEntry(labber_trace)
+        return dict(result_buffer=result, labber_trace=labber_trace)
 
 
 
@@ -8,4 +8,15 @@ Created on Sun Jun  5 12:57:13 2022
 
 import itertools
 def enumerated_product(*args):
-    yield from zip(itertools.product(*(range(len(x)) for x in args)), itertools.product(*args))
\ No newline at end of file
+    yield from zip(itertools.product(*(range(len(x)) for x in args)), itertools.product(*args))
+
+def chunked(iterable, size):
+    # yields lists of (up to) size consecutive items of iterable
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
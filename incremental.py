@@ -0,0 +1,254 @@
+"""
+incremental re-sweeps: re-running a sweep after a small change of its Config runs only the grid points that are new
+or whose data is no longer valid, and merges them with the data of the previous run.
+
+the data lives in a MemmapStorage directory, together with manifest.json - a description of the sweep that produced
+it: the experiment class, a hash of every constant Parameter, and the axes of the grid with a key for every value.
+the next run matches its grid against the manifest:
+- if the experiment class, a constant, the set of parameters or the axis structure (which parameters are iterated and
+  zipped together) changed, every point is run again.
+- otherwise, a point is reused if the values of all its axes were in the previous grid and it was run there; the
+  other points (e.g. the values added to an axis) are run. numeric values are matched to 12 significant digits, so
+  re-generating an axis (np.linspace with more points, ...) still matches the values it shares with the old one.
+attributes of the experiment object itself are not compared - pass force=True after changing them.
+"""
+
+import json
+import numbers
+import os
+import shutil
+
+import numpy as np
+
+from result_buffer import ResultBuffer
+from result_cache import parameter_hash, value_hash
+from storage import MemmapStorage, get_grid_shape
+from sweep_grid import SweepGrid
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def get_value_key(value):
+    """
+    :return: str. the key by which an axis value is matched between runs
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return f'b:{bool(value)}'
+    if isinstance(value, numbers.Real):
+        return f'n:{float(value):.12g}'
+    if isinstance(value, numbers.Complex):
+        return f'c:{complex(value).real:.12g},{complex(value).imag:.12g}'
+    return f'h:{value_hash(value)}'
+
+
+class SweepManifest:
+    """
+    what an incremental sweep compares between runs (see the module docstring)
+    """
+
+    def __init__(self, experiment, constants, axes, axis_keys):
+        """
+        :param experiment: str. the qualified name of the experiment class
+        :param constants: dict {name: hash} of the constant Parameters
+        :param axes: list with a list of [name, units] of the parameters of every grid axis
+        :param axis_keys: list with the list of value keys of every grid axis
+        """
+        self.experiment = experiment
+        self.constants = constants
+        self.axes = axes
+        self.axis_keys = axis_keys
+
+    @classmethod
+    def from_config(cls, experiment, config):
+        """
+        :raise UnhashableConfigError: if a constant or an axis value can't be hashed
+        """
+        experiment_type = type(experiment)
+        axes = config.get_axes()
+        axis_keys = []
+        for params in axes:
+            # a zipped axis is matched by the values of all its parameters together
+            axis_keys.append(['|'.join(get_value_key(value) for value in values)
+                              for values in zip(*[param.value for param in params])])
+        return cls(experiment=f'{experiment_type.__module__}.{experiment_type.__qualname__}',
+                   constants={param.name: parameter_hash(param).hex() for param in config.get_constants()},
+                   axes=[[[param.name, param.units] for param in params] for params in axes],
+                   axis_keys=axis_keys)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        :return: the manifest in directory, or None if there is none
+        """
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, directory):
+        with open(os.path.join(directory, MANIFEST_NAME), 'w') as f:
+            json.dump(dict(experiment=self.experiment, constants=self.constants, axes=self.axes,
+                           axis_keys=self.axis_keys), f)
+
+    def match(self, old):
+        """
+        :param old: the SweepManifest of the previous run
+        :return: a list with an int array for every axis of self - the index of each value in the axis of old (-1 for
+                 a new value), or None if nothing can be reused
+        """
+        if (self.experiment != old.experiment or self.constants != old.constants or self.axes != old.axes):
+            return None
+        old_indices = []
+        for keys, old_keys in zip(self.axis_keys, old.axis_keys):
+            positions = {key: index for index, key in enumerate(old_keys)}
+            old_indices.append(np.array([positions.get(key, -1) for key in keys], dtype=int))
+        return old_indices
+
+
+def get_reused_mask(old_indices, old_mask):
+    """
+    :param old_indices: the result of SweepManifest.match
+    :param old_mask: bool array of the old grid shape. the points that have data
+    :return: bool array of the new grid shape. True - the data of the point is taken from the old grid
+    """
+    mask = old_mask[np.ix_(*[np.maximum(indices, 0) for indices in old_indices])]
+    for axis, indices in enumerate(old_indices):
+        shape = [1] * len(old_indices)
+        shape[axis] = len(indices)
+        mask = mask & (indices >= 0).reshape(shape)
+    return mask
+
+
+def _copy_reused(arrays, old_arrays, reused, old_indices, directory):
+    """
+    copies the reused points from the arrays of the previous run, trace by trace
+    """
+    n_grid = reused.ndim
+    for name, array in arrays.items():
+        old_array = old_arrays[name]
+        if old_array.shape[n_grid:] != array.shape[n_grid:] or old_array.dtype != array.dtype:
+            raise ValueError(f"output {name!r} changed its shape or type since the previous run in {directory}; "
+                             f"run with force=True")
+        for indices in np.ndindex(*reused.shape[:-1]):
+            trace_reused = reused[indices]
+            if trace_reused.any():
+                old_trace = old_array[tuple(axis_indices[i] for axis_indices, i in zip(old_indices, indices))]
+                array[indices][trace_reused] = old_trace[old_indices[-1][trace_reused]]
+
+
+class IncrementalSweepResult:
+    """
+    the result of an incremental sweep: the merged data in a MemmapStorage directory.
+    n_points - points in the grid, n_reused - points taken from the previous run, n_run - points run now
+    """
+
+    def __init__(self, config, directory, n_points, n_reused, n_run):
+        self.config = config
+        self.directory = directory
+        self.n_points = n_points
+        self.n_reused = n_reused
+        self.n_run = n_run
+
+    def load(self, mode='r'):
+        """
+        :return: tuple (arrays, axes, metadata), see MemmapStorage.load
+        """
+        return MemmapStorage.load(self.directory, mode)
+
+    def write(self, storages, name):
+        """
+        writes the merged data to storage objects (e.g. LabberStorage), trace by trace in grid order
+        """
+        arrays, axes, metadata = self.load()
+        grid_shape = get_grid_shape(self.config)
+        buffer = ResultBuffer(grid_shape)
+        buffer.columns = arrays
+        buffer.log_list = metadata['log_list']
+        output_config = buffer.get_configs((0,) * (len(grid_shape) - 1))[0]
+        mask = metadata.get('mask')
+        try:
+            for store in storages:
+                store.open(self.config, output_config, name, mask=mask)
+            for indices in np.ndindex(*grid_shape[:-1]):
+                trace = {log['name']: np.asarray(arrays[log['name']][indices]) for log in metadata['log_list']}
+                for store in storages:
+                    store.write_trace(indices, trace)
+        finally:
+            for store in storages:
+                store.close()
+
+
+def incremental_sweep(experiment, config, directory, force=False, mask=None, **kwargs):
+    """
+    runs the points of config that are not in the data of the previous run in directory (all of them on the first
+    run), and writes the merged data to directory.
+    :param experiment: Experiment object
+    :param config: the Config of the sweep
+    :param directory: str. the MemmapStorage directory of the data (created on the first run)
+    :param force: bool. run every point, ignoring the previous data
+    :param mask: the points to run at most, see Experiment.sweep. points masked out are NaN, also if the previous run
+                 has them
+    :param kwargs: passed to Experiment.sweep (executor, max_workers, chunksize, batch, cache, hooks, progress, ...)
+    :return: an IncrementalSweepResult
+    """
+    manifest = SweepManifest.from_config(experiment, config)
+    old_manifest = None if force else SweepManifest.load(directory)
+    old_indices = manifest.match(old_manifest) if old_manifest is not None else None
+
+    grid_shape = get_grid_shape(config)
+    if old_indices is not None:
+        old_arrays, _, old_metadata = MemmapStorage.load(directory)
+        old_mask = old_metadata.get('mask')
+        if old_mask is None:
+            old_mask = np.ones(tuple(len(keys) for keys in old_manifest.axis_keys), dtype=bool)
+        reused = get_reused_mask(old_indices, old_mask)
+    else:
+        old_arrays = None
+        reused = np.zeros(grid_shape, dtype=bool)
+
+    to_run = ~reused
+    if mask is not None:
+        user_mask = SweepGrid.from_config(config).get_mask(mask)
+        to_run &= user_mask
+        reused &= user_mask
+
+    new_directory = f'{directory}.incremental'
+    if os.path.exists(new_directory):
+        shutil.rmtree(new_directory)  # left by an interrupted run
+    store = MemmapStorage(new_directory)
+    experiment.sweep(config, save_to_labber=False, storage=store, mask=None if to_run.all() else to_run, **kwargs)
+    run_mask = to_run if store.mask is None else store.mask  # hooks may have run less
+
+    if reused.any():
+        _copy_reused(store.arrays, old_arrays, reused, old_indices, directory)
+    store.close()
+
+    # the mask of the merged data: the points that have data, from either run
+    data_mask = reused | run_mask
+    mask_path = os.path.join(new_directory, 'mask.npy')
+    if data_mask.all():
+        if os.path.exists(mask_path):
+            os.remove(mask_path)
+    else:
+        np.save(mask_path, data_mask)
+    with open(os.path.join(new_directory, 'metadata.json')) as f:
+        metadata = json.load(f)
+    metadata['masked'] = not data_mask.all()
+    with open(os.path.join(new_directory, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=1)
+    manifest.save(new_directory)
+
+    # replace the old data (the memory maps are closed first, so that this also works on Windows)
+    store.buffer = None
+    old_arrays = None
+    if os.path.exists(directory):
+        old_directory = f'{directory}.old'
+        os.replace(directory, old_directory)
+        os.replace(new_directory, directory)
+        shutil.rmtree(old_directory)
+    else:
+        os.replace(new_directory, directory)
+
+    return IncrementalSweepResult(config, directory, n_points=int(np.prod(grid_shape)),
+                                  n_reused=int(np.count_nonzero(reused)), n_run=int(np.count_nonzero(run_mask)))
@@ -0,0 +1,127 @@
+"""
+writes labber log entries on a background thread, so that slow disk/HDF5 writes do not stall the sweep loop.
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+
+def get_trace_nbytes(trace: dict):
+    return sum(np.asarray(value).nbytes for value in trace.values())
+
+
+class BackgroundLogWriter:
+    """
+    a queue in front of a labber LogFile (or anything with an addEntry method).
+
+    add_entry only queues the trace. a background thread takes up to batch_size queued entries at a time and writes
+    them one after the other with logfile.addEntry, so one wake-up of the writer handles several outer-loop entries.
+    the queue is bounded by max_pending entries and max_pending_bytes bytes: when it is full add_entry blocks until the
+    writer catches up (backpressure), so a slow disk slows the sweep down instead of filling the memory.
+
+    the entries are written in the order they were added. call close() (or use the writer as a context manager) to
+    write everything that is still queued - it is safe to call from a finally block after a KeyboardInterrupt.
+    an exception raised by addEntry in the writer thread stops the writer and is raised by the following
+    add_entry/flush calls (and by close, if it was not raised before).
+    """
+
+    def __init__(self, logfile, batch_size=8, max_pending=32, max_pending_bytes=256 * 2 ** 20):
+        """
+        :param logfile: a labber LogFile object, as returned by Labber.createLogFile_ForData
+        :param batch_size: int. max number of entries written per wake-up of the writer thread
+        :param max_pending: int. max number of queued entries before add_entry blocks
+        :param max_pending_bytes: int. max total size of the queued entries before add_entry blocks. a single entry
+                                  larger than this is still accepted when the queue is empty.
+        """
+        self.logfile = logfile
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+
+        self._queue = deque()
+        self._pending_bytes = 0
+        self._in_progress = 0  # entries taken from the queue but not written yet
+        self._closed = False
+        self._error = None
+        self._error_reported = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._write_loop, name='BackgroundLogWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _raise_error(self, only_once=False):
+        if self._error is not None and not (only_once and self._error_reported):
+            self._error_reported = True
+            raise self._error
+
+    def _is_full(self):
+        return self._queue and (len(self._queue) >= self.max_pending or self._pending_bytes >= self.max_pending_bytes)
+
+    def add_entry(self, trace: dict):
+        """
+        queues a trace for logfile.addEntry. the arrays in trace must not be changed after this call.
+        """
+        nbytes = get_trace_nbytes(trace)
+        with self._condition:
+            if self._closed:
+                raise ValueError("add_entry called on a closed writer")
+            while self._is_full() and self._error is None:
+                self._condition.wait(0.1)
+            self._raise_error()
+            self._queue.append((trace, nbytes))
+            self._pending_bytes += nbytes
+            self._condition.notify_all()
+
+    def flush(self):
+        """
+        blocks until every queued entry has been written.
+        """
+        with self._condition:
+            while (self._queue or self._in_progress) and self._error is None and self._thread.is_alive():
+                self._condition.wait(0.1)  # timeout keeps the wait interruptible with ctrl+c
+            self._raise_error()
+
+    def close(self):
+        """
+        writes the remaining entries and stops the writer thread. calling close more than once does nothing.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        while self._thread.is_alive():
+            self._thread.join(0.1)
+        self._raise_error(only_once=True)  # don't re-raise an error that add_entry/flush already raised
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:  # closed and nothing left
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_progress = len(batch)
+            try:
+                for trace, nbytes in batch:
+                    self.logfile.addEntry(trace)
+            except BaseException as e:
+                with self._condition:
+                    self._error = e
+                    self._queue.clear()
+                    self._pending_bytes = 0
+                    self._in_progress = 0
+                    self._condition.notify_all()
+                return
+            with self._condition:
+                self._pending_bytes -= sum(nbytes for trace, nbytes in batch)
+                self._in_progress = 0
+                self._condition.notify_all()
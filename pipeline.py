@@ -0,0 +1,97 @@
+"""
+a futures based submit/collect pipeline for asynchronous experiments (e.g. simulator or hardware jobs).
+"""
+
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ReorderBuffer:
+    """
+    takes items that arrive in any order, each with its index, and releases them in index order.
+    """
+
+    def __init__(self, start=0):
+        self.next_index = start
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, index, item):
+        """
+        :return: a list of (index, item) that are ready, in index order (possibly empty)
+        """
+        self._pending[index] = item
+        ready = []
+        while self.next_index in self._pending:
+            ready.append((self.next_index, self._pending.pop(self.next_index)))
+            self.next_index += 1
+        return ready
+
+
+def run_pipeline(items, submit, collect, sink, max_in_flight=4, max_workers=None):
+    """
+    overlaps job submission, waiting and post-processing:
+
+    submit(item) is called in the calling thread, in order, and returns a handle (e.g. a job). at most max_in_flight
+    items are submitted but not yet collected. collect(item, handle) waits for the job and post-processes its result;
+    it runs in a thread pool, so the items are collected in completion order as soon as each job is done. the results
+    are then put back in the order of items, and sink(index, item, result) is called in the calling thread in that order
+    (e.g. to write to labber, which needs grid order).
+
+    :param items: iterable of work items, in the order the sink should get them
+    :param submit: callable(item) -> handle
+    :param collect: callable(item, handle) -> result. must be thread safe
+    :param sink: callable(index, item, result)
+    :param max_in_flight: int. max number of submitted and not yet collected items
+    :param max_workers: int, optional. number of collecting threads (default max_in_flight)
+    """
+    reorder = ReorderBuffer()
+    in_flight = {}  # future -> (index, item)
+    pool = ThreadPoolExecutor(max_workers=max_workers or max_in_flight)
+
+    def drain():
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, item = in_flight.pop(future)
+            for ready_index, (ready_item, result) in reorder.put(index, (item, future.result())):
+                sink(ready_index, ready_item, result)
+
+    try:
+        for index, item in enumerate(items):
+            while len(in_flight) >= max_in_flight:
+                drain()
+            handle = submit(item)
+            in_flight[pool.submit(collect, item, handle)] = (index, item)
+        while in_flight:
+            drain()
+    except BaseException:
+        # don't wait for the jobs that are still running
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def map_ordered(fn, items, max_in_flight=4):
+    """
+    a generator counterpart of run_pipeline: calls fn(item) in a thread pool for up to max_in_flight items at a time,
+    and yields (item, result) in the order of items. the next items keep running while the consumer handles a result.
+    if the consumer stops early (or fn raises), the items that did not start are cancelled.
+    :param fn: callable(item) -> result. must be thread safe
+    :param items: iterable of work items
+    :param max_in_flight: int. max number of items running or waiting to be yielded
+    """
+    in_flight = collections.deque()  # (item, future) in the order of items
+    pool = ThreadPoolExecutor(max_workers=max_in_flight)
+    try:
+        for item in items:
+            if len(in_flight) >= max_in_flight:
+                head_item, future = in_flight.popleft()
+                yield head_item, future.result()
+            in_flight.append((item, pool.submit(fn, item)))
+        while in_flight:
+            head_item, future = in_flight.popleft()
+            yield head_item, future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
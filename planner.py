@@ -0,0 +1,177 @@
+"""
+loop-order planning for sweeps in which some parameters are slow to change (instrument settling, backend
+reconfiguration) and others are cheap.
+
+the cost of changing a parameter is a hint on the Parameter (Parameter(..., cost=...)). a plan is an execution order of
+the iterated parameters (outer-most first, the last one is traced) and optionally a snake (boustrophedon) walk of the
+grid, in which every loop reverses direction instead of jumping back to its first value. the plan only changes the
+order in which the points are run - the data is put back in the declared grid order of the config.
+"""
+
+import itertools
+
+import numpy as np
+
+from result_buffer import ResultBuffer
+
+
+def get_change_counts(shape, snake=False):
+    """
+    :param shape: the number of values of each loop, outer-most first
+    :param snake: bool. boustrophedon walk
+    :return: a list with the number of times each loop variable is set to a new value during the sweep (including the
+             first time)
+    """
+    counts = []
+    n_outer = 1
+    for n in shape:
+        if n <= 1:
+            counts.append(1)
+        elif snake:
+            counts.append(n_outer * (n - 1) + 1)  # no jump back at the end of a pass
+        else:
+            counts.append(n_outer * n)
+        n_outer *= n
+    return counts
+
+
+def snake_product(shape):
+    """
+    the multi-indices of a grid in boustrophedon order: every axis reverses direction each time an outer axis steps, so
+    consecutive indices differ in a single axis, by one.
+    """
+    if not shape:
+        yield ()
+        return
+    inner = list(snake_product(shape[1:]))
+    for i in range(shape[0]):
+        for rest in (inner if i % 2 == 0 else reversed(inner)):
+            yield (i,) + rest
+
+
+class SweepPlan:
+    """
+    the order in which a sweep runs its grid: order - the names of the iterated parameters, outer-most loop first
+    (the last one is the traced parameter), snake - whether the loops walk the grid in boustrophedon order.
+    """
+
+    def __init__(self, order, snake=False):
+        self.order = list(order)
+        self.snake = snake
+
+    def __repr__(self):
+        return f"{type(self).__name__}(order={self.order!r}, snake={self.snake!r})"
+
+    def is_declared_order(self, config):
+        """
+        whether running the plan is the same as running the config in its declared order
+        """
+        variables = config.get_iterables()
+        return self.order == [param.name for param in variables] and (not self.snake or len(variables) < 2)
+
+    def estimate_cost(self, config):
+        """
+        :return: float. the total cost of the parameter changes when running config with this plan, according to the
+                 cost hints of its iterated parameters
+        """
+        params = [getattr(config, name) for name in self.order]
+        counts = get_change_counts([len(param.value) for param in params], self.snake)
+        return float(sum((param.cost or 0) * count for param, count in zip(params, counts)))
+
+
+def plan_loop_order(config, snake=False):
+    """
+    chooses the loop order that minimizes the total cost of parameter changes.
+    a loop variable that has n values and is nested inside loops with P points in total changes P * n times (P * (n - 1)
+    + 1 times in a snake walk). exchanging two neighbouring loops shows that the total is minimal when the loops are
+    sorted by cost * n / (n - 1), largest outer-most (by cost alone for a snake walk). parameters without a cost hint
+    are free, and ties keep their declared order, so a config without hints keeps its order.
+    :param config: a Config object
+    :param snake: bool. plan a boustrophedon walk
+    :return: a SweepPlan
+    """
+    def key(param):
+        cost = param.cost or 0
+        n = len(param.value)
+        if snake or n <= 1:  # a parameter with a single value is set once wherever it is
+            return cost
+        return cost * n / (n - 1)
+
+    variables = config.get_iterables()
+    order = sorted(variables, key=key, reverse=True)  # sorted is stable
+    return SweepPlan([param.name for param in order], snake)
+
+
+def get_plan(plan, config):
+    """
+    resolves the plan argument of Experiment.sweep.
+    :param plan: None, 'auto' (plan_loop_order), 'snake' (plan_loop_order with snake=True) or a SweepPlan
+    :return: a SweepPlan, or None if the sweep should just run in the declared order
+    """
+    if plan is None:
+        return None
+    if plan == 'auto':
+        plan = plan_loop_order(config)
+    elif plan == 'snake':
+        plan = plan_loop_order(config, snake=True)
+    elif not isinstance(plan, SweepPlan):
+        raise ValueError(f"plan must be None, 'auto', 'snake' or a SweepPlan, got {plan!r}")
+    if sorted(plan.order) != sorted(param.name for param in config.get_iterables()):
+        raise ValueError(f"the plan order {plan.order} is not an order of the iterated parameters of the config")
+    return None if plan.is_declared_order(config) else plan
+
+
+def iter_planned_traces(experiment, config, plan, output_config, executor=None, chunksize=1, cache=None, batch=True,
+                        profiler=None):
+    """
+    runs the grid of config in the order of plan, and yields the traces of the declared grid (along the last declared
+    iterated parameter) in declared order, each as soon as all its points are done.
+    the points are kept in a grid-sized buffer until their trace is yielded, so the whole sweep has to fit in memory.
+    :param experiment: the Experiment object
+    :param config: the Config of the sweep
+    :param plan: a SweepPlan
+    :param output_config: the output Config of one point (allocates the buffer)
+    :param executor, chunksize, cache, batch, profiler: see Experiment.one_dimensional_sweep
+    :return: a generator of (flat outer index, outer indices, labber trace), as in the declared-order loop of
+             Experiment.sweep
+    """
+    variables = config.get_iterables()
+    names = [param.name for param in variables]
+    shape = tuple(len(param.value) for param in variables)
+    axes = [names.index(name) for name in plan.order]  # the declared axis of each loop, outer-most first
+    outer_params = [variables[axis] for axis in axes[:-1]]
+    outer_values = [list(param.value) for param in outer_params]
+    tracing_parameter = variables[axes[-1]]
+    trace_values = list(tracing_parameter.value)
+
+    grid = ResultBuffer(shape)
+    grid.allocate(output_config)
+    outer_shape = shape[:-1]
+    n_done = np.zeros(outer_shape, dtype=int)  # points done per declared trace
+    n_outer = int(np.prod(outer_shape))
+    next_flat = 0
+
+    loop_shape = tuple(shape[axis] for axis in axes[:-1])
+    loop_indices = snake_product(loop_shape) if plan.snake else itertools.product(*map(range, loop_shape))
+    for position, indices in enumerate(loop_indices):
+        trace_indices = np.arange(shape[axes[-1]])
+        if plan.snake and position % 2:
+            trace_indices = trace_indices[::-1]
+        values = {param.name: param_values[i] for param, param_values, i in zip(outer_params, outer_values, indices)}
+        values[tracing_parameter.name] = [trace_values[i] for i in trace_indices]
+        result = experiment.one_dimensional_sweep(config.view(values), save_to_labber=False, executor=executor,
+                                                  chunksize=chunksize, cache=cache, batch=batch,
+                                                  profiler=profiler)["result_buffer"]
+
+        # the declared grid indices of the points of the trace
+        grid_index = [None] * len(shape)
+        for axis, i in zip(axes, indices):
+            grid_index[axis] = np.full(len(trace_indices), i)
+        grid_index[axes[-1]] = trace_indices
+        grid.set_values(tuple(grid_index), result.columns)
+        np.add.at(n_done, tuple(grid_index[:-1]), 1)
+
+        while next_flat < n_outer and n_done.flat[next_flat] == shape[-1]:
+            outer_indices = tuple(int(i) for i in np.unravel_index(next_flat, outer_shape))
+            yield next_flat, outer_indices, grid.get_labber_trace(outer_indices)
+            next_flat += 1
@@ -0,0 +1,257 @@
+"""
+low-overhead instrumentation of sweeps: per-phase timers and counters, histograms of the per-point latency, and
+optional cProfile / tracemalloc capture around the whole sweep.
+
+pass a SweepProfiler to Experiment.sweep(..., profiler=profiler); after the sweep, profiler.report holds a
+ProfileReport. the timers cost about a microsecond per measurement, so the profiler can be left on (cProfile and
+tracemalloc slow the sweep down much more and are off by default).
+"""
+
+import math
+import threading
+import time
+
+
+class PhaseStats:
+    """
+    count, total, min and max of the durations of one phase, a sparse histogram with BINS_PER_DECADE log-spaced bins
+    per decade (from 10 ** MIN_EXPONENT seconds), and the threads that timed it
+    """
+
+    BINS_PER_DECADE = 4
+    MIN_EXPONENT = -7
+
+    __slots__ = ('count', 'total', 'min', 'max', 'histogram', 'threads')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.histogram = {}  # bin -> count
+        self.threads = set()  # idents of the threads that timed the phase
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        lowest = self.MIN_EXPONENT * self.BINS_PER_DECADE
+        b = max(lowest, math.floor(math.log10(seconds) * self.BINS_PER_DECADE)) if seconds > 0 else lowest
+        self.histogram[b] = self.histogram.get(b, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def is_concurrent(self):
+        """
+        whether the phase was timed in several threads (e.g. the workers of a pipelined sweep), so its occurrences
+        may overlap and its total can be longer than the wall time
+        """
+        return len(self.threads) > 1
+
+    def get_busy_fraction(self, wall_time):
+        """
+        :return: the fraction of wall_time spent in the phase. for a concurrent phase, the mean over its threads (the
+                 busy time of one worker)
+        """
+        if not wall_time:
+            return 0.0
+        return self.total / max(1, len(self.threads)) / wall_time
+
+    def get_histogram(self):
+        """
+        :return: a list of (lower edge, upper edge, count) in seconds, for the non-empty bins
+        """
+        return [(10 ** (b / self.BINS_PER_DECADE), 10 ** ((b + 1) / self.BINS_PER_DECADE), count)
+                for b, count in sorted(self.histogram.items())]
+
+    def get_percentile(self, q):
+        """
+        :param q: float in [0, 100]
+        :return: an upper bound of the q'th percentile of the durations (the upper edge of its histogram bin)
+        """
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for lower, upper, count in self.get_histogram():
+            seen += count
+            if seen >= target:
+                return min(upper, self.max)
+        return self.max
+
+    def to_dict(self):
+        return dict(count=self.count, total=self.total, mean=self.mean, min=self.min if self.count else 0.0,
+                    max=self.max, p50=self.get_percentile(50), p99=self.get_percentile(99),
+                    histogram=self.get_histogram(), threads=len(self.threads))
+
+
+class _PhaseTimer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+
+
+class ProfileReport:
+    """
+    the result of a profiled sweep.
+    wall_time - seconds from start to stop. phases - {phase name: PhaseStats}. counters - {name: int}.
+    the '%' column of str(report) is the fraction of the wall time spent in each phase. nested phases (e.g. 'point'
+    within 'trace') are counted in both. a phase timed in several threads is marked with '*', and its '%' is the busy
+    time of one of its threads, so that overlapping occurrences don't add up to more than 100%.
+    cprofile - text of the top functions by cumulative time (None if cProfile was off).
+    memory_peak - the peak of the memory traced by tracemalloc in bytes, memory_top - the top allocation sites
+    (None if tracemalloc was off).
+    """
+
+    def __init__(self, wall_time, phases, counters, cprofile=None, memory_peak=None, memory_top=None):
+        self.wall_time = wall_time
+        self.phases = phases
+        self.counters = counters
+        self.cprofile = cprofile
+        self.memory_peak = memory_peak
+        self.memory_top = memory_top
+
+    def to_dict(self):
+        """
+        :return: a json-serializable dict of the report
+        """
+        return dict(wall_time=self.wall_time,
+                    phases={name: stats.to_dict() for name, stats in self.phases.items()},
+                    counters=dict(self.counters),
+                    cprofile=self.cprofile, memory_peak=self.memory_peak, memory_top=self.memory_top)
+
+    def __str__(self):
+        lines = [f'sweep profile: wall time {self.wall_time:.3f} s']
+        lines.append(f"{'phase':<16}{'count':>10}{'total [s]':>12}{'%':>7}{'mean [ms]':>12}{'p99 [ms]':>12}")
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            percent = 100 * stats.get_busy_fraction(self.wall_time)
+            label = f'{name}*' if stats.is_concurrent else name
+            lines.append(f'{label:<16}{stats.count:>10}{stats.total:>12.4f}{percent:>7.1f}{1e3 * stats.mean:>12.4f}'
+                         f'{1e3 * stats.get_percentile(99):>12.4f}')
+        concurrent = [f'{name} ({len(stats.threads)} threads)' for name, stats in self.phases.items()
+                      if stats.is_concurrent]
+        if concurrent:
+            lines.append(f"* timed concurrently: {', '.join(concurrent)}. '%' is the busy time per thread")
+        if self.counters:
+            lines.append('counters: ' + ', '.join(f'{name}={value}' for name, value in self.counters.items()))
+        if self.memory_peak is not None:
+            lines.append(f'traced memory peak: {self.memory_peak / 2 ** 20:.2f} MB')
+            lines.extend(self.memory_top)
+        if self.cprofile:
+            lines.append(self.cprofile)
+        return '\n'.join(lines)
+
+
+class SweepProfiler:
+    """
+    collects the timers and counters of a sweep. thread safe (the pipeline of AsyncExperiment.sweep collects results
+    in worker threads). cProfile only profiles the thread that runs the sweep.
+
+    phase names used by the sweeps: 'test_run', 'open', 'trace' (one outer-loop entry), 'point' (one point, as seen
+    by the sweep - the run time for a serial sweep, the wait for a pool), 'config_view', 'run_batch',
+    'labber_trace', 'print' (verbose sweeps), 'write', 'checkpoint', 'close', and for AsyncExperiment 'submit' and
+    'wait'.
+    """
+
+    def __init__(self, cprofile=False, tracemalloc=False, add_to_labber_comment=False, top=20):
+        """
+        :param cprofile: bool. run cProfile around the sweep
+        :param tracemalloc: bool. trace the memory allocations during the sweep
+        :param add_to_labber_comment: bool. append the report to the comment of the labber log (after the metadata
+                                      table)
+        :param top: int. number of functions / allocation sites in the cProfile / tracemalloc parts of the report
+        """
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.add_to_labber_comment = add_to_labber_comment
+        self.top = top
+
+        self.phases = {}
+        self.counters = {}
+        self.report = None
+        self._lock = threading.Lock()
+        self._start = None
+        self._profile = None
+        self._started_tracemalloc = False
+
+    def phase(self, name):
+        """
+        :return: a context manager that times its block as one occurrence of the phase
+        """
+        return _PhaseTimer(self, name)
+
+    def add_time(self, name, seconds):
+        thread = threading.get_ident()
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats()
+            stats.add(seconds)
+            stats.threads.add(thread)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def start(self):
+        """
+        starts the capture. the timers and counters of an earlier sweep are cleared, so a profiler can be reused
+        """
+        with self._lock:
+            self.phases = {}
+            self.counters = {}
+        self.report = None
+        self._start = time.perf_counter()
+        if self.tracemalloc:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+        if self.cprofile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        """
+        stops the capture and builds self.report
+        :return: the ProfileReport
+        """
+        wall_time = time.perf_counter() - self._start
+        cprofile_text = None
+        if self._profile is not None:
+            import io
+            import pstats
+            self._profile.disable()
+            stream = io.StringIO()
+            pstats.Stats(self._profile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+            cprofile_text = stream.getvalue()
+            self._profile = None
+        memory_peak = memory_top = None
+        if self.tracemalloc:
+            import tracemalloc
+            memory_peak = tracemalloc.get_traced_memory()[1]
+            memory_top = [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:self.top]]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        with self._lock:
+            self.report = ProfileReport(wall_time, dict(self.phases), dict(self.counters), cprofile_text,
+                                        memory_peak, memory_top)
+        return self.report
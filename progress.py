@@ -0,0 +1,138 @@
+"""
+rate-limited progress reporting for sweeps: completed/total, throughput and ETA, to a terminal line, a logger or
+callbacks.
+"""
+
+import sys
+import time
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes:02d}:{seconds:02d}'
+
+
+class ProgressState:
+    """
+    a snapshot of the progress of a sweep. rate is in units per second (of the units done since the reporter started),
+    eta in seconds (None while unknown).
+    """
+
+    def __init__(self, completed, total, elapsed, unit='points'):
+        self.completed = completed
+        self.total = total
+        self.elapsed = elapsed
+        self.unit = unit
+        self.rate = None
+        self.eta = None
+
+    @property
+    def fraction(self):
+        return self.completed / self.total if self.total else None
+
+    def __str__(self):
+        text = f'{self.completed}/{self.total if self.total is not None else "?"} {self.unit}'
+        if self.total:
+            text += f' ({100 * self.fraction:.1f}%)'
+        if self.rate is not None:
+            text += f', {self.rate:.4g} {self.unit}/s'
+        text += f', elapsed {format_duration(self.elapsed)}, ETA {format_duration(self.eta)}'
+        return text
+
+
+class ProgressReporter:
+    """
+    counts the completed units (e.g. points) of a sweep and reports the progress at most max_rate times per second,
+    and once more when the sweep finishes. reports go to every callback, to a logger (if given) and to a stream (by
+    default sys.stderr; on a terminal the line is refreshed in place).
+    update() costs a counter increment and a clock read when no report is due, so it can be called per point.
+    """
+
+    def __init__(self, max_rate=2.0, callbacks=(), logger=None, stream=sys.stderr, unit='points'):
+        """
+        :param max_rate: float. max number of reports per second
+        :param callbacks: a callable or a list of callables(ProgressState)
+        :param logger: logging.Logger, optional. reports are logged with logger.info
+        :param stream: file-like, optional. None - don't write the progress line
+        :param unit: str. the name of the counted units
+        """
+        self.min_interval = 1 / max_rate if max_rate else 0.0
+        self.callbacks = [callbacks] if callable(callbacks) else list(callbacks)
+        self.logger = logger
+        self.stream = stream
+        self.unit = unit
+
+        self.total = None
+        self.completed = 0
+        self._initial = 0
+        self._start = None
+        self._last_report = None
+
+    def start(self, total=None, initial=0):
+        """
+        :param total: int, optional. the number of units of the whole sweep
+        :param initial: int. units completed before (e.g. when resuming a sweep); they are not part of the rate
+        """
+        self.total = total
+        self.completed = self._initial = initial
+        self._start = time.perf_counter()
+        self._last_report = -float('inf')
+
+    def get_state(self):
+        elapsed = time.perf_counter() - self._start
+        state = ProgressState(self.completed, self.total, elapsed, self.unit)
+        done = self.completed - self._initial
+        if done and elapsed > 0:
+            state.rate = done / elapsed
+            if self.total is not None:
+                state.eta = (self.total - self.completed) / state.rate
+        return state
+
+    def update(self, n=1):
+        self.completed += n
+        now = time.perf_counter()
+        if now - self._last_report >= self.min_interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final=False):
+        state = self.get_state()
+        for callback in self.callbacks:
+            callback(state)
+        if self.logger is not None:
+            self.logger.info(str(state))
+        if self.stream is not None:
+            if self.stream.isatty():
+                self.stream.write('\r' + str(state) + ('\n' if final else ''))
+            else:
+                self.stream.write(str(state) + '\n')
+            self.stream.flush()
+        return state
+
+    def finish(self):
+        """
+        the final report
+        """
+        return self.report(final=True)
+
+
+def get_progress_reporter(progress):
+    """
+    resolves the progress argument of the sweeps.
+    :param progress: None/False - no reporting, True - a default ProgressReporter, a callable(ProgressState) - a
+                     ProgressReporter that calls it (and writes nothing), or a ProgressReporter
+    :return: a ProgressReporter or None
+    """
+    if progress is None or progress is False:
+        return None
+    if progress is True:
+        return ProgressReporter()
+    if isinstance(progress, ProgressReporter):
+        return progress
+    if callable(progress):
+        return ProgressReporter(callbacks=[progress], stream=None)
+    raise ValueError(f"progress must be a bool, a callable or a ProgressReporter, got {progress!r}")
@@ -1,11 +1,9 @@
 import numpy as np
-import importlib
 from qiskit import QuantumCircuit
+from qiskit.circuit import Parameter as CircuitParameter
 
 from dataclasses import dataclass
-import experiment_manager
 from qiskit import Aer
-importlib.reload(experiment_manager)
 from experiment_manager import *
 import os
 import sys
@@ -26,16 +24,35 @@ class T1Experiment(QiskitExperimentDensityMat):
         circ.x(0)
         circ.delay(duration = config.delay.value, unit = config.delay.units)
         circ.save_density_matrix()
-        noise = Noise(config.T1.value, 2*config.T1.value)
+        noise = Noise(config.T1.value, config.T2.value)
         trans_circ = au.get_transpiled(circ, config.backend.value, noise)
 
         return trans_circ
 
+    def get_parameterized_circ(self, config:Config):
+        # the same circuit with a symbolic delay - transpiled once per T1 value and bound for every delay
+        delay = CircuitParameter('delay')
+        circ = QuantumCircuit(1)
+        circ.x(0)
+        circ.delay(duration = delay, unit = config.delay.units)
+        circ.save_density_matrix()
+        noise = Noise(config.T1.value, config.T2.value)
+        trans_circ = au.get_transpiled(circ, config.backend.value, noise)
+
+        return trans_circ, {'delay': delay}
+
     def get_observables(self, config:Config, density_matrix):
         populations = density_matrix.probabilities() # an array
         output_config = Config(Parameter('populations', populations), Parameter('param', 1.0))
         return output_config
 
+    def get_observables_batch(self, config:Config, density_matrices):
+        # the whole trace at once: density_matrices has shape (n_delays, 2, 2)
+        populations = get_populations(density_matrices)
+        output_config = Config(Parameter('populations', populations),
+                               Parameter('param', np.ones(len(density_matrices))))
+        return output_config
+
 
 
 
@@ -51,11 +68,14 @@ config = Config(Parameter('noise', [Noise(t1,2*t1) for t1 in np.linspace(0.001,1
                 '''
 
 
-config = Config(Parameter('T1',  np.linspace(0.0001e-6,100e-6, 30), 's'),
+T1_values = np.linspace(0.0001e-6,100e-6, 30)
+config = Config(Parameter('T1',  T1_values, 's', axis='T1'),
+                Parameter('T2', 2*T1_values, 's', axis='T1'),  # zipped with T1 - T2 = 2*T1 at every point
                 Parameter('delay', np.linspace(10e-6,300e-6,30), 's'),
                 Parameter('backend', Aer.get_backend('aer_simulator')))
 
 exp = T1Experiment()
+exp.circuits_per_job = 300  # 10 traces per job
 #a = Child()
 
 #a.one_d()
@@ -64,8 +84,6 @@ exp = T1Experiment()
 
 #job = exp.one_dimensional_job(config)
 
-exp.sweep(config)
-
-#res = exp.wait_result(job)
+exp.sweep(config)  # submits the traces and writes them to labber as the jobs finish
 
-exp.labber_read(config)
\ No newline at end of file
+#res = exp.wait_result(job)
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+columnar storage for the output Configs of a sweep.
+"""
+
+import numpy as np
+
+
+def get_column_dtype(value):
+    """
+    the dtype used to store a column whose first value is value. numbers are widened to float64/complex128, so that an
+    integer first result (e.g. 0 in a test run) does not truncate the following ones.
+    """
+    kind = np.asarray(value).dtype.kind
+    if kind in 'biuf':
+        return np.dtype(np.float64)
+    if kind == 'c':
+        return np.dtype(np.complex128)
+    return np.dtype(object)
+
+
+def get_missing_value(dtype):
+    """
+    the value of the points that were not run (masked out of the sweep grid): NaN in numeric columns, None otherwise
+    """
+    return np.nan if dtype.kind in 'fc' else None
+
+
+def numpy_allocator(name, shape, dtype):
+    return np.empty(shape, dtype=dtype)
+
+
+class ResultBuffer:
+    """
+    a preallocated, columnar replacement for a list of output Config objects.
+
+    the columns are created from the labber log list of the first result that is stored: a scalar output
+    (vector=False) becomes an array of the buffer's shape, and a vector output becomes an array of shape
+    buffer shape + vector shape. every following result is written in place at its grid index, so the Config objects
+    returned by run() can be discarded right away, and the labber trace of a row is a view into the columns.
+    """
+
+    def __init__(self, shape, allocator=None):
+        """
+        :param shape: int or tuple. the shape of the grid (for a single trace - the number of points)
+        :param allocator: callable(name, shape, dtype) -> array-like. creates the column arrays. by default plain
+                          numpy arrays in memory, but any object supporting numpy-style item assignment works
+        """
+        self.shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        self.allocator = allocator or numpy_allocator
+        self.log_list = None
+        self.columns = None
+
+    @property
+    def is_allocated(self):
+        return self.columns is not None
+
+    def allocate(self, output_config, batch_ndim=0):
+        """
+        creates the columns according to the labber log list of output_config.
+        :param output_config: an output Config of one point, or of a batch of points (see batch_ndim)
+        :param batch_ndim: int. if > 0, every value of output_config holds many points along its first batch_ndim
+                           axes (the output of Experiment.run_batch). an output is then a vector if it has more
+                           dimensions than that, regardless of is_iterated.
+        """
+        self.log_list = output_config.get_labber_log_list()
+        self.columns = {}
+        for log, param in zip(self.log_list, output_config.param_list):
+            point_shape = np.shape(param.value)[batch_ndim:]
+            if batch_ndim:
+                log["vector"] = len(point_shape) > 0
+            shape = self.shape
+            if log["vector"]:
+                shape = shape + point_shape
+            self.columns[param.name] = self.allocator(param.name, shape, get_column_dtype(param.value))
+
+    def set(self, index, output_config):
+        """
+        stores an output Config at index (an int or a tuple of grid indices).
+        """
+        if self.columns is None:
+            self.allocate(output_config)
+        for param in output_config.param_list:
+            self.columns[param.name][index] = param.value
+
+    def set_values(self, index, values: dict):
+        """
+        stores {name: value(s)} at index. index can be a slice, in which case each value holds a whole row.
+        """
+        for name, value in values.items():
+            self.columns[name][index] = value
+
+    def expand(self, mask, output_config=None):
+        """
+        scatters the points of a 1D buffer (the points of a masked trace or grid that were run) to the True entries of
+        mask, in a new buffer of mask's shape. the other points hold the missing value of their column (see
+        get_missing_value).
+        :param mask: bool array with as many True entries as self has points
+        :param output_config: an output Config of one point, to create the columns when self has none (no point was
+                              run)
+        :return: a new ResultBuffer
+        """
+        mask = np.asarray(mask, dtype=bool)
+        result = ResultBuffer(mask.shape)
+        if self.columns is None:
+            result.allocate(output_config)
+        else:
+            result.allocate_like(self)
+        result.fill_missing()
+        if self.columns is not None:
+            for name, column in result.columns.items():
+                column[mask] = self.columns[name]
+        return result
+
+    def fill_missing(self, index=()):
+        """
+        sets the points under index (e.g. the points of a trace that were not run) to the missing value of every column
+        """
+        for column in self.columns.values():
+            column[index] = get_missing_value(column.dtype)
+
+    def allocate_like(self, other):
+        """
+        creates the same columns as the allocated buffer other (names, dtypes and vector shapes)
+        """
+        self.log_list = other.log_list
+        self.columns = {name: self.allocator(name, self.shape + column.shape[len(other.shape):], column.dtype)
+                        for name, column in other.columns.items()}
+
+    def get_labber_trace(self, index=()):
+        """
+        :param index: the grid index of the trace (all but the last axis). by default the whole buffer, which is the
+                      trace of a 1D buffer.
+        :return: a dict that can be inputted to labber's addEntry method. the values are views, not copies.
+        """
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def get_configs(self, index=()):
+        """
+        rebuilds output Config objects for the points under index (for code that still wants a list of Configs).
+        :param index: tuple of ints fixing the leading grid axes. by default - all the points.
+        :return: a list of Config objects in grid order
+        """
+        from experiment_manager import Config, Parameter  # here to avoid a circular import
+        index = index if isinstance(index, tuple) else (index,)
+        grid_shape = self.shape[len(index):]
+        n_points = int(np.prod(grid_shape))
+        rows = {}
+        for name, column in self.columns.items():
+            row = np.asarray(column[index])
+            rows[name] = row.reshape((n_points,) + row.shape[len(grid_shape):])
+        return [Config(*[Parameter(log["name"], rows[log["name"]][i], units=log.get("unit"), is_iterated=log["vector"])
+                         for log in self.log_list])
+                for i in range(n_points)]
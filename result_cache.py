@@ -0,0 +1,212 @@
+"""
+opt-in memoization of Experiment.run, keyed by a content hash of the (scalar) Config.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class UnhashableConfigError(TypeError):
+    """
+    raised by config_hash when a parameter value has no stable content hash. such points are just not cached.
+    """
+    pass
+
+
+def _update_hash(h, value):
+    # feeds a type-tagged encoding of value into the hash object h
+    if isinstance(value, np.ndarray) or isinstance(value, np.generic):
+        value = np.asarray(value)
+        if value.dtype == object:
+            h.update(b'objarray')
+            h.update(repr(value.shape).encode())
+            for item in value.flat:
+                _update_hash(h, item)
+            return
+        h.update(b'ndarray')
+        h.update(value.dtype.str.encode())
+        h.update(repr(value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        h.update(type(value).__name__.encode())
+        h.update(repr(value).encode())
+    elif isinstance(value, (list, tuple)):
+        h.update(type(value).__name__.encode())
+        h.update(str(len(value)).encode())
+        for item in value:
+            _update_hash(h, item)
+    elif isinstance(value, dict):
+        h.update(b'dict')
+        h.update(str(len(value)).encode())
+        for key in sorted(value, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, value[key])
+    else:
+        # arbitrary objects (e.g. dataclasses) are hashed by their pickled content
+        try:
+            data = pickle.dumps(value, protocol=4)
+        except Exception:
+            raise UnhashableConfigError(f"can't hash a value of type {type(value).__name__}") from None
+        h.update(b'pickle')
+        h.update(data)
+
+
+def value_hash(value):
+    """
+    :return: str. a stable hex digest of a parameter value
+    :raise UnhashableConfigError: if the value can't be hashed
+    """
+    h = hashlib.sha256()
+    _update_hash(h, value)
+    return h.hexdigest()
+
+
+def parameter_hash(param):
+    """
+    :return: bytes. a digest of the name, units, is_iterated and value of a Parameter (and its axis name, if it is
+             zipped)
+    """
+    h = hashlib.sha256()
+    _update_hash(h, (param.name, param.units, bool(param.is_iterated)))
+    if param.is_iterated and param.axis is not None:
+        _update_hash(h, param.axis)
+    _update_hash(h, param.value)
+    return h.digest()
+
+
+def config_hash(config, memo=None):
+    """
+    a stable (across processes and sessions) content hash of a Config. numpy arrays are hashed by dtype, shape and data,
+    and the units of every parameter are part of the hash.
+    :param config: Config object
+    :param memo: dict, optional. {id(param): digest} cache for parameters shared between many configs (e.g. the
+                 constants of ConfigView objects of the same base). only valid while those parameters are alive.
+    :return: str. hex digest
+    :raise UnhashableConfigError: if some value can't be hashed
+    """
+    h = hashlib.sha256()
+    for param in config.param_list:
+        if memo is None:
+            h.update(parameter_hash(param))
+            continue
+        digest = memo.get(id(param))
+        if digest is None:
+            digest = memo[id(param)] = parameter_hash(param)
+        h.update(digest)
+    return h.hexdigest()
+
+
+def get_result_nbytes(output_config):
+    """
+    approximate memory size of an output Config
+    """
+    nbytes = sys.getsizeof(output_config)
+    for param in output_config.param_list:
+        value = param.value
+        nbytes += value.nbytes if isinstance(value, np.ndarray) else sys.getsizeof(value)
+    return nbytes
+
+
+class ResultCache:
+    """
+    a cache of output Configs of Experiment.run.
+
+    an in-memory LRU tier bounded by the number of results and their total size, and an optional on-disk tier (one
+    pickle file per result in a directory) that survives between sessions. results evicted from memory stay on disk.
+    pass the cache to Experiment.sweep/one_dimensional_sweep(..., cache=cache) so that points that were already
+    computed (same experiment class and same Config content) are not run again.
+    cached results are shared - they should not be modified.
+    """
+
+    def __init__(self, max_items=4096, max_bytes=256 * 2 ** 20, directory=None):
+        """
+        :param max_items: int. max number of results kept in memory
+        :param max_bytes: int. max approximate total size of the results kept in memory
+        :param directory: str, optional. directory of the on-disk tier. None - memory only
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self._memory = OrderedDict()  # key -> (output config, nbytes), least recently used first
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._memory)
+
+    @staticmethod
+    def get_key(experiment, config, memo=None):
+        """
+        :return: str. the cache key of running experiment on config
+        :raise UnhashableConfigError: if config can't be hashed
+        """
+        experiment_type = type(experiment)
+        return f'{experiment_type.__module__}.{experiment_type.__qualname__}-{config_hash(config, memo)}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + '.pkl')
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key][0]
+        if self.directory is not None:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    result = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self._put_memory(key, result)
+                with self._lock:
+                    self.hits += 1
+                return result
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, output_config):
+        self._put_memory(key, output_config)
+        if self.directory is not None:
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(output_config, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)  # atomic, so a crash never leaves a half-written entry
+
+    def _put_memory(self, key, output_config):
+        nbytes = get_result_nbytes(output_config)
+        with self._lock:
+            if key in self._memory:
+                self._nbytes -= self._memory.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return  # larger than the whole memory tier
+            self._memory[key] = (output_config, nbytes)
+            self._nbytes += nbytes
+            while len(self._memory) > self.max_items or self._nbytes > self.max_bytes:
+                self._nbytes -= self._memory.popitem(last=False)[1][1]
+
+    def clear(self, disk=False):
+        """
+        empties the memory tier, and also the disk tier if disk=True
+        """
+        with self._lock:
+            self._memory.clear()
+            self._nbytes = 0
+        if disk and self.directory is not None:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, file_name))
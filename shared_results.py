@@ -0,0 +1,153 @@
+"""
+zero-copy transport of array outputs from process-pool workers.
+
+with a process pool, every output Config is normally pickled in the worker and unpickled in the parent, so an array
+output (a vector, populations, ...) is copied twice before it reaches the trace buffer. instead, the trace buffer's
+vector columns are allocated as memory-mapped files in a SharedResultBlock (on tmpfs, /dev/shm, where available, so
+the data never touches the disk). every worker maps the block and writes its array outputs straight into their rows,
+and sends back only the rest of the output Config. the parent's ResultBuffer, labber trace and storages read the same
+memory.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from itertools import repeat
+
+import numpy as np
+
+from executors import _PointFailure, SweepPointError, run_points
+from result_buffer import ResultBuffer
+
+SHARED_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else None  # None - the default temporary directory
+
+
+_pending_removal = []  # directories of released blocks that could not be removed yet
+
+
+def _remove_directory(path):
+    shutil.rmtree(path, ignore_errors=True)
+    if os.path.exists(path):
+        # on Windows, a file can't be removed while it is mapped (by this process or a worker). try again later
+        _pending_removal.append(path)
+
+
+@atexit.register
+def _retry_removal():
+    """
+    removes the directories of released blocks whose files were still mapped when they were released
+    """
+    paths = list(_pending_removal)
+    _pending_removal.clear()
+    for path in paths:
+        _remove_directory(path)
+
+
+class SharedResultBlock:
+    """
+    a directory of memory-mapped column arrays. use block.allocate as the allocator of a ResultBuffer: vector
+    (multi-dimensional) numeric columns are memory-mapped and listed in block.layout, the other columns are plain
+    numpy arrays (scalars are cheap to pickle).
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: str, optional. where to create the block (default SHARED_DIRECTORY)
+        """
+        _retry_removal()  # the blocks of earlier traces, which are no longer mapped by now
+        self.path = tempfile.mkdtemp(prefix='sweep_results_', dir=directory or SHARED_DIRECTORY)
+        self.layout = {}  # column name -> (file path, shape, dtype str)
+        self._finalizer = weakref.finalize(self, _remove_directory, self.path)
+
+    def allocate(self, name, shape, dtype):
+        if len(shape) < 2 or dtype == object:
+            return np.empty(shape, dtype=dtype)
+        path = os.path.join(self.path, f'{len(self.layout)}.dat')
+        array = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        self.layout[name] = (path, shape, np.dtype(dtype).str)
+        return array
+
+    def release(self):
+        """
+        removes the files of the block. the arrays stay valid in this process: on POSIX systems the mapping outlives
+        the files. elsewhere the files can't be removed while they are mapped, so the removal is retried when the next
+        block is created (by then the arrays of this one were dropped) and at exit
+        """
+        self._finalizer()
+
+
+# the block mapped by this worker process: its directory, and {file path: memmap}. only the block of the current trace
+# is kept, so the files of earlier blocks are not held in memory (or, on Windows, on disk) by the workers
+_worker_block = dict(path=None, arrays={})
+
+
+def _get_shared_array(block_path, path, shape, dtype):
+    if _worker_block['path'] != block_path:
+        _worker_block['arrays'] = {}  # unmaps the block of the previous trace
+        _worker_block['path'] = block_path
+    arrays = _worker_block['arrays']
+    array = arrays.get(path)
+    if array is None:
+        array = arrays[path] = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+    return array
+
+
+def _run_point_shared(experiment, config, index, block_path, layout):
+    # module level so that it can be pickled to process-pool workers
+    try:
+        output_config = experiment.run(config)
+    except Exception as e:
+        return _PointFailure(e)
+
+    written = set()
+    for param in output_config.param_list:
+        if param.name in layout and isinstance(param.value, np.ndarray):
+            path, shape, dtype = layout[param.name]
+            if param.value.shape == tuple(shape[1:]):
+                _get_shared_array(block_path, path, shape, dtype)[index] = param.value
+                written.add(param.name)
+    if written:
+        from experiment_manager import Config  # here to avoid a circular import
+        output_config = Config(*[param for param in output_config.param_list if param.name not in written])
+    return output_config
+
+
+def run_points_shared(experiment, configs, executor, chunksize=1, profiler=None, directory=None):
+    """
+    runs experiment.run on every config on a process pool, with the array outputs written by the workers into a
+    SharedResultBlock.
+    the first point is run on its own (its output defines the columns), the others are mapped on the pool.
+    :param experiment, configs, executor, chunksize, profiler: see executors.run_points
+    :param directory: str, optional. see SharedResultBlock
+    :return: a ResultBuffer of len(configs) points, whose vector columns are memory-mapped
+    :raise SweepPointError: if run raised for some point
+    """
+    configs = list(configs)
+    block = SharedResultBlock(directory)
+    result = ResultBuffer(len(configs), allocator=block.allocate)
+    try:
+        if not configs:
+            return result
+        result.set(0, next(run_points(experiment, configs[:1], executor, profiler=profiler)))
+
+        outputs = executor.map(_run_point_shared, repeat(experiment), configs[1:], range(1, len(configs)),
+                               repeat(block.path), repeat(block.layout), chunksize=chunksize)
+        outputs = iter(outputs)
+        if profiler is not None:
+            profiler.count('points', len(configs) - 1)
+        for index in range(1, len(configs)):
+            if profiler is None:
+                output_config = next(outputs)
+            else:
+                start = time.perf_counter()
+                output_config = next(outputs)
+                profiler.add_time('point', time.perf_counter() - start)
+            if isinstance(output_config, _PointFailure):
+                raise SweepPointError(index, configs[index], output_config.traceback) from output_config.exception
+            result.set(index, output_config)
+    finally:
+        block.release()
+    return result
@@ -0,0 +1,476 @@
+"""
+storage backends for Experiment.sweep.
+
+a storage gets one labber-style trace (a dict {output name: values along the tracing parameter}) per outer-loop
+point, together with the outer grid index of that trace. the array based backends allocate one array per output with
+the shape of the whole sweep grid (outer axes..., tracing axis, vector axes...) and write every trace straight into its
+slot, so sweeps larger than the memory can be recorded and later sliced without loading everything.
+
+a grid axis can be zipped from several parameters (see Config.get_axes); the values of all of them are stored with the
+axes. the points that a masked sweep did not run hold NaN, and the mask is stored next to the data. a sweep that was
+stopped or pruned by its hooks (see sweep_hooks) is marked as a partial grid, with the mask of the points that were run.
+
+optional dependencies (h5py, zarr) are imported only when the corresponding backend is used.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from result_buffer import ResultBuffer, get_missing_value
+
+
+def get_grid_shape(config):
+    """
+    the shape of the sweep grid of config, in the order of its axes (the tracing axis is last).
+    """
+    return tuple(len(params[0].value) for params in config.get_axes())
+
+
+def get_axes(config):
+    """
+    :return: a list of dicts (name, units, values, dim) describing the iterated parameters, in the order of the grid
+             axes. dim is the index of the grid axis of the parameter (zipped parameters have the same dim)
+    """
+    return [dict(name=param.name, units=param.units, values=np.asarray(param.value), dim=dim)
+            for dim, params in enumerate(config.get_axes()) for param in params]
+
+
+def get_axis_names(config):
+    """
+    :return: a list with the name of every grid axis (of its first parameter, for a zipped axis)
+    """
+    return [params[0].name for params in config.get_axes()]
+
+
+class Storage:
+    """
+    base class for storage backends. child classes implement open, write_trace and close, and get_state if the
+    storage can be resumed from a checkpoint.
+    """
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        """
+        prepares the storage for a sweep.
+        :param config: the Config of the sweep. its iterated parameters define the grid.
+        :param output_config: the output Config of one point. defines the stored channels (names, units, shapes)
+        :param name: a default name for the log/file, e.g. '<ExperimentClass>_sweep'
+        :param state: the get_state() of the storage when the sweep was interrupted, when resuming from a checkpoint.
+                      the storage then reopens the existing data instead of creating new.
+        :param mask: bool array of the grid shape, optional. the points the sweep runs (the others are NaN)
+        """
+        raise NotImplementedError
+
+    def get_state(self):
+        """
+        :return: a json-serializable dict that points to the stored data (e.g. the file path), saved in checkpoints.
+                 None if the data can't be reopened.
+        """
+        return None
+
+    def write_trace(self, index, trace: dict):
+        """
+        stores one trace.
+        :param index: tuple. the indices of the outer (all but the last) grid axes of the trace
+        :param trace: dict {output name: values along the tracing parameter}, as returned by
+                      ResultBuffer.get_labber_trace
+        """
+        raise NotImplementedError
+
+    def mark_partial(self, mask, reason):
+        """
+        called before close when the hooks of the sweep stopped it or pruned / skipped points: the data is a partial
+        grid. the traces that were written stay as they are.
+        :param mask: bool array of the grid shape. the points that were run (the others are NaN or were not written)
+        :param reason: str. why the sweep is partial
+        """
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def get_partial_comment(mask, reason):
+    return f'partial grid ({reason}): {np.count_nonzero(mask)} of {mask.size} points were run, the others are NaN'
+
+
+class LabberStorage(Storage):
+    """
+    adapter that writes the sweep into a new labber log. traces must be written in grid order.
+    the first parameter of a zipped axis is its step channel; the other zipped parameters are logged as scalar
+    channels with their value at every point.
+    """
+
+    def __init__(self, log_name=None, background_writer=True):
+        """
+        :param log_name: str, optional. if not supplied, the name given to open() is used. automatic numbering is
+                         added to avoid overwrite.
+        :param background_writer: bool. write the entries from a BackgroundLogWriter thread
+        """
+        self.log_name = log_name
+        self.background_writer = background_writer
+        self.logfile = None
+        self.path = None
+        self._outer_shape = None
+        self._n_existing = 0  # entries already in the log when resuming
+        self._raw_logfile = None
+        self._comment = ''
+        self._extra_comments = []
+        self._zipped = []  # (grid axis, Parameter) of the zipped parameters that are not step channels
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        import Labber
+        from experiment_manager import get_labber_util
+        lu = get_labber_util()
+
+        self._outer_shape = get_grid_shape(config)[:-1]
+        self._zipped = [(dim, param) for dim, params in enumerate(config.get_axes()) for param in params[1:]]
+        if state is None:
+            log_name = lu.get_log_name(self.log_name or name)  # adds automatic numbering to avoid overwrite
+            log_list = output_config.get_labber_log_list()
+            for dim, param in self._zipped:
+                log_list.append(dict(name=param.name, unit=param.units, vector=False) if param.units
+                                else dict(name=param.name, vector=False))
+            logfile = Labber.createLogFile_ForData(log_name, log_list, config.get_labber_step_list())
+            # add comment w. metadata
+            self._comment = config.get_metadata_text()
+            if mask is not None:
+                self._comment += (f'\n\nmasked sweep: {mask.size - np.count_nonzero(mask)} of {mask.size} points were '
+                                  f'not run (NaN)')
+            logfile.setComment(self._comment)
+            self._n_existing = 0
+        else:
+            # append to the log of the interrupted sweep
+            logfile = Labber.LogFile(state['path'])
+            self._comment = logfile.getComment()
+            self._n_existing = logfile.getNumberOfEntries()
+        self.path = logfile.getFilePath(None)
+        self._raw_logfile = logfile
+
+        if self.background_writer:
+            from labber_writer import BackgroundLogWriter
+            self.logfile = BackgroundLogWriter(logfile)
+        else:
+            self.logfile = logfile
+
+    def get_state(self):
+        return dict(path=self.path)
+
+    def write_trace(self, index, trace: dict):
+        if self._outer_shape and np.ravel_multi_index(index, self._outer_shape) < self._n_existing:
+            return  # written before the sweep was interrupted (after the last checkpoint)
+        if self._zipped:
+            trace = dict(trace)
+            trace_length = len(next(iter(trace.values())))
+            for dim, param in self._zipped:
+                if dim == len(self._outer_shape):
+                    trace[param.name] = np.asarray(param.value)  # zipped with the traced parameter
+                else:
+                    trace[param.name] = np.full(trace_length, param.value[index[dim]])
+        if self.background_writer:
+            self.logfile.add_entry(trace)
+        else:
+            self.logfile.addEntry(trace)
+
+    def flush(self):
+        if self.background_writer:
+            self.logfile.flush()
+
+    def append_comment(self, text):
+        """
+        adds text (e.g. a profiling report) after the comment of the log. written when the storage is closed.
+        """
+        self._extra_comments.append(text)
+
+    def mark_partial(self, mask, reason):
+        # a stopped sweep has fewer entries than its step list (like an interrupted labber measurement)
+        self.append_comment(get_partial_comment(mask, reason))
+
+    def close(self):
+        if self.background_writer and self.logfile is not None:
+            self.logfile.close()  # writes whatever is still queued
+        if self._extra_comments and self._raw_logfile is not None:
+            self._raw_logfile.setComment('\n\n'.join([self._comment] + self._extra_comments))
+            self._extra_comments = []
+
+
+class ArrayStorage(Storage):
+    """
+    base class for the backends that keep one grid-shaped array per output. child classes implement create_array.
+    after open(), self.arrays is a dict {output name: array-like of shape grid shape + vector shape}, and self.mask
+    the mask of a masked sweep (None - all the points were run). after a partial sweep, self.partial is its reason and
+    self.mask the points that were run.
+    resumable backends also implement open_array, which reopens an existing array.
+    """
+
+    def __init__(self):
+        self.buffer = None
+        self.mask = None
+        self.partial = None
+
+    @property
+    def arrays(self):
+        return self.buffer.columns
+
+    def create_array(self, name, shape, dtype):
+        raise NotImplementedError
+
+    def open_array(self, name, shape, dtype):
+        raise NotImplementedError(f"{type(self).__name__} can't be resumed")
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        self.mask = mask
+        allocator = self.create_array if state is None else self.open_array
+        self.buffer = ResultBuffer(get_grid_shape(config), allocator=allocator)
+        self.buffer.allocate(output_config)
+
+    def write_trace(self, index, trace: dict):
+        self.buffer.set_values(tuple(index), trace)
+
+    def mark_partial(self, mask, reason):
+        self.mask = mask
+        self.partial = reason
+        # the traces that were not written (after a stop) hold whatever the array was created with
+        for index in np.ndindex(*mask.shape[:-1]):
+            if not mask[index].any():
+                self.buffer.fill_missing(index)
+
+
+class MemoryStorage(ArrayStorage):
+    """
+    keeps the whole sweep in numpy arrays in memory. the data is in self.arrays after the sweep.
+    when a sweep is resumed, the arrays of a new MemoryStorage hold only the points computed after resuming. the
+    traces that were not written (before resuming, or after an interruption) are NaN (None for non-numeric outputs).
+    """
+
+    def create_array(self, name, shape, dtype):
+        return np.full(shape, get_missing_value(dtype), dtype=dtype)
+
+    def open_array(self, name, shape, dtype):
+        return self.create_array(name, shape, dtype)
+
+    def get_state(self):
+        return {}
+
+
+class MemmapStorage(ArrayStorage):
+    """
+    one .npy file per output in a directory, written through np.memmap. metadata.json holds the grid axes, the log
+    list and the sweep metadata, and mask.npy the mask of a masked or partial sweep. load the result with
+    MemmapStorage.load(directory).
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+
+    def create_array(self, name, shape, dtype):
+        if dtype == object:
+            raise TypeError(f"output {name!r} is not numeric and can't be stored in a memory-mapped file")
+        return np.lib.format.open_memmap(os.path.join(self.directory, f'{name}.npy'), mode='w+', dtype=dtype,
+                                         shape=shape)
+
+    def open_array(self, name, shape, dtype):
+        array = np.lib.format.open_memmap(os.path.join(self.directory, f'{name}.npy'), mode='r+')
+        if array.shape != shape:
+            raise ValueError(f"stored array {name!r} has shape {array.shape}, expected {shape}")
+        return array
+
+    def get_state(self):
+        return dict(directory=self.directory)
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        if state is not None:
+            self.directory = state['directory']
+            super().open(config, output_config, name, state, mask)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        axes = get_axes(config)
+        for axis in axes:
+            np.save(os.path.join(self.directory, f"axis_{axis['name']}.npy"), axis['values'])
+        if mask is not None:
+            np.save(os.path.join(self.directory, 'mask.npy'), mask)
+        metadata = dict(name=name,
+                        axes=[dict(name=axis['name'], units=axis['units'], dim=axis['dim']) for axis in axes],
+                        log_list=output_config.get_labber_log_list(),
+                        comment=config.get_metadata_text(),
+                        masked=mask is not None)
+        with open(os.path.join(self.directory, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=1)
+        super().open(config, output_config, name, mask=mask)
+
+    def mark_partial(self, mask, reason):
+        super().mark_partial(mask, reason)
+        np.save(os.path.join(self.directory, 'mask.npy'), mask)
+        with open(os.path.join(self.directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+        metadata.update(masked=True, partial=reason)
+        with open(os.path.join(self.directory, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=1)
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+
+    def close(self):
+        if self.buffer is not None and self.buffer.is_allocated:
+            self.flush()
+
+    @staticmethod
+    def load(directory, mode='r'):
+        """
+        opens a stored sweep without reading it into memory.
+        :return: tuple (arrays, axes, metadata). arrays - dict {output name: np.memmap}, axes - dict {parameter name:
+                 values} (the grid axis of each parameter is its 'dim' in metadata['axes']). for a masked sweep,
+                 metadata['mask'] is the mask. for a partial sweep, metadata['partial'] is its reason
+        """
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+        arrays = {log['name']: np.load(os.path.join(directory, f"{log['name']}.npy"), mmap_mode=mode)
+                  for log in metadata['log_list']}
+        axes = {axis['name']: np.load(os.path.join(directory, f"axis_{axis['name']}.npy"))
+                for axis in metadata['axes']}
+        if metadata.get('masked'):
+            metadata['mask'] = np.load(os.path.join(directory, 'mask.npy'))
+        return arrays, axes, metadata
+
+
+class HDF5Storage(ArrayStorage):
+    """
+    chunked HDF5 file (requires h5py). every output is a dataset chunked by trace; the grid axes are in the 'axes'
+    group (a dataset per iterated parameter, its grid axis in the 'dim' attribute), the mask of a masked or partial
+    sweep is the 'mask' dataset, and the log list and sweep metadata (and the 'partial' reason) are file attributes.
+    """
+
+    def __init__(self, path, compression=None):
+        """
+        :param path: path of the .h5 file (overwritten)
+        :param compression: optional h5py compression filter, e.g. 'gzip'
+        """
+        super().__init__()
+        self.path = path
+        self.compression = compression
+        self.file = None
+
+    def create_array(self, name, shape, dtype):
+        if dtype == object:
+            raise TypeError(f"output {name!r} is not numeric and can't be stored in HDF5")
+        n_grid = len(self.buffer.shape)
+        chunks = (1,) * (n_grid - 1) + shape[n_grid - 1:]  # one chunk per trace
+        return self.file.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks, compression=self.compression)
+
+    def open_array(self, name, shape, dtype):
+        return self.file[name]
+
+    def get_state(self):
+        return dict(path=self.path)
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        import h5py
+        if state is not None:
+            self.path = state['path']
+            self.file = h5py.File(self.path, 'r+')
+            super().open(config, output_config, name, state, mask)
+            return
+        self.file = h5py.File(self.path, 'w')
+        axes_group = self.file.create_group('axes')
+        for axis in get_axes(config):
+            dataset = axes_group.create_dataset(axis['name'], data=axis['values'])
+            dataset.attrs['dim'] = axis['dim']
+            if axis['units']:
+                dataset.attrs['units'] = axis['units']
+        if mask is not None:
+            self.file.create_dataset('mask', data=mask)
+        self.file.attrs['name'] = name
+        self.file.attrs['axes'] = json.dumps(get_axis_names(config))
+        self.file.attrs['log_list'] = json.dumps(output_config.get_labber_log_list())
+        self.file.attrs['comment'] = config.get_metadata_text()
+        super().open(config, output_config, name, mask=mask)
+
+    def mark_partial(self, mask, reason):
+        super().mark_partial(mask, reason)
+        if 'mask' in self.file:
+            del self.file['mask']
+        self.file.create_dataset('mask', data=mask)
+        self.file.attrs['partial'] = reason
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    @staticmethod
+    def load(path):
+        """
+        opens a stored sweep for reading. the datasets are read lazily when sliced.
+        :return: an open h5py.File
+        """
+        import h5py
+        return h5py.File(path, 'r')
+
+
+class ZarrStorage(ArrayStorage):
+    """
+    a zarr directory store (requires zarr): one chunked array per output, chunked by trace, plus the grid axes (an
+    array per iterated parameter, its grid axis in the 'dim' attribute) and the mask of a masked or partial sweep.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.group = None
+
+    def create_array(self, name, shape, dtype):
+        if dtype == object:
+            raise TypeError(f"output {name!r} is not numeric and can't be stored in zarr")
+        n_grid = len(self.buffer.shape)
+        chunks = (1,) * (n_grid - 1) + shape[n_grid - 1:]  # one chunk per trace
+        return self.group.zeros(name=name, shape=shape, chunks=chunks, dtype=dtype)
+
+    def open_array(self, name, shape, dtype):
+        return self.group[name]
+
+    def get_state(self):
+        return dict(path=self.path)
+
+    def mark_partial(self, mask, reason):
+        super().mark_partial(mask, reason)
+        self.group.zeros(name='mask', shape=mask.shape, dtype=bool, overwrite=True)[...] = mask
+        self.group.attrs['partial'] = reason
+
+    def open(self, config, output_config, name, state=None, mask=None):
+        import zarr
+        if state is not None:
+            self.path = state['path']
+            self.group = zarr.open_group(self.path, mode='r+')
+            super().open(config, output_config, name, state, mask)
+            return
+        self.group = zarr.open_group(self.path, mode='w')
+        axes_group = self.group.create_group('axes')
+        for axis in get_axes(config):
+            values = axis['values']
+            array = axes_group.zeros(name=axis['name'], shape=values.shape, dtype=values.dtype)
+            array[...] = values
+            array.attrs['dim'] = axis['dim']
+        if mask is not None:
+            self.group.zeros(name='mask', shape=mask.shape, dtype=bool)[...] = mask
+        self.group.attrs['name'] = name
+        self.group.attrs['axes'] = get_axis_names(config)
+        self.group.attrs['log_list'] = output_config.get_labber_log_list()
+        self.group.attrs['comment'] = config.get_metadata_text()
+        super().open(config, output_config, name, mask=mask)
+
+    @staticmethod
+    def load(path):
+        """
+        opens a stored sweep for reading. the arrays are read lazily when sliced.
+        :return: a zarr Group
+        """
+        import zarr
+        return zarr.open_group(path, mode='r')
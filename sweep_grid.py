@@ -0,0 +1,190 @@
+"""
+SweepGrid - the points of an N-dimensional sweep grid with random access, slicing and sharding.
+"""
+
+import itertools
+
+import numpy as np
+
+
+class SweepGrid:
+    """
+    the cartesian product of the values of some axes (e.g. the iterated Parameters of a Config), in row-major order
+    (the last axis changes fastest, like itertools.product and the loops of Experiment.sweep).
+
+    points are addressed by their flat index in the full grid. a SweepGrid can also be a strided range of the flat
+    indices of a grid (see __getitem__ with a slice and shards), which keeps the shape of the full grid.
+    nothing is materialized: len(), index <-> point conversions and iteration are lazy. iterating the whole grid is
+    not faster than general_utils.enumerated_product (see __iter__).
+
+    grid[i] and iteration give (indices, values) tuples, like general_utils.enumerated_product.
+
+    an axis can be zipped from several parameters (see Config.get_axes): its name is then a tuple of their names, and
+    its values are tuples with a value of each parameter. get_dict expands them into the parameters.
+    """
+
+    def __init__(self, axes, names=None, flat_range=None):
+        """
+        :param axes: a list with the values of each axis (sequences; other iterables are converted to lists)
+        :param names: list of str, optional. the names of the axes
+        :param flat_range: range, optional. the flat indices of the grid that are in this SweepGrid (default - all)
+        """
+        self.axes = [values if hasattr(values, '__getitem__') and hasattr(values, '__len__') else list(values)
+                     for values in axes]
+        self.names = list(names) if names is not None else None
+        self.shape = tuple(len(values) for values in self.axes)
+
+        self.size = 1  # of the full grid
+        self._strides = []
+        for n in reversed(self.shape):
+            self._strides.append(self.size)
+            self.size *= n
+        self._strides.reverse()
+
+        self.flat_range = range(self.size) if flat_range is None else flat_range
+
+    @classmethod
+    def from_config(cls, config, outer=False):
+        """
+        the grid of the axes of a config (its iterated Parameters, with zipped parameters as one axis)
+        :param outer: bool. only the outer-loop axes of a sweep (all the axes but the last)
+        """
+        axes = config.get_axes()
+        if outer:
+            axes = axes[:-1]
+        values = [params[0].value if len(params) == 1 else list(zip(*[param.value for param in params]))
+                  for params in axes]
+        names = [params[0].name if len(params) == 1 else tuple(param.name for param in params) for params in axes]
+        return cls(values, names)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return len(self.flat_range)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(names={self.names!r}, shape={self.shape!r}, flat_range={self.flat_range!r})"
+
+    def _with_range(self, flat_range):
+        grid = object.__new__(type(self))
+        grid.__dict__.update(self.__dict__)
+        grid.flat_range = flat_range
+        return grid
+
+    def unravel(self, flat_index):
+        """
+        :param flat_index: int. index in the full grid
+        :return: tuple. the index along every axis
+        """
+        if not 0 <= flat_index < self.size:
+            raise IndexError(f"flat index {flat_index} out of range for a grid of size {self.size}")
+        indices = []
+        for stride in self._strides:
+            index, flat_index = divmod(flat_index, stride)
+            indices.append(index)
+        return tuple(indices)
+
+    def ravel(self, indices):
+        """
+        :param indices: the index along every axis
+        :return: int. the flat index in the full grid
+        """
+        flat_index = 0
+        for index, n, stride in zip(indices, self.shape, self._strides):
+            if not 0 <= index < n:
+                raise IndexError(f"index {tuple(indices)} out of range for a grid of shape {self.shape}")
+            flat_index += index * stride
+        return flat_index
+
+    def get_values(self, indices):
+        """
+        :return: tuple. the values of the axes at indices
+        """
+        return tuple(values[index] for values, index in zip(self.axes, indices))
+
+    def get_dict(self, indices):
+        """
+        :return: dict {parameter name: value} at indices, e.g. for Config.view
+        """
+        point = {}
+        for name, value in zip(self.names, self.get_values(indices)):
+            if isinstance(name, tuple):
+                point.update(zip(name, value))  # a zipped axis
+            else:
+                point[name] = value
+        return point
+
+    def get_mask(self, mask):
+        """
+        the points of the full grid that a sweep runs.
+        :param mask: a bool array of the grid shape (or broadcastable to it), or a callable(dict {parameter name:
+                     value}) -> bool that is called for every point of the grid (see get_dict)
+        :return: a bool array of the grid shape. True - the point is run
+        """
+        if callable(mask):
+            points = (bool(mask(self.get_dict(indices))) for indices in np.ndindex(*self.shape))
+            return np.fromiter(points, dtype=bool, count=self.size).reshape(self.shape)
+        return np.broadcast_to(np.asarray(mask, dtype=bool), self.shape).copy()
+
+    def __getitem__(self, item):
+        """
+        grid[i] - (indices, values) of the i'th point of this grid.
+        grid[start:stop:step] - a SweepGrid with these points
+        """
+        if isinstance(item, slice):
+            return self._with_range(self.flat_range[item])
+        indices = self.unravel(self.flat_range[item])
+        return indices, self.get_values(indices)
+
+    def shards(self, k, interleaved=False):
+        """
+        splits the grid into k SweepGrids whose lengths differ by at most 1.
+        :param interleaved: bool. False - contiguous blocks of points. True - shard i is grid[i::k], which spreads
+                            every shard over the whole grid
+        """
+        if interleaved:
+            return [self[i::k] for i in range(k)]
+        base, extra = divmod(len(self), k)
+        shards = []
+        start = 0
+        for i in range(k):
+            stop = start + base + (i < extra)
+            shards.append(self[start:stop])
+            start = stop
+        return shards
+
+    def _blocks(self):
+        """
+        splits a contiguous flat range into at most 2 * ndim blocks that are cartesian products: fixed indices of the
+        outer axes, a range of one axis, and the whole inner axes.
+        :return: generator of (outer indices, index range, axis)
+        """
+        start, stop = self.flat_range.start, self.flat_range.stop
+        while start < stop:
+            indices = self.unravel(start)
+            axis = max([axis for axis, index in enumerate(indices) if index], default=0)
+            while stop - start < self._strides[axis]:
+                axis += 1
+            n = min(self.shape[axis] - indices[axis], (stop - start) // self._strides[axis])
+            yield indices[:axis], range(indices[axis], indices[axis] + n), axis
+            start += n * self._strides[axis]
+
+    def _iter_block(self, outer_indices, index_range, axis):
+        index_ranges = [(index,) for index in outer_indices] + [index_range] + [range(n) for n in self.shape[axis + 1:]]
+        values = ([(axis_values[index],) for axis_values, index in zip(self.axes, outer_indices)]
+                  + [[self.axes[axis][index] for index in index_range]] + self.axes[axis + 1:])
+        return zip(itertools.product(*index_ranges), itertools.product(*values))
+
+    def __iter__(self):
+        """
+        a contiguous range (the whole grid, a slice with step 1, contiguous shards) is iterated with itertools.product,
+        at about the cost per point of general_utils.enumerated_product - not faster, SweepGrid is there for random
+        access, slicing and sharding. a strided range (e.g. interleaved shards) is converted point by point.
+        """
+        if self.ndim == 0:
+            return iter([((), ())] * len(self))
+        if self.flat_range.step != 1:
+            return (self[i] for i in range(len(self)))
+        return itertools.chain.from_iterable(self._iter_block(*block) for block in self._blocks())
@@ -0,0 +1,185 @@
+"""
+early stopping of sweeps: hooks that look at the partial results of Experiment.sweep and stop it, skip the rest of a
+trace or prune sub-grids that are not worth running.
+
+a hook is a SweepHook (or a plain function, called as on_trace). on_point is called after every point and on_trace
+after every trace is written; both get a SweepControl and decide through it. what was written stays consistent: a
+trace cut short by skip_trace is written with NaN in its remaining points, pruned traces are written as NaN without
+being run, and when the sweep stops the storages are marked as a partial grid (see Storage.mark_partial).
+"""
+
+import numpy as np
+
+
+class SweepControl:
+    """
+    the decisions of the hooks of one sweep, and the points that were actually run (run_mask).
+    """
+
+    def __init__(self, grid, grid_mask=None):
+        """
+        :param grid: the SweepGrid of the sweep
+        :param grid_mask: bool array of the grid shape, optional. the mask of a masked sweep
+        """
+        self.grid = grid
+        self.run_mask = np.ones(grid.shape, dtype=bool) if grid_mask is None else grid_mask.copy()
+        self.is_stopped = False
+        self.reasons = []
+        self._skip_trace = False
+        self._prune_conditions = []
+
+    @property
+    def is_partial(self):
+        """
+        whether the hooks changed the sweep (stopped it, skipped points or pruned traces)
+        """
+        return bool(self.reasons)
+
+    @property
+    def reason(self):
+        return '; '.join(self.reasons)
+
+    def stop(self, reason='stopped by a hook'):
+        """
+        stops the sweep after the current trace. from on_point, the rest of the current trace is not run either.
+        """
+        if not self.is_stopped:
+            self.is_stopped = True
+            self.reasons.append(reason)
+
+    def skip_trace(self, reason='trace cut short by a hook'):
+        """
+        (from on_point) the rest of the current trace is not run; its remaining points are NaN
+        """
+        self._skip_trace = True
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+    def prune(self, condition=None, reason='traces pruned by a hook', **values):
+        """
+        the traces that were not run yet and whose outer point matches are not run (they are written as NaN).
+        :param condition: callable(dict {parameter name: value} of the outer point of a trace) -> bool, optional
+        :param values: outer parameter values that a pruned trace must have, e.g. prune(T1=3e-6) prunes the traces
+                       of T1 = 3e-6 for all the values of the other outer parameters
+        """
+        if condition is None and not values:
+            raise ValueError("prune needs a condition or parameter values")
+        if values:
+            extra_condition = condition
+
+            def condition(point):
+                return (all(point.get(name) == value for name, value in values.items())
+                        and (extra_condition is None or extra_condition(point)))
+        self._prune_conditions.append(condition)
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+
+    def is_pruned(self, point):
+        """
+        :param point: dict {parameter name: value} of the outer point of a trace
+        """
+        return any(condition(point) for condition in self._prune_conditions)
+
+    def pop_skip_trace(self):
+        skip = self._skip_trace
+        self._skip_trace = False
+        return skip
+
+
+class SweepHook:
+    """
+    base class of sweep hooks. child classes implement on_point and / or on_trace, look at the partial results and
+    call control.stop(), control.skip_trace() or control.prune(...).
+    a hook that implements on_point makes the sweep run its points one by one (not through run_batch), so that a
+    trace can be cut short.
+    """
+
+    def on_point(self, control: SweepControl, point: dict, output_config):
+        """
+        called after every point of the sweep.
+        :param point: dict {parameter name: value} of the point
+        :param output_config: the output Config of the point
+        """
+        pass
+
+    def on_trace(self, control: SweepControl, indices, point: dict, labber_trace: dict):
+        """
+        called after every trace is written (in grid order).
+        :param indices: tuple. the outer grid indices of the trace
+        :param point: dict {parameter name: value} of the outer point of the trace
+        :param labber_trace: dict {output name: values along the traced axis}
+        """
+        pass
+
+    def has_on_point(self):
+        return type(self).on_point is not SweepHook.on_point
+
+    def has_on_trace(self):
+        return type(self).on_trace is not SweepHook.on_trace
+
+
+class FunctionHook(SweepHook):
+    """
+    a hook made of plain functions with the signatures of SweepHook.on_point / on_trace (without self)
+    """
+
+    def __init__(self, on_point=None, on_trace=None):
+        self._on_point = on_point
+        self._on_trace = on_trace
+        if on_point is not None:
+            self.on_point = on_point
+        if on_trace is not None:
+            self.on_trace = on_trace
+
+    def has_on_point(self):
+        return self._on_point is not None
+
+    def has_on_trace(self):
+        return self._on_trace is not None
+
+
+class ThresholdHook(SweepHook):
+    """
+    stops the sweep (or prunes a sub-grid) once the signal has decayed: when the peak of abs(channel) in patience
+    consecutive traces is below threshold.
+    """
+
+    def __init__(self, channel, threshold, patience=1, prune=None):
+        """
+        :param channel: str. the output to watch
+        :param threshold: float
+        :param patience: int. number of consecutive traces below threshold
+        :param prune: list of outer parameter names, optional. instead of stopping, prune the traces with the same
+                      values of these parameters as the last trace (e.g. ['T1'] - the rest of this T1 row)
+        """
+        self.channel = channel
+        self.threshold = threshold
+        self.patience = patience
+        self.prune = prune
+        self._n_below = 0
+
+    def on_trace(self, control, indices, point, labber_trace):
+        values = np.abs(np.asarray(labber_trace[self.channel], dtype=complex))
+        peak = np.nanmax(values) if np.isfinite(values).any() else np.nan
+        self._n_below = self._n_below + 1 if peak < self.threshold else 0
+        if self._n_below < self.patience:
+            return
+        self._n_below = 0
+        reason = f'{self.channel} below {self.threshold} for {self.patience} traces'
+        if self.prune is None:
+            control.stop(reason)
+        else:
+            control.prune(reason=reason, **{name: point[name] for name in self.prune})
+
+
+def get_hooks(hooks):
+    """
+    resolves the hooks argument of the sweep.
+    :param hooks: None, a SweepHook, a function (an on_trace hook), or a list of them
+    :return: a list of SweepHook objects
+    """
+    if hooks is None:
+        return []
+    if isinstance(hooks, SweepHook) or callable(hooks):
+        hooks = [hooks]
+    return [hook if isinstance(hook, SweepHook) else FunctionHook(on_trace=hook) for hook in hooks]
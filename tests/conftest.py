@@ -0,0 +1,36 @@
+"""
+the tests import the modules from the repository root, and use the in-memory Labber and Labber_util of
+benchmarks/fake_labber and the synthetic experiments of the benchmarks.
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_DIR, os.path.join(REPO_DIR, 'benchmarks'), os.path.join(REPO_DIR, 'benchmarks', 'fake_labber')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def labber_logs(monkeypatch):
+    """
+    :return: a list of the fake labber LogFile objects created during the test. Labber.LogFile(path) opens the
+             recorded log of path again (to resume a sweep)
+    """
+    import Labber
+    logs = []
+    log_file_class = Labber.LogFile
+
+    def create_and_record(name, log_list, step_list=None):
+        logfile = log_file_class(name, log_list, step_list)
+        logs.append(logfile)
+        return logfile
+
+    def reopen(path):
+        return next(logfile for logfile in logs if logfile.path == path)
+    monkeypatch.setattr(Labber, 'createLogFile_ForData', create_and_record)
+    monkeypatch.setattr(Labber, 'LogFile', reopen)
+    return logs
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import random
+import time
+
+import numpy as np
+import pytest
+
+from experiment_manager import AsyncIOExperiment, Config, Parameter
+from executors import SweepPointError
+from storage import MemoryStorage
+from synthetic import SimulatedInstrumentExperiment, make_config
+
+
+class RandomLatencyExperiment(AsyncIOExperiment):
+    """
+    points finish out of order; records the number of points using each resource at the same time
+    """
+
+    def __init__(self, fail_at=None):
+        super().__init__()
+        self.fail_at = fail_at
+        self.started = 0
+        self.in_use = {'awg': 0, 'digitizer': 0}
+        self.max_in_use = {'awg': 0, 'digitizer': 0}
+        self.random = random.Random(0)
+
+    async def use(self, resource, seconds):
+        async with self.locks(resource):
+            self.in_use[resource] += 1
+            self.max_in_use[resource] = max(self.max_in_use[resource], self.in_use[resource])
+            await asyncio.sleep(seconds)
+            self.in_use[resource] -= 1
+
+    async def prepare(self, config):
+        self.started += 1
+        await self.use('awg', 0.001)
+        return config.a.value * 10
+
+    async def measure(self, config, prepared):
+        await asyncio.sleep(self.random.uniform(0, 0.005))  # not locked - the points finish in any order
+        await self.use('digitizer', 0.001)
+        if config.t.value == self.fail_at:
+            raise ValueError('acquisition failed')
+        return Config(Parameter('y', prepared + config.t.value), Parameter('v', np.full(2, config.t.value)))
+
+
+def test_sweep_writes_in_grid_order(labber_logs):
+    config = Config(Parameter('a', np.arange(4.)), Parameter('t', np.arange(6.)))
+    experiment = RandomLatencyExperiment()
+    store = MemoryStorage()
+    experiment.sweep(config, storage=store, pipeline_depth=4, background_writer=False)
+
+    expected = np.arange(4.)[:, None] * 10 + np.arange(6.)
+    np.testing.assert_array_equal(store.arrays['y'], expected)
+    np.testing.assert_array_equal(store.arrays['v'][2, 3], [3., 3.])
+    np.testing.assert_array_equal([entry['y'] for entry in labber_logs[0].entries], expected)
+    assert experiment.max_in_use == {'awg': 1, 'digitizer': 1}
+
+
+def test_failed_point_cancels_the_rest(caplog):
+    config = Config(Parameter('a', 1.), Parameter('t', np.arange(50.)))
+    experiment = RandomLatencyExperiment(fail_at=3.)
+    with caplog.at_level(logging.ERROR, logger='asyncio'):
+        with pytest.raises(SweepPointError) as error:
+            experiment.sweep(config, save_to_labber=False, storage=MemoryStorage(), pipeline_depth=4)
+    assert error.value.index == 3
+    assert isinstance(error.value.__cause__, ValueError)
+    assert experiment.started < 10  # the points after the failure were not started
+    assert 'never retrieved' not in caplog.text
+
+
+def test_pipelining_overlaps_setup_and_measurement():
+    config = make_config((2, 10))
+
+    def sweep_time(depth):
+        start = time.perf_counter()
+        SimulatedInstrumentExperiment(setup_latency=0.005, measure_latency=0.005).sweep(
+            config, save_to_labber=False, storage=MemoryStorage(), pipeline_depth=depth)
+        return time.perf_counter() - start
+
+    serial, pipelined = sweep_time(1), sweep_time(2)
+    assert serial > 0.2  # 20 points of 10 ms
+    assert pipelined < 0.8 * serial
+
+
+def test_synchronous_sweeps_are_not_supported():
+    with pytest.raises(TypeError, match='coroutine'):
+        SimulatedInstrumentExperiment().one_dimensional_sweep(make_config((3,)))
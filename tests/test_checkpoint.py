@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from Labber import LogFile
+
+from checkpoint import SweepCheckpoint
+from experiment_manager import Experiment, Config, Parameter
+from storage import MemmapStorage
+
+CONFIG = Config(Parameter('a', np.arange(6.)), Parameter('t', np.arange(3.)))
+EXPECTED = np.arange(6.)[:, None] * 10 + np.arange(3.)
+
+
+class CountingExperiment(Experiment):
+    """
+    records the points it runs, and raises KeyboardInterrupt at the first point with a == interrupt_at (once)
+    """
+
+    def __init__(self, interrupt_at=None):
+        self.interrupt_at = interrupt_at
+        self.points = []
+
+    def run(self, config):
+        if config.a.value == self.interrupt_at:
+            self.interrupt_at = None
+            raise KeyboardInterrupt
+        self.points.append((config.a.value, config.t.value))
+        return Config(Parameter('y', config.a.value * 10 + config.t.value))
+
+
+def assert_complete(log, directory):
+    assert len(log.entries) == 6
+    for i, entry in enumerate(log.entries):
+        np.testing.assert_array_equal(entry['y'], EXPECTED[i])
+    arrays, _, _ = MemmapStorage.load(str(directory))
+    np.testing.assert_array_equal(arrays['y'], EXPECTED)
+
+
+def test_resume_after_an_interrupt(labber_logs, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    directory = tmp_path / 'data'
+    experiment = CountingExperiment(interrupt_at=3)
+    with pytest.raises(KeyboardInterrupt):
+        experiment.sweep(CONFIG, storage=MemmapStorage(str(directory)), checkpoint=path)
+    assert SweepCheckpoint.load(path).completed == {0, 1, 2}
+
+    experiment.points = []
+    experiment.sweep(CONFIG, storage=MemmapStorage('elsewhere'), resume=path)  # the directory is in the checkpoint
+    assert experiment.points[1:] == [(a, t) for a in (3., 4., 5.) for t in range(3)]  # after the test run
+    log, = labber_logs
+    assert_complete(log, directory)
+    assert SweepCheckpoint.load(path).is_finished
+
+
+def test_resume_after_a_writer_failure(labber_logs, tmp_path, monkeypatch):
+    disk_full = True
+    add_entry = LogFile.addEntry
+
+    def add_entry_or_fail(self, entry):
+        if disk_full and len(self.entries) == 3:
+            raise OSError('disk full')
+        add_entry(self, entry)
+    monkeypatch.setattr(LogFile, 'addEntry', add_entry_or_fail)
+
+    path = str(tmp_path / 'checkpoint.json')
+    directory = tmp_path / 'data'
+    with pytest.raises(OSError, match='disk full'):
+        CountingExperiment().sweep(CONFIG, storage=MemmapStorage(str(directory)), checkpoint=path,
+                                   background_writer=True)
+    log, = labber_logs
+    assert len(log.entries) == 3
+    # the traces queued in the writer when it failed are not completed
+    assert SweepCheckpoint.load(path).completed <= {0, 1, 2}
+
+    disk_full = False
+    CountingExperiment().sweep(CONFIG, storage=MemmapStorage(str(directory)), resume=path)
+    assert_complete(log, directory)
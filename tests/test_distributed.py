@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+import pytest
+
+from distributed import Coordinator, start_local_workers
+from experiment_manager import Experiment, Config, Parameter
+from storage import MemoryStorage
+
+
+class SlowExperiment(Experiment):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def run(self, config):
+        time.sleep(self.delay)
+        return Config(Parameter('y', config.a.value * 10 + config.b.value + config.t.value / 10))
+
+
+def expected(config):
+    a, b, t = (np.asarray(getattr(config, name).value) for name in ('a', 'b', 't'))
+    return a[:, None, None] * 10 + b[None, :, None] + t[None, None, :] / 10
+
+
+CONFIG = Config(Parameter('a', np.arange(3.)), Parameter('b', np.arange(4.)), Parameter('t', np.arange(5.)))
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+        process.join(5)
+
+
+def test_distributed_sweep_writes_in_grid_order(labber_logs):
+    with Coordinator(shard_size=2, heartbeat_timeout=5.0, worker_timeout=30) as coordinator:
+        processes = start_local_workers(coordinator.address, 2, heartbeat_interval=0.2)
+        try:
+            store = MemoryStorage()
+            SlowExperiment().sweep(CONFIG, storage=store, distributed=coordinator)
+        finally:
+            stop(processes)
+    np.testing.assert_allclose(store.arrays['y'], expected(CONFIG))
+    entries = labber_logs[0].entries
+    assert len(entries) == 12
+    np.testing.assert_allclose([entry['y'][0] for entry in entries], expected(CONFIG)[..., 0].ravel())
+
+
+def test_shards_of_a_killed_worker_are_dispatched_again():
+    with Coordinator(shard_size=1, max_shards_per_worker=2, heartbeat_timeout=2.0, worker_timeout=30) as coordinator:
+        first = start_local_workers(coordinator.address, 1, heartbeat_interval=0.2)
+        processes = list(first)
+        try:
+            traces = coordinator.iter_traces(SlowExperiment(delay=0.02), CONFIG, batch=False)
+            received = [next(traces)]
+            # the first worker holds the next shards when it is killed; a new worker must get them
+            processes += start_local_workers(coordinator.address, 1, heartbeat_interval=0.2)
+            first[0].kill()
+            received += list(traces)
+            assert len(coordinator.workers) == 1  # the killed worker was lost
+        finally:
+            stop(processes)
+    assert [index for index, _, _ in received] == list(range(12))
+    values = expected(CONFIG)
+    for index, indices, trace in received:
+        np.testing.assert_allclose(trace['y'], values[indices])
+
+
+def test_coordinator_needs_an_authkey_on_a_public_address():
+    with pytest.raises(ValueError, match='authkey'):
+        Coordinator(('0.0.0.0', 0))
@@ -0,0 +1,65 @@
+import numpy as np
+
+from experiment_manager import Experiment, Config, Parameter
+
+
+class RecordingExperiment(Experiment):
+    """
+    y = a * 10 + t + offset. records the points it runs
+    """
+
+    def __init__(self):
+        self.points = []
+
+    def run(self, config):
+        self.points.append((config.a.value, config.t.value))
+        return Config(Parameter('y', config.a.value * 10 + config.t.value + config.offset.value))
+
+
+def make_config(a, t, offset=0.0):
+    return Config(Parameter('a', a), Parameter('t', t), Parameter('offset', offset))
+
+
+def expected(config):
+    a, t = np.asarray(config.a.value), np.asarray(config.t.value)
+    return a[:, None] * 10 + t[None, :] + config.offset.value
+
+
+def run(config, directory):
+    experiment = RecordingExperiment()
+    result = experiment.incremental_sweep(config, str(directory), save_to_labber=False)
+    arrays, _, _ = result.load()
+    np.testing.assert_allclose(arrays['y'], expected(config))
+    return result, experiment.points[1:]  # without the test run of the sweep
+
+
+def test_unchanged_rerun_reuses_every_point(tmp_path):
+    config = make_config(np.arange(3.), np.linspace(0, 1, 4))
+    first, points = run(config, tmp_path / 'data')
+    assert (first.n_points, first.n_reused, first.n_run) == (12, 0, 12)
+    assert len(points) == 12
+
+    again, points = run(config, tmp_path / 'data')
+    assert (again.n_reused, again.n_run) == (12, 0)
+    assert points == []
+
+
+def test_extended_grid_runs_only_the_new_points(tmp_path):
+    run(make_config(np.arange(3.), np.linspace(0, 1, 3)), tmp_path / 'data')
+
+    # a new value of a, and np.linspace with more points (0, 0.5 and 1 are kept)
+    config = make_config(np.arange(4.), np.linspace(0, 1, 5))
+    result, points = run(config, tmp_path / 'data')
+    assert (result.n_points, result.n_reused, result.n_run) == (20, 9, 11)
+    new_points = {(a, t) for a in range(4) for t in (0.25, 0.75)} | {(3, t) for t in (0, 0.5, 1)}
+    assert set(points) == new_points
+    assert len(points) == len(new_points)
+
+
+def test_changed_constant_reruns_every_point(tmp_path):
+    run(make_config(np.arange(3.), np.arange(4.)), tmp_path / 'data')
+
+    config = make_config(np.arange(3.), np.arange(4.), offset=0.5)
+    result, points = run(config, tmp_path / 'data')
+    assert (result.n_reused, result.n_run) == (0, 12)
+    assert len(points) == 12
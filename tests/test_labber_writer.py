@@ -0,0 +1,129 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from experiment_manager import Experiment, Config, Parameter
+from executors import SweepPointError
+from labber_writer import BackgroundLogWriter
+
+
+class RecordingLog:
+    """
+    a labber LogFile stand-in: addEntry waits for self.gate, and raises on entry number fail_at
+    """
+
+    def __init__(self, delay=0.0, fail_at=None):
+        self.entries = []
+        self.delay = delay
+        self.fail_at = fail_at
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def addEntry(self, entry):
+        self.gate.wait()
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_at is not None and len(self.entries) == self.fail_at:
+            raise OSError('disk full')
+        self.entries.append(entry)
+
+
+def make_trace(i, size=4):
+    return {'x': np.full(size, float(i))}
+
+
+def test_entries_are_written_in_order():
+    log = RecordingLog(delay=0.0005)
+    with BackgroundLogWriter(log, batch_size=3, max_pending=5) as writer:
+        for i in range(40):
+            writer.add_entry(make_trace(i))
+    assert [entry['x'][0] for entry in log.entries] == list(range(40))
+
+
+def test_add_entry_blocks_when_the_queue_is_full():
+    log = RecordingLog()
+    log.gate.clear()  # the writer can't write
+    writer = BackgroundLogWriter(log, batch_size=1, max_pending=2)
+    writer.add_entry(make_trace(0))  # taken by the writer thread, which blocks in addEntry
+    time.sleep(0.05)
+    writer.add_entry(make_trace(1))
+    writer.add_entry(make_trace(2))  # the queue is full now
+
+    blocked = threading.Thread(target=writer.add_entry, args=(make_trace(3),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    log.gate.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    writer.close()
+    assert [entry['x'][0] for entry in log.entries] == [0, 1, 2, 3]
+
+
+def test_add_entry_blocks_on_the_size_of_the_queue():
+    log = RecordingLog()
+    log.gate.clear()
+    writer = BackgroundLogWriter(log, batch_size=1, max_pending=100, max_pending_bytes=1000)
+    writer.add_entry(make_trace(0))
+    time.sleep(0.05)
+    writer.add_entry(make_trace(1, size=200))  # 1600 bytes - accepted because the queue is empty
+
+    blocked = threading.Thread(target=writer.add_entry, args=(make_trace(2),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    log.gate.set()
+    blocked.join(5)
+    writer.close()
+    assert len(log.entries) == 3
+
+
+def test_error_is_raised_by_the_next_call_and_not_again_by_close():
+    log = RecordingLog(fail_at=2)
+    writer = BackgroundLogWriter(log, batch_size=1)
+    for i in range(3):
+        writer.add_entry(make_trace(i))
+    with pytest.raises(OSError, match='disk full'):
+        writer.flush()
+    writer.close()  # already raised
+    assert len(log.entries) == 2
+
+
+def test_close_raises_an_error_that_was_not_raised_before():
+    log = RecordingLog(fail_at=0)
+    writer = BackgroundLogWriter(log)
+    writer.add_entry(make_trace(0))
+    with pytest.raises(OSError):
+        writer.close()
+    writer.close()  # closing twice does nothing
+
+
+class FailingExperiment(Experiment):
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+
+    def run(self, config):
+        if config.a.value == self.fail_at:
+            raise ValueError('instrument error')
+        return Config(Parameter('y', config.a.value * 10 + config.t.value))
+
+
+def test_sweep_writes_the_queued_traces_after_an_error(labber_logs):
+    config = Config(Parameter('a', np.arange(6.)), Parameter('t', np.arange(3.)))
+    with pytest.raises(ValueError, match='instrument error'):
+        FailingExperiment(fail_at=4).sweep(config, background_writer=True)
+
+    log, = labber_logs
+    assert len(log.entries) == 4  # the traces before the failure were all written when the storage was closed
+    for i, entry in enumerate(log.entries):
+        np.testing.assert_array_equal(entry['y'], i * 10 + np.arange(3.))
+
+
+def test_pooled_sweep_raises_sweep_point_error(labber_logs):
+    config = Config(Parameter('a', np.arange(6.)), Parameter('t', np.arange(3.)))
+    with pytest.raises(SweepPointError) as error:
+        FailingExperiment(fail_at=4).sweep(config, executor='thread', max_workers=2)
+    assert isinstance(error.value.__cause__, ValueError)